@@ -0,0 +1,165 @@
+import cv2
+import numpy as np
+from dataset_loader import iter_faces, list_images
+from gallery import Gallery
+
+FACE_SIZE = (100, 100)
+LBP_BINS = 59
+
+def _uniform_lbp_table():
+    """Map the 256 LBP codes to 58 uniform patterns plus one catch-all bin"""
+    table = np.full(256, LBP_BINS - 1, dtype=np.uint8)
+    next_bin = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        transitions = sum(bits[i] != bits[(i + 1) % 8] for i in range(8))
+        if transitions <= 2:
+            table[code] = next_bin
+            next_bin += 1
+    return table
+
+UNIFORM_LBP = _uniform_lbp_table()
+
+# Neighbour offsets (dy, dx), clockwise from the top-left pixel
+_NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+
+def lbp_features(faces, grid=(8, 8)):
+    """
+    Compute LBP histogram features for a batch of equally sized faces
+    Args:
+        faces: uint8 array of shape (n, height, width)
+        grid: (x, y) number of cells, as in LBPH
+    Returns:
+        float32 array of shape (n, grid_x * grid_y * 59). Each cell is a
+        uniform-LBP histogram; the vector is square-rooted and L2 normalized
+        so the dot product of two features is their Hellinger similarity.
+    """
+    n, height, width = faces.shape
+    center = faces[:, 1:-1, 1:-1]
+    codes = np.zeros(center.shape, dtype=np.uint8)
+    for bit, (dy, dx) in enumerate(_NEIGHBOURS):
+        neighbour = faces[:, 1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx]
+        codes |= (neighbour >= center).astype(np.uint8) << bit
+    codes = UNIFORM_LBP[codes]
+
+    gx, gy = grid
+    ch, cw = codes.shape[1] // gy, codes.shape[2] // gx
+    cells = codes[:, :gy * ch, :gx * cw].reshape(n, gy, ch, gx, cw)
+    cells = cells.transpose(0, 1, 3, 2, 4).reshape(n * gy * gx, ch * cw)
+
+    # One bincount for every cell of every face
+    offsets = (np.arange(n * gy * gx, dtype=np.int64) * LBP_BINS)[:, None]
+    hist = np.bincount((cells + offsets).ravel(),
+                       minlength=n * gy * gx * LBP_BINS)
+    hist = hist.reshape(n, gy * gx * LBP_BINS).astype(np.float32)
+    hist /= ch * cw
+    np.sqrt(hist, out=hist)
+    hist /= np.sqrt(gy * gx)
+    return hist
+
+class BatchRecognizer:
+    """
+    Recognizes many face crops per call.
+
+    Crops (from one frame or from several streams' frames) are resized into
+    a preallocated uint8 buffer, their LBP histograms are computed in one
+    vectorized pass, and the whole batch is looked up in a gallery.Gallery
+    with matrix products. Distances follow the LBPH convention: lower is
+    better and values below the gallery threshold (100) count as a match;
+    the gallery's distance_scale is the knob for calibrating that cut-off.
+    """
+
+    def __init__(self, gallery=None, face_size=FACE_SIZE, grid=(8, 8),
+                 max_batch=32):
+        self.gallery = gallery if gallery is not None else Gallery()
+        self.face_size = face_size
+        self.grid = grid
+        self.buffer = np.empty((max_batch, face_size[1], face_size[0]), np.uint8)
+
+    @classmethod
+    def from_dataset(cls, dataset_dir="dataset", **kwargs):
+        """Create a recognizer with every crop in the dataset enrolled"""
+        recognizer = cls(**kwargs)
+        recognizer.enroll_dataset(dataset_dir)
+        return recognizer
+
+    def clone(self):
+        """Return a recognizer sharing this gallery but with its own buffer"""
+        return BatchRecognizer(self.gallery, self.face_size, self.grid,
+                               len(self.buffer))
+
+    def normalize(self, crops):
+        """Resize crops into the preallocated buffer and return a view of it"""
+        if len(crops) > len(self.buffer):
+            self.buffer = np.empty((max(len(crops), 2 * len(self.buffer)),)
+                                   + self.buffer.shape[1:], np.uint8)
+        for i, crop in enumerate(crops):
+            cv2.resize(crop, self.face_size, dst=self.buffer[i],
+                       interpolation=cv2.INTER_AREA)
+        return self.buffer[:len(crops)]
+
+    def features(self, crops):
+        """Return the feature matrix for a list of crops"""
+        if not len(crops):
+            return np.empty((0, self.grid[0] * self.grid[1] * LBP_BINS), np.float32)
+        batch = len(self.buffer)
+        # Larger lists are processed in buffer-sized chunks
+        if len(crops) > batch:
+            return np.vstack([lbp_features(self.normalize(crops[i:i + batch]), self.grid)
+                              for i in range(0, len(crops), batch)])
+        return lbp_features(self.normalize(crops), self.grid)
+
+    def enroll(self, crops, labels):
+        """Add crops to the gallery under the given integer labels"""
+        if len(crops):
+            self.gallery.add(self.features(crops), labels)
+
+    def enroll_dataset(self, dataset_dir="dataset", cache=None):
+        """Enroll every dataset image, decoded in parallel chunks"""
+        for faces, ids in iter_faces(list_images(dataset_dir), dataset_dir,
+                                     size=self.face_size, cache=cache):
+            self.enroll(faces, ids)
+
+    def predict_crops(self, crops, k=1):
+        """
+        Recognize a batch of face crops
+        Returns:
+            List of (label, distance) tuples, one per crop; unknown faces
+            have the label gallery.UNKNOWN
+        """
+        if not len(crops):
+            return []
+        return self.gallery.identify(self.features(crops), k)
+
+    def predict_boxes(self, gray, boxes):
+        """Recognize every (x, y, w, h) box of a grayscale frame"""
+        return self.predict_crops([gray[y:y+h, x:x+w] for (x, y, w, h) in boxes])
+
+def predict_faces(recognizer, gray, boxes):
+    """
+    Recognize boxes with either a BatchRecognizer or an OpenCV face recognizer
+    Returns:
+        List of (label, confidence) tuples, lower confidence is better
+    """
+    return recognize_crops(recognizer, [gray[y:y+h, x:x+w] for (x, y, w, h) in boxes])
+
+def recognize_crops(recognizer, crops):
+    """
+    Recognize face crops, possibly cut from different images, with either
+    a BatchRecognizer (in one vectorized pass) or an OpenCV face recognizer
+    Returns:
+        List of (label, confidence) tuples, lower confidence is better
+    """
+    if isinstance(recognizer, BatchRecognizer):
+        return recognizer.predict_crops(crops)
+    return [recognizer.predict(resize_face(crop)) for crop in crops]
+
+def resize_face(crop):
+    """
+    Resize a face crop to FACE_SIZE, the size the LBPH model is trained
+    at, so its distances (and the confidence < 100 threshold) are on the
+    same scale as in training
+    """
+    if crop.shape[::-1] == FACE_SIZE:
+        return crop
+    return cv2.resize(crop, FACE_SIZE, interpolation=cv2.INTER_AREA)
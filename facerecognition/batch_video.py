@@ -0,0 +1,284 @@
+import argparse
+import csv
+import cv2
+import json
+import logging
+import multiprocessing as mp
+import os
+import time
+from batch_recognizer import BatchRecognizer
+from detection import Detectors, detector_config
+from gallery import load_gallery, load_name_mappings
+from preprocess import FramePreprocessor
+from recognise_face_http import create_processor
+from video_io import list_clips
+from worker_pool import load_models
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+FRAME_FIELDS = ['video', 'frame', 'timestamp', 'track', 'name', 'confidence',
+                'x', 'y', 'w', 'h']
+TRACK_FIELDS = ['video', 'track', 'name', 'confidence', 'first_frame',
+                'last_frame', 'start_time', 'end_time', 'frames']
+
+# Models of a pool process, loaded once by _init_worker
+_models = {}
+
+def _init_worker(batch_recognition, detector):
+    if batch_recognition:
+        _models['models'] = Detectors(detector), BatchRecognizer(load_gallery())
+    else:
+        _models['models'] = load_models(detector=detector)
+    _models['names'] = load_name_mappings()
+
+def plan_segments(path, stride=1, chunk_frames=1500, start=0.0, end=None):
+    """
+    Split a video into (path, first frame, end frame) segments of about
+    chunk_frames frames between the start and end times (seconds)
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        logger.error(f"Unable to open {path}")
+        return []
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    first = int(start * fps)
+    last = int(end * fps) if end is not None else None
+    if total > 0:
+        last = total if last is None else min(last, total)
+    if last is None:
+        # Unknown length; read to the end in one segment
+        return [(path, first, None)]
+
+    # Keep segment starts on the stride so sampled frames match one pass
+    step = max(stride, chunk_frames - chunk_frames % stride)
+    return [(path, s, min(s + step, last)) for s in range(first, last, step)]
+
+def process_segment(task):
+    """
+    Run detection, tracking and recognition over one segment of a video in
+    a pool process. Tracks do not continue across segments.
+    Returns:
+        {'video', 'start', 'frames', 'seconds', 'rows'}; one row per
+        sampled frame with its face results
+    """
+    path, first, last, stride, detect_interval, detect_scale = task
+    detectors, recognizer = _models['models']
+    started = time.perf_counter()
+
+    cap = cv2.VideoCapture(path)
+    # Results carry no images, so only the luma plane is decoded
+    FramePreprocessor(luma=True).configure(cap)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    if first:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    # Same analysis as live streams, so archived results match
+    processor = create_processor(
+        {'url': path, 'name': os.path.basename(path),
+         'detect_interval': detect_interval, 'detect_scale': detect_scale},
+        recognizer, detectors, _models['names'], headless=True)
+
+    rows = []
+    frame = None
+    index = first
+    while last is None or index < last:
+        # Skipped frames are grabbed but not decoded
+        if not cap.grab():
+            break
+        if (index - first) % stride == 0:
+            ret, frame = cap.retrieve(frame)
+            if not ret:
+                break
+            result = processor.analyze_frame(frame)
+            rows.append({'frame': index, 'timestamp': index / fps,
+                         'faces': result['faces']})
+        index += 1
+    cap.release()
+
+    return {'video': path, 'start': first, 'frames': len(rows),
+            'seconds': time.perf_counter() - started, 'rows': rows}
+
+def frame_rows(segment):
+    """Flatten a segment into one output row per face and frame"""
+    for row in segment['rows']:
+        for face in row['faces']:
+            x, y, w, h = face['box']
+            yield {'video': segment['video'], 'frame': row['frame'],
+                   'timestamp': round(row['timestamp'], 3),
+                   'track': f"{segment['start']}-{face['track_id']}",
+                   'name': face['name'], 'confidence': face['confidence'],
+                   'x': x, 'y': y, 'w': w, 'h': h}
+
+def track_rows(segment):
+    """Summarize a segment into one output row per track"""
+    tracks = {}
+    for row in segment['rows']:
+        for face in row['faces']:
+            track = tracks.setdefault(face['track_id'], {
+                'video': segment['video'],
+                'track': f"{segment['start']}-{face['track_id']}",
+                'name': 'unknown', 'confidence': None,
+                'first_frame': row['frame'],
+                'start_time': round(row['timestamp'], 3), 'frames': 0})
+            track['last_frame'] = row['frame']
+            track['end_time'] = round(row['timestamp'], 3)
+            track['frames'] += 1
+            if face['name'] != 'unknown':
+                track['name'] = face['name']
+            if face['confidence'] is not None and (
+                    track['confidence'] is None
+                    or face['confidence'] < track['confidence']):
+                track['confidence'] = face['confidence']
+    return [{field: track.get(field) for field in TRACK_FIELDS}
+            for track in tracks.values()]
+
+class ResultWriter:
+    """Write result rows as JSONL, CSV or Parquet (needs pyarrow)"""
+
+    def __init__(self, path, fields, fmt=None):
+        self.path = path
+        self.fields = fields
+        self.fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower() or 'jsonl'
+        self.rows = 0
+        self._parquet = None
+        if self.fmt == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError("Writing Parquet requires pyarrow (pip install pyarrow)")
+            self._pyarrow = pyarrow
+            self._file = None
+        elif self.fmt in ('jsonl', 'json', 'csv'):
+            self._file = open(path, 'w', newline='')
+            if self.fmt == 'csv':
+                self._csv = csv.DictWriter(self._file, fieldnames=fields)
+                self._csv.writeheader()
+        else:
+            raise ValueError(f"Unknown output format: {self.fmt}")
+
+    def write(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        self.rows += len(rows)
+        if self.fmt == 'parquet':
+            table = self._pyarrow.Table.from_pylist(rows)
+            if self._parquet is None:
+                self._parquet = self._pyarrow.parquet.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table.cast(self._parquet.schema))
+        elif self.fmt == 'csv':
+            self._csv.writerows(rows)
+        else:
+            for row in rows:
+                self._file.write(json.dumps(row) + '\n')
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._file is not None:
+            self._file.close()
+
+def process_videos(paths, output, fmt=None, stride=1, chunk_frames=1500,
+                   workers=None, per_track=False, start=0.0, end=None,
+                   detect_interval=5, detect_scale=1.0, batch_recognition=False,
+                   detector=None):
+    """
+    Recognize faces in recorded video files as fast as possible
+    Args:
+        paths: Video files or directories of videos
+        output: Result file; the format follows the extension (.jsonl,
+            .csv or .parquet) unless fmt is given
+        stride: Only analyze every Nth frame
+        chunk_frames: Frames per segment handed to a pool process
+        workers: Pool processes (defaults to the number of CPU cores)
+        per_track: Write one row per track instead of one per face and frame
+        start, end: Only analyze this time range (seconds) of every video
+        detect_interval, detect_scale, batch_recognition, detector: As for
+            live streams
+    Returns:
+        Summary dictionary with the frame count, elapsed time and frames/sec
+    """
+    # Checked here rather than failing in every pool process
+    detector = detector_config(detector)
+    videos = list_clips(paths)
+    tasks = [
+        (path, first, last, stride, detect_interval, detect_scale)
+        for video in videos
+        for path, first, last in plan_segments(video, stride, chunk_frames, start, end)
+    ]
+    writer = ResultWriter(output, TRACK_FIELDS if per_track else FRAME_FIELDS, fmt)
+    logger.info(f"Processing {len(videos)} videos in {len(tasks)} segments")
+
+    frames = 0
+    started = time.perf_counter()
+    ctx = mp.get_context('spawn')
+    try:
+        with ctx.Pool(workers or os.cpu_count() or 1, initializer=_init_worker,
+                      initargs=(batch_recognition, detector)) as pool:
+            # imap keeps the output in video and frame order
+            for segment in pool.imap(process_segment, tasks):
+                writer.write(track_rows(segment) if per_track else frame_rows(segment))
+                frames += segment['frames']
+                elapsed = time.perf_counter() - started
+                logger.info(f"{os.path.basename(segment['video'])} @ frame {segment['start']}: "
+                            f"{segment['frames']} frames in {segment['seconds']:.1f}s, "
+                            f"{frames / max(elapsed, 1e-6):.1f} frames/sec overall")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        'videos': len(videos),
+        'segments': len(tasks),
+        'frames': frames,
+        'rows': writer.rows,
+        'seconds': round(elapsed, 2),
+        'fps': round(frames / max(elapsed, 1e-6), 1),
+    }
+    logger.info(f"Done: {summary}")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Recognize faces in recorded video files')
+    parser.add_argument('videos', nargs='+', help='Video files or directories')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Result file (.jsonl, .csv or .parquet)')
+    parser.add_argument('--format', choices=['jsonl', 'csv', 'parquet'],
+                        help='Output format (defaults to the file extension)')
+    parser.add_argument('--stride', type=int, default=1,
+                        help='Analyze every Nth frame')
+    parser.add_argument('--chunk-frames', type=int, default=1500,
+                        help='Frames per work unit')
+    parser.add_argument('--workers', type=int, help='Number of processes')
+    parser.add_argument('--per-track', action='store_true',
+                        help='One row per track instead of per face and frame')
+    parser.add_argument('--start', type=float, default=0.0,
+                        help='Start time in seconds')
+    parser.add_argument('--end', type=float, help='End time in seconds')
+    parser.add_argument('--detect-interval', type=int, default=5,
+                        help='Run the detector every N analyzed frames')
+    parser.add_argument('--detect-scale', type=float, default=1.0,
+                        help='Detect faces on a frame resized by this factor')
+    parser.add_argument('--batch-recognition', action='store_true',
+                        help='Recognize against the vectorized gallery')
+    parser.add_argument('--detector',
+                        help='Detector backend: haar, lbp, yunet or a JSON config')
+    args = parser.parse_args()
+
+    summary = process_videos(args.videos, args.output, args.format, args.stride,
+                             args.chunk_frames, args.workers, args.per_track,
+                             args.start, args.end, args.detect_interval,
+                             args.detect_scale, args.batch_recognition, args.detector)
+    print(json.dumps(summary))
+
+if __name__ == "__main__":
+    main()
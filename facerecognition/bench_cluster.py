@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from bench_pipeline import prepare_workspace, start_fake_cameras
+from cluster import Coordinator
+
+# Exercise a coordinator and its worker nodes on one machine.
+#
+# Local worker processes stand in for hosts: every node is a headless
+# recognise_face_http.py started with --coordinator, reading fake MJPEG
+# cameras from fake_stream.py. Cameras get different target frame rates,
+# so their measured costs differ. The run goes through four phases: the
+# initial nodes start, one more node joins, a node shuts down cleanly and
+# a node is killed. After each phase the stream placement, the streams
+# that moved, the streams running healthy on their node and the fleet's
+# processed frame rate are reported.
+
+def run_scenario(streams=12, nodes=3, settle=20.0, fps=6.0, size=(320, 240),
+                 heartbeat_interval=1.0, identities=5, seed=0):
+    """
+    Returns:
+        One result dictionary per phase
+    """
+    # Imported here because train_faces configures logging on import
+    from train_faces import train_model
+
+    cameras, base_url = start_fake_cameras(fps, size)
+    workspace = tempfile.mkdtemp(prefix='bench_cluster_')
+    cwd = os.getcwd()
+    processes = {}
+    coordinator = None
+    results = []
+    try:
+        prepare_workspace(workspace, identities, seed=seed)
+        os.chdir(workspace)
+        train_model(incremental=False)
+        os.chdir(cwd)
+
+        rates = (fps, fps / 2, fps / 4)
+        configs = [{'url': f"{base_url}/cluster-cam{i}", 'name': f"cam{i}",
+                    'target_fps': rates[i % len(rates)]} for i in range(streams)]
+        coordinator = Coordinator(stream_configs=configs, port=0,
+                                  heartbeat_interval=heartbeat_interval).start()
+        url = f"http://127.0.0.1:{coordinator.port}"
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'recognise_face_http.py')
+
+        def start_node(name):
+            log = open(os.path.join(workspace, f"{name}.log"), 'w')
+            processes[name] = subprocess.Popen(
+                [sys.executable, script, '--headless', '--coordinator', url,
+                 '--node-name', name, '--capacity', '1'],
+                cwd=workspace, stdout=log, stderr=subprocess.STDOUT)
+
+        def stop_node(name, sig):
+            process = processes.pop(name)
+            process.send_signal(sig)
+            process.wait(timeout=30)
+
+        def phase(name, action):
+            rebalances = len(coordinator.history)
+            started = time.time()
+            action()
+            time.sleep(settle)
+            status = coordinator.status()
+            changes = coordinator.history[rebalances:]
+            placement = {node: sorted((s for s, stats in status['streams'].items()
+                                       if stats['node'] == node),
+                                      key=lambda s: int(s[3:]))
+                         for node in status['nodes']}
+            healthy = sum(1 for stats in status['streams'].values()
+                          if stats.get('state') == 'healthy')
+            results.append({
+                'phase': name,
+                'nodes': {node: {'streams': placement[node],
+                                 'load': round(info['load'], 3),
+                                 'cpu': info['cpu']}
+                          for node, info in status['nodes'].items()},
+                'rebalances': [change['reason'] for change in changes],
+                'moved': sum(change['moved'] for change in changes),
+                'reassigned_after': (round(changes[-1]['time'] - started, 1)
+                                     if changes else None),
+                'streams': streams,
+                'healthy': healthy,
+                'unassigned': len(status['unassigned']),
+                'fps': status['fps'],
+            })
+
+        names = [f"node{i}" for i in range(nodes + 1)]
+        phase('start', lambda: [start_node(name) for name in names[:nodes]])
+        phase('join', lambda: start_node(names[nodes]))
+        phase('leave', lambda: stop_node(names[0], signal.SIGINT))
+        phase('crash', lambda: stop_node(names[1], signal.SIGKILL))
+    finally:
+        os.chdir(cwd)
+        for process in processes.values():
+            process.send_signal(signal.SIGINT)
+        for process in processes.values():
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if coordinator is not None:
+            coordinator.stop()
+        cameras.terminate()
+        cameras.wait()
+        shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a coordinator and local worker nodes through joins, leaves and crashes')
+    parser.add_argument('--streams', type=int, default=12)
+    parser.add_argument('--nodes', type=int, default=3, help='Initial worker nodes')
+    parser.add_argument('--settle', type=float, default=20.0,
+                        help='Seconds to wait after each change')
+    parser.add_argument('--fps', type=float, default=6.0, help='Camera frame rate')
+    parser.add_argument('--heartbeat-interval', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    results = run_scenario(args.streams, args.nodes, args.settle, args.fps,
+                           heartbeat_interval=args.heartbeat_interval, seed=args.seed)
+    for r in results:
+        reassigned = f", after {r['reassigned_after']}s" if r['reassigned_after'] is not None else ''
+        print(f"{r['phase']}: rebalances {r['rebalances']}, {r['moved']} streams moved"
+              f"{reassigned}; {r['healthy']}/{r['streams']} healthy, "
+              f"{r['unassigned']} unassigned, {r['fps']:.1f} fps")
+        for node, info in r['nodes'].items():
+            print(f"  {node:<8} load {info['load']:.2f}  {', '.join(info['streams'])}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
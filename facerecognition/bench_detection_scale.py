@@ -0,0 +1,107 @@
+import argparse
+import json
+import numpy as np
+import time
+from detection import detect_faces, load_detector
+from tracker import box_iou
+from video_io import list_clips, read_gray_frames
+
+# Benchmark detection latency and recall against the detection scale.
+#
+# Recall is measured against the full-resolution (scale 1.0) detections of
+# the same frames, so it answers "how many of the faces we find today do we
+# still find when detecting on a smaller copy?".
+
+def count_matches(reference, found, iou_threshold=0.5):
+    """Count reference boxes that have a found box with enough overlap"""
+    used = set()
+    matches = 0
+    for ref in reference:
+        best, best_iou = None, iou_threshold
+        for i, box in enumerate(found):
+            iou = box_iou(ref, box)
+            if i not in used and iou >= best_iou:
+                best, best_iou = i, iou
+        if best is not None:
+            used.add(best)
+            matches += 1
+    return matches
+
+def benchmark(clips, scales, stride=5, max_frames=100, detector=None):
+    """
+    Run the detector at every scale on frames sampled from the clips
+    Args:
+        detector: Detector backend config (see detection.detector_config)
+    Returns:
+        One result dictionary per scale
+    """
+    face_detector = load_detector(detector)
+
+    stats = {scale: {'latency': [], 'matched': 0, 'found': 0} for scale in scales}
+    reference_faces = 0
+    frames = 0
+    resolution = None
+
+    for clip in clips:
+        for gray in read_gray_frames(clip, stride, max_frames):
+            frames += 1
+            resolution = f"{gray.shape[1]}x{gray.shape[0]}"
+            reference = detect_faces(face_detector, gray)
+            reference_faces += len(reference)
+            for scale in scales:
+                start = time.perf_counter()
+                found = detect_faces(face_detector, gray, scale=scale)
+                stats[scale]['latency'].append(time.perf_counter() - start)
+                stats[scale]['found'] += len(found)
+                stats[scale]['matched'] += count_matches(reference, found)
+
+    results = []
+    for scale in scales:
+        latency = np.array(stats[scale]['latency']) * 1000
+        results.append({
+            'scale': scale,
+            'frames': frames,
+            'resolution': resolution,
+            'mean_ms': float(latency.mean()) if frames else None,
+            'p50_ms': float(np.percentile(latency, 50)) if frames else None,
+            'p95_ms': float(np.percentile(latency, 95)) if frames else None,
+            'reference_faces': reference_faces,
+            'found_faces': stats[scale]['found'],
+            'recall': (stats[scale]['matched'] / reference_faces
+                       if reference_faces else None),
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Detection latency and recall versus detection scale')
+    parser.add_argument('clips', nargs='+', help='Video files or directories')
+    parser.add_argument('--scales', default='1.0,0.75,0.5,0.33,0.25',
+                        help='Comma separated detection scales')
+    parser.add_argument('--stride', type=int, default=5,
+                        help='Use every Nth frame')
+    parser.add_argument('--max-frames', type=int, default=100,
+                        help='Frames to use per clip')
+    parser.add_argument('--detector',
+                        help='Detector backend: haar, lbp, yunet or a JSON config')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    scales = [float(s) for s in args.scales.split(',')]
+    results = benchmark(list_clips(args.clips), scales, args.stride,
+                        args.max_frames, args.detector)
+
+    print(f"{'scale':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'faces':>7} {'recall':>7}")
+    for r in results:
+        if r['mean_ms'] is None:
+            continue
+        recall = f"{r['recall']:.3f}" if r['recall'] is not None else '-'
+        print(f"{r['scale']:>6.2f} {r['mean_ms']:>9.2f} {r['p50_ms']:>9.2f} "
+              f"{r['p95_ms']:>9.2f} {r['found_faces']:>7} {recall:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import json
+import numpy as np
+import time
+from bench_detection_scale import count_matches
+from detection import detect_faces, detector_config, load_detector
+from video_io import list_clips, read_gray_frames
+
+# Compare detector backends per resolution on recorded clips.
+#
+# Every backend runs on the sampled frames downscaled to each width, so the
+# table shows what a camera would pay and find with each choice. Recall and
+# precision are measured against a reference backend on the full-resolution
+# frames. Backends frame faces differently (cascades draw larger, square
+# boxes), so boxes match at a lower overlap than in bench_detection_scale.
+
+def benchmark(clips, backends, widths, reference='haar', stride=5,
+              max_frames=100, iou_threshold=0.3):
+    """
+    Run every backend at every width on frames sampled from the clips
+    Args:
+        backends: Detector configs (see detection.detector_config)
+        widths: Frame widths to detect at; wider than the clip means native
+        reference: Detector config whose native-resolution detections
+            count as the faces to find
+    Returns:
+        One result dictionary per backend and width
+    """
+    frames = [gray for clip in clips for gray in read_gray_frames(clip, stride, max_frames)]
+    if not frames:
+        return []
+    reference_detector = load_detector(reference)
+    references = [detect_faces(reference_detector, gray) for gray in frames]
+    reference_faces = sum(len(boxes) for boxes in references)
+    height, native = frames[0].shape[:2]
+    # Widths beyond the clip's own all mean native resolution
+    scales = sorted({min(1.0, width / native) for width in widths}, reverse=True)
+
+    results = []
+    for backend in backends:
+        config = detector_config(backend)
+        detector = load_detector(config)
+        for scale in scales:
+            latency = []
+            found = 0
+            matched = 0
+            for gray, reference_boxes in zip(frames, references):
+                start = time.perf_counter()
+                boxes = detect_faces(detector, gray, scale=scale)
+                latency.append(time.perf_counter() - start)
+                found += len(boxes)
+                matched += count_matches(reference_boxes, boxes, iou_threshold)
+            ms = np.array(latency) * 1000
+            results.append({
+                'backend': config['backend'],
+                'config': config,
+                'resolution': f"{round(native * scale)}x{round(height * scale)}",
+                'frames': len(frames),
+                'mean_ms': float(ms.mean()),
+                'p50_ms': float(np.percentile(ms, 50)),
+                'p95_ms': float(np.percentile(ms, 95)),
+                'fps': 1000.0 / float(ms.mean()),
+                'reference_faces': reference_faces,
+                'found_faces': found,
+                'recall': matched / reference_faces if reference_faces else None,
+                'precision': matched / found if found else None,
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Detection speed and recall per detector backend and resolution')
+    parser.add_argument('clips', nargs='+', help='Video files or directories')
+    parser.add_argument('--backends', default='haar,lbp,yunet',
+                        help='Comma separated backend names, or a JSON list of configs')
+    parser.add_argument('--widths', default='1920,1280,640,320',
+                        help='Comma separated frame widths')
+    parser.add_argument('--reference', default=None,
+                        help='Backend the recall is measured against '
+                             '(yunet when its model is present, else haar)')
+    parser.add_argument('--stride', type=int, default=5,
+                        help='Use every Nth frame')
+    parser.add_argument('--max-frames', type=int, default=100,
+                        help='Frames to use per clip')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    if args.backends.lstrip().startswith('['):
+        wanted = json.loads(args.backends)
+    else:
+        wanted = args.backends.split(',')
+    backends = []
+    for backend in wanted:
+        try:
+            backends.append(detector_config(backend))
+        except IOError as e:
+            print(f"Skipping {backend}: {e}")
+    reference = args.reference
+    if reference is None:
+        reference = next((b for b in backends if b['backend'] == 'yunet'), 'haar')
+
+    widths = [int(w) for w in args.widths.split(',')]
+    results = benchmark(list_clips(args.clips), backends, widths, reference,
+                        args.stride, args.max_frames)
+
+    print(f"reference: {detector_config(reference)['backend']}")
+    print(f"{'backend':<8} {'resolution':>10} {'mean ms':>9} {'p95 ms':>9} {'fps':>8} "
+          f"{'faces':>7} {'recall':>7} {'precision':>9}")
+    for r in results:
+        recall = f"{r['recall']:.3f}" if r['recall'] is not None else '-'
+        precision = f"{r['precision']:.3f}" if r['precision'] is not None else '-'
+        print(f"{r['backend']:<8} {r['resolution']:>10} {r['mean_ms']:>9.2f} "
+              f"{r['p95_ms']:>9.2f} {r['fps']:>8.1f} {r['found_faces']:>7} "
+              f"{recall:>7} {precision:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
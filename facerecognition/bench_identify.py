@@ -0,0 +1,221 @@
+import argparse
+import cv2
+import http.client
+import json
+import numpy as np
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+from fake_stream import synthetic_frames
+
+# Load generator for identify_service.py.
+#
+# Every client thread keeps one connection open and sends requests back to
+# back for the duration, like a busy local caller. Without --url a service
+# is started in its own process (so its CPU time is not shared with the
+# clients) from the given directory, which needs the trained model and
+# faces.txt like every entry point, once per batch window to compare.
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def load_images(paths, count=20, size=(640, 480), seed=0):
+    """
+    Encoded images to send: the image files in paths (files or
+    directories), or synthetic JPEG frames if there are none
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for f in sorted(os.listdir(path))
+                         if f.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            files.append(path)
+    images = []
+    for path in files:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    if not images:
+        images = [cv2.imencode('.jpg', frame)[1].tobytes()
+                  for frame in synthetic_frames(count, size, seed)]
+    return images
+
+def multipart_body(images):
+    """multipart/form-data body with one part per image; returns (body, content type)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for i, image in enumerate(images):
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="image"; '
+                     f'filename="{i}.jpg"\r\nContent-Type: image/jpeg\r\n\r\n'.encode())
+        parts.append(image)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+def run_load(url, images, clients=8, duration=10.0, batch=1):
+    """
+    Send identification requests from concurrent keep-alive clients
+    Args:
+        batch: Images per request; more than one are sent as multipart
+    Returns:
+        Result dictionary with requests/sec, images/sec and latency
+        percentiles of the successful requests
+    """
+    target = urlparse(url)
+    path = target.path if target.path not in ('', '/') else '/identify'
+    # Bodies are built up front so the clients only send
+    if batch == 1:
+        bodies = [(image, 'image/jpeg') for image in images]
+    else:
+        bodies = [multipart_body([images[(i + j) % len(images)] for j in range(batch)])
+                  for i in range(len(images))]
+
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    faces = [0] * clients
+    start_gate = threading.Barrier(clients + 1)
+    deadline = [None]
+
+    def client(index):
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        start_gate.wait()
+        i = index
+        while time.perf_counter() < deadline[0]:
+            body, content_type = bodies[i % len(bodies)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                connection.request('POST', path, body, {'Content-Type': content_type})
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                connection.close()
+                continue
+            if response.status != 200:
+                errors[index] += 1
+                continue
+            latencies[index].append(time.perf_counter() - started)
+            result = json.loads(data)
+            for image in result.get('images', [result]):
+                faces[index] += len(image['faces'])
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + duration
+    start_gate.wait()
+    for thread in threads:
+        thread.join()
+
+    ms = np.array([l for client_latencies in latencies for l in client_latencies]) * 1000
+    requests = len(ms)
+    return {
+        'clients': clients,
+        'batch': batch,
+        'duration': duration,
+        'requests': requests,
+        'errors': sum(errors),
+        'faces': sum(faces),
+        'requests_per_sec': requests / duration,
+        'images_per_sec': requests * batch / duration,
+        'mean_ms': float(ms.mean()) if requests else None,
+        'p50_ms': float(np.percentile(ms, 50)) if requests else None,
+        'p95_ms': float(np.percentile(ms, 95)) if requests else None,
+        'p99_ms': float(np.percentile(ms, 99)) if requests else None,
+    }
+
+def start_service(workdir, args):
+    """
+    Run identify_service.py from workdir in its own process and wait until
+    its models are loaded
+    Returns:
+        (process, base URL)
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'identify_service.py')
+    process = subprocess.Popen([sys.executable, script, '--port', str(port),
+                                '--metrics-log-interval', '0'] + args,
+                               cwd=workdir, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while True:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                connection.close()
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            pass
+        if time.time() > deadline or process.poll() is not None:
+            process.kill()
+            raise RuntimeError("Identification service did not start")
+        time.sleep(0.2)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Requests/sec and latency of the identification service under load')
+    parser.add_argument('images', nargs='*', help='Image files or directories '
+                        '(synthetic frames otherwise)')
+    parser.add_argument('--url', help='Running service to load (one is started otherwise)')
+    parser.add_argument('--workdir', default='.',
+                        help='Directory with the trained model to start the service in')
+    parser.add_argument('--clients', default='1,8,32',
+                        help='Comma separated numbers of concurrent clients')
+    parser.add_argument('--batch', type=int, default=1, help='Images per request')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='Seconds per run')
+    parser.add_argument('--batch-windows-ms', default='0,5',
+                        help='Comma separated batch windows of the started service')
+    parser.add_argument('--service-args', default='',
+                        help='Further identify_service.py options, e.g. "--workers 2"')
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    clients = [int(c) for c in args.clients.split(',')]
+    results = []
+    if args.url:
+        runs = [(None, args.url, None)]
+    else:
+        runs = []
+        for window in args.batch_windows_ms.split(','):
+            runs.append((window, None, ['--batch-window-ms', window] + args.service_args.split()))
+
+    for window, url, service_args in runs:
+        process = None
+        if url is None:
+            process, url = start_service(args.workdir, service_args)
+        try:
+            for count in clients:
+                result = run_load(url, images, count, args.duration, args.batch)
+                result['batch_window_ms'] = float(window) if window is not None else None
+                results.append(result)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    print(f"{'window':>7} {'clients':>7} {'batch':>5} {'req/s':>8} {'img/s':>8} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for r in results:
+        window = f"{r['batch_window_ms']:g}" if r['batch_window_ms'] is not None else '-'
+        p50 = f"{r['p50_ms']:.1f}" if r['p50_ms'] is not None else '-'
+        p99 = f"{r['p99_ms']:.1f}" if r['p99_ms'] is not None else '-'
+        print(f"{window:>7} {r['clients']:>7} {r['batch']:>5} {r['requests_per_sec']:>8.1f} "
+              f"{r['images_per_sec']:>8.1f} {p50:>8} {p99:>8} {r['errors']:>6}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
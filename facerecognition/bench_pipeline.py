@@ -0,0 +1,431 @@
+import argparse
+import cv2
+import json
+import numpy as np
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from batch_recognizer import FACE_SIZE, BatchRecognizer
+from detection import CascadeDetector, detect_faces
+from fake_stream import FakeMJPEGServer, synthetic_frames
+from gallery import Gallery
+from lbph_model import LBPHModel
+from metrics import REGISTRY
+from video_io import list_clips, read_gray_frames
+
+# Benchmark suite for the detection and recognition pipeline.
+#
+# Everything runs without a camera on seeded synthetic data (or recorded
+# clips for detection), so two runs on the same machine are comparable.
+# Results are written as JSON; --compare prints the change of the main
+# metric of every row against an earlier result file.
+
+CASCADE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'haarcascade_frontalface_default.xml')
+
+# Section -> (fields identifying a row, metric compared between runs)
+COMPARE = {
+    'detect': (('scaleFactor', 'minNeighbors', 'scale'), 'mean_ms'),
+    'predict': (('identities', 'method'), 'per_face_ms'),
+    'train': (('identities', 'mode'), 'seconds'),
+    'streams': (('streams', 'mode'), 'fps'),
+    'ingest': (('streams', 'mode'), 'cpu_ms_per_frame'),
+}
+
+def synthetic_faces(identities, samples, size=FACE_SIZE, seed=0, variation_seed=None):
+    """
+    Deterministic face-like crops: one smooth random pattern per identity
+    (drawn from `seed`), varied per sample by a small shift, a brightness
+    change and noise (drawn from `variation_seed`, defaults to `seed`).
+    Equal seeds with different variation seeds give new samples of the
+    same identities.
+    Returns:
+        (faces uint8 array (n, height, width), labels list)
+    """
+    patterns = np.random.default_rng(seed)
+    rng = np.random.default_rng(seed if variation_seed is None else variation_seed)
+    width, height = size
+    faces = []
+    labels = []
+    for label in range(1, identities + 1):
+        base = patterns.integers(0, 255, (height // 4, width // 4), dtype=np.uint8)
+        base = cv2.resize(base, (width, height), interpolation=cv2.INTER_CUBIC)
+        for _ in range(samples):
+            dx, dy = rng.integers(-3, 4, 2)
+            shift = np.float32([[1, 0, dx], [0, 1, dy]])
+            face = cv2.warpAffine(base, shift, (width, height),
+                                  borderMode=cv2.BORDER_REFLECT).astype(np.float32)
+            face = face * rng.uniform(0.85, 1.15) + rng.normal(0, 8, face.shape)
+            faces.append(np.clip(face, 0, 255).astype(np.uint8))
+            labels.append(label)
+    return np.stack(faces), labels
+
+def _percentiles(samples):
+    ms = np.array(samples) * 1000
+    return {'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95))}
+
+def bench_detect(grays, param_sets, cascade_path=CASCADE_PATH):
+    """Time detect_faces for every (scaleFactor, minNeighbors, scale) set"""
+    face_detector = CascadeDetector(cascade_path)
+    results = []
+    for scale_factor, min_neighbors, scale in param_sets:
+        latency = []
+        found = 0
+        for gray in grays:
+            start = time.perf_counter()
+            found += len(detect_faces(face_detector, gray, scale=scale,
+                                      scaleFactor=scale_factor,
+                                      minNeighbors=min_neighbors))
+            latency.append(time.perf_counter() - start)
+        results.append(dict(scaleFactor=scale_factor, minNeighbors=min_neighbors,
+                            scale=scale, frames=len(grays), faces=found,
+                            resolution=f"{grays[0].shape[1]}x{grays[0].shape[0]}",
+                            **_percentiles(latency)))
+    return results
+
+def bench_predict(identity_counts, samples=10, queries=50, seed=0):
+    """
+    Time and score recognition against growing galleries with the OpenCV
+    LBPH recognizer, the NumPy LBPHModel and the batched gallery
+    """
+    results = []
+    for identities in identity_counts:
+        faces, labels = synthetic_faces(identities, samples, seed=seed)
+        per_identity = max(1, -(-queries // identities))
+        query_faces, query_labels = synthetic_faces(identities, per_identity, seed=seed,
+                                                    variation_seed=seed + 1)
+        query_faces = query_faces[:queries]
+        query_labels = query_labels[:queries]
+
+        start = time.perf_counter()
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.train(list(faces), np.array(labels))
+        train_seconds = time.perf_counter() - start
+        model = LBPHModel.from_recognizer(recognizer)
+
+        start = time.perf_counter()
+        batch = BatchRecognizer(Gallery())
+        batch.enroll(faces, labels)
+        enroll_seconds = time.perf_counter() - start
+
+        methods = {
+            'lbph_cv2': (train_seconds,
+                         lambda: [recognizer.predict(f)[0] for f in query_faces]),
+            'lbph_numpy': (train_seconds,
+                           lambda: [model.predict(f)[0] for f in query_faces]),
+            'gallery_batch': (enroll_seconds,
+                              lambda: [label for label, _ in batch.predict_crops(query_faces)]),
+        }
+        for method, (build_seconds, run) in methods.items():
+            start = time.perf_counter()
+            predicted = run()
+            seconds = time.perf_counter() - start
+            correct = sum(int(p == t) for p, t in zip(predicted, query_labels))
+            results.append({
+                'identities': identities,
+                'gallery_size': len(labels),
+                'method': method,
+                'queries': len(query_labels),
+                'per_face_ms': seconds * 1000 / len(query_labels),
+                'accuracy': correct / len(query_labels),
+                'build_seconds': build_seconds,
+            })
+    return results
+
+def prepare_workspace(path, identities, samples=10, seed=0):
+    """
+    Lay out a dataset/ and faces.txt like collect_face_data would, plus the
+    face cascade, so the training and stream entry points run unchanged
+    """
+    os.makedirs(os.path.join(path, 'dataset'), exist_ok=True)
+    os.makedirs(os.path.join(path, 'trainer'), exist_ok=True)
+    shutil.copy(CASCADE_PATH, path)
+    # Dataset crops come in various sizes; training resizes them
+    faces, labels = synthetic_faces(identities, samples, size=(120, 120), seed=seed)
+    counts = {}
+    for face, label in zip(faces, labels):
+        counts[label] = counts.get(label, 0) + 1
+        image_path = os.path.join(path, 'dataset', f"person{label}.{label}.{counts[label]}.jpg")
+        # Existing images are left alone so their mtimes stay unchanged
+        if not os.path.exists(image_path):
+            cv2.imwrite(image_path, face)
+    with open(os.path.join(path, 'faces.txt'), 'w') as f:
+        f.writelines(f"{label}:person{label}\n" for label in sorted(counts))
+
+def bench_train(identity_counts, samples=10, seed=0):
+    """
+    Time train_model() on synthetic datasets: a cold full training, a full
+    retraining with a warm decode cache, and an incremental update after
+    one more person is added
+    """
+    # Imported here because train_faces configures logging on import
+    from train_faces import train_model
+
+    results = []
+    cwd = os.getcwd()
+    for identities in identity_counts:
+        workspace = tempfile.mkdtemp(prefix='bench_train_')
+        try:
+            prepare_workspace(workspace, identities, samples, seed)
+            os.chdir(workspace)
+            for mode in ('full_cold', 'full_warm'):
+                start = time.perf_counter()
+                train_model(incremental=False)
+                results.append({'identities': identities, 'images': identities * samples,
+                                'mode': mode, 'seconds': time.perf_counter() - start})
+
+            # One more person, as collect_face_data would add them
+            prepare_workspace(workspace, identities + 1, samples, seed)
+            start = time.perf_counter()
+            train_model(incremental=True)
+            results.append({'identities': identities, 'images': samples,
+                            'mode': 'incremental', 'seconds': time.perf_counter() - start})
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+def bench_streams(stream_counts, duration=10.0, fps=25.0, size=(640, 480),
+                  identities=10, num_workers=None, multiprocess=False, seed=0):
+    """
+    Run process_multiple_streams headless against N fake MJPEG cameras and
+    measure the processed frame rate, drops and per-stage latencies
+    """
+    from recognise_face_http import process_multiple_streams
+    from train_faces import train_model
+
+    server = FakeMJPEGServer(synthetic_frames(100, size, seed), fps).start()
+    workspace = tempfile.mkdtemp(prefix='bench_streams_')
+    cwd = os.getcwd()
+    results = []
+    mode = 'processes' if multiprocess else 'threads'
+    try:
+        prepare_workspace(workspace, identities, seed=seed)
+        os.chdir(workspace)
+        train_model(incremental=False)
+
+        for count in stream_counts:
+            names = [f"bench{count}-cam{i}" for i in range(count)]
+            configs = [{'url': server.url(name), 'name': name} for name in names]
+            stats = process_multiple_streams(configs, num_workers=num_workers,
+                                             headless=True, metrics_log_interval=0,
+                                             multiprocess=multiprocess,
+                                             duration=duration)
+            processed = sum(s['processed'] for s in stats.values())
+            captured = sum(s['captured'] for s in stats.values())
+            dropped = sum(s['dropped'] for s in stats.values())
+            stages = {}
+            for name in names:
+                if name in REGISTRY.streams:
+                    for stage, h in REGISTRY.streams[name].snapshot()['stages'].items():
+                        if h['count']:
+                            stages.setdefault(stage, []).append(h['p95'] * 1000)
+            results.append({
+                'streams': count,
+                'mode': mode,
+                'duration': duration,
+                'source_fps': fps,
+                'resolution': f"{size[0]}x{size[1]}",
+                'captured': captured,
+                'processed': processed,
+                'dropped': dropped,
+                'fps': processed / duration,
+                'fps_per_stream': processed / duration / count,
+                'stage_p95_ms': {k: max(v) for k, v in stages.items()},
+            })
+    finally:
+        os.chdir(cwd)
+        server.stop()
+        shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+def start_fake_cameras(fps, size):
+    """
+    Run fake_stream.py in its own process, so its CPU time is not measured
+    Returns:
+        (process, base URL)
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_stream.py')
+    process = subprocess.Popen([sys.executable, script, '--port', str(port), '--fps', str(fps),
+                                '--size', f"{size[0]}x{size[1]}"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            if time.time() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError("Fake camera server did not start")
+            time.sleep(0.1)
+
+def bench_ingest(stream_counts, duration=10.0, fps=10.0, size=(640, 480),
+                 reductions=(1, 2)):
+    """
+    Read and decode N fake MJPEG cameras to luma without detection, once
+    with a VideoCapture thread per camera and once with the asyncio
+    ingestor at each decode reduction, and measure the decoded frame rate,
+    CPU time per frame and thread count
+    """
+    from mjpeg_ingest import MJPEGIngestor
+    from preprocess import FramePreprocessor
+    from stream_supervisor import CaptureSupervisor
+
+    server, base_url = start_fake_cameras(fps, size)
+    results = []
+    try:
+        for count in stream_counts:
+            for reduce in (None,) + tuple(reductions):
+                mode = 'threads' if reduce is None else f'asyncio/{reduce}'
+                ingestor = MJPEGIngestor().start() if reduce is not None else None
+                decoders = [FramePreprocessor(luma=True) for _ in range(count)]
+                streams = []
+                for i, decoder in enumerate(decoders):
+                    url = f"{base_url}/ingest{count}-{i}"
+                    if ingestor is not None:
+                        streams.append(ingestor.stream(
+                            url, url, lambda data, d=decoder, r=reduce: d.decode(data, r)))
+                    else:
+                        streams.append(CaptureSupervisor(
+                            url, url, lambda cap, d=decoder: cap.grab() and d.retrieve(cap)[0],
+                            configure=decoder.configure))
+                for stream in streams:
+                    stream.start()
+                try:
+                    # Measure after every camera is connected
+                    for stream in streams:
+                        stream.wait_live(10)
+                    frames = sum(d.frames for d in decoders)
+                    cpu = time.process_time()
+                    time.sleep(duration)
+                    frames = sum(d.frames for d in decoders) - frames
+                    cpu = time.process_time() - cpu
+                    threads = threading.active_count()
+                    live = sum(s.health.is_live for s in streams)
+                finally:
+                    for stream in streams:
+                        stream.stop(wait=False)
+                    for stream in streams:
+                        stream.stop()
+                    if ingestor is not None:
+                        ingestor.stop()
+                results.append({
+                    'streams': count,
+                    'mode': mode,
+                    'duration': duration,
+                    'source_fps': fps,
+                    'resolution': f"{size[0]}x{size[1]}",
+                    'live': live,
+                    'fps': frames / duration,
+                    'cpu_ms_per_frame': cpu / max(frames, 1) * 1000,
+                    'threads': threads,
+                })
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+def environment():
+    """Machine and code version the results were measured with"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit or None,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'opencv_threads': cv2.getNumThreads(),
+    }
+
+def compare(baseline, current):
+    """Print the change of each section's main metric against a baseline"""
+    print(f"{'section':<8} {'row':<36} {'baseline':>10} {'current':>10} {'change':>8}")
+    for section, (keys, metric) in COMPARE.items():
+        old = {tuple(row[k] for k in keys): row[metric]
+               for row in baseline.get(section, [])}
+        for row in current.get(section, []):
+            key = tuple(row[k] for k in keys)
+            if key not in old or not old[key]:
+                continue
+            change = (row[metric] - old[key]) / old[key] * 100
+            label = ' '.join(f"{k}={v}" for k, v in zip(keys, key))
+            print(f"{section:<8} {label:<36} {old[key]:>10.2f} {row[metric]:>10.2f} "
+                  f"{change:>+7.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the face pipeline')
+    parser.add_argument('--sections', default='detect,predict,train,streams,ingest',
+                        help='Comma separated sections to run')
+    parser.add_argument('--quick', action='store_true',
+                        help='Smaller sizes and shorter runs')
+    parser.add_argument('--clips', nargs='*', default=[],
+                        help='Video files or directories for the detect section '
+                             '(synthetic frames otherwise)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--multiprocess', action='store_true',
+                        help='Run the streams section in multiprocess mode')
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--compare', help='Earlier result file to compare against')
+    args = parser.parse_args()
+
+    sections = args.sections.split(',')
+    results = {'environment': environment(), 'quick': args.quick, 'seed': args.seed}
+
+    if 'detect' in sections:
+        if args.clips:
+            grays = [g for clip in list_clips(args.clips)
+                     for g in read_gray_frames(clip, 5, 20 if args.quick else 100)]
+        else:
+            grays = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY)
+                     for f in synthetic_frames(10 if args.quick else 50, seed=args.seed)]
+        param_sets = [(sf, mn, scale)
+                      for sf in ((1.3,) if args.quick else (1.1, 1.2, 1.3))
+                      for mn in ((5,) if args.quick else (3, 5))
+                      for scale in (1.0, 0.5)]
+        results['detect'] = bench_detect(grays, param_sets)
+    if 'predict' in sections:
+        results['predict'] = bench_predict((10, 50) if args.quick else (10, 50, 200, 500),
+                                           seed=args.seed)
+    if 'train' in sections:
+        results['train'] = bench_train((5, 20) if args.quick else (10, 50, 200),
+                                       seed=args.seed)
+    if 'streams' in sections:
+        results['streams'] = bench_streams((1, 2) if args.quick else (1, 2, 4, 8),
+                                           duration=5.0 if args.quick else 15.0,
+                                           multiprocess=args.multiprocess,
+                                           seed=args.seed)
+    if 'ingest' in sections:
+        results['ingest'] = bench_ingest((10, 50) if args.quick else (10, 50, 200),
+                                         duration=5.0 if args.quick else 15.0)
+
+    output = json.dumps(results, indent=2)
+    if args.json:
+        with open(args.json, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,598 @@
+import argparse
+import bisect
+import hashlib
+import json
+import logging
+import os
+import requests
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from fleet import load_fleet_config
+from metrics import REGISTRY, _escape
+from recognise_face_http import is_valid_url
+
+logger = logging.getLogger(__name__)
+
+# Seconds of processing per second a stream is assumed to need until a
+# worker has measured it
+DEFAULT_STREAM_COST = 0.1
+# Stages whose time is spent processing a stream's frames. Decoding inside
+# VideoCapture counts towards 'capture', which mostly waits for the camera,
+# so such streams are measured without their decode time.
+COST_STAGES = ('decode', 'total')
+# Ring points per unit of node capacity
+RING_POINTS = 64
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """Consistent hash ring; every node holds points in proportion to its capacity"""
+
+    def __init__(self, capacities, points_per_unit=RING_POINTS):
+        points = sorted((ring_hash(f"{node}#{i}"), node)
+                        for node, capacity in capacities.items()
+                        for i in range(max(1, round(points_per_unit * capacity))))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+        self._count = len(capacities)
+
+    def walk(self, key):
+        """Yield the distinct nodes clockwise from the key's position"""
+        start = bisect.bisect(self._hashes, ring_hash(key))
+        seen = set()
+        for i in range(len(self._nodes)):
+            node = self._nodes[(start + i) % len(self._nodes)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == self._count:
+                    return
+
+def assign_streams(costs, capacities, epsilon=0.25, current=None):
+    """
+    Place streams on nodes by consistent hashing with bounded loads. A
+    stream goes to the first node clockwise from its hash that its cost
+    keeps within (1 + epsilon) times the node's capacity share of the total
+    cost; if none does, to the node left least loaded relative to its
+    capacity. Adding or removing a node therefore moves few streams.
+    Args:
+        costs: {stream name: measured cost}
+        capacities: {node name: capacity}
+        current: {stream name: node name} placements to keep; only the
+            other streams are placed
+    Returns:
+        {stream name: node name}
+    """
+    if not capacities:
+        return {}
+    ring = HashRing(capacities)
+    total_capacity = sum(capacities.values())
+    total_cost = sum(costs.values())
+    limits = {node: (1 + epsilon) * total_cost * capacity / total_capacity
+              for node, capacity in capacities.items()}
+    loads = dict.fromkeys(capacities, 0.0)
+    assignment = {}
+    for stream, node in (current or {}).items():
+        if stream in costs and node in capacities:
+            assignment[stream] = node
+            loads[node] += costs[stream]
+
+    # Costly streams first so cheap ones fill the gaps; names break ties so
+    # the same inputs always give the same placement
+    for stream in sorted((s for s in costs if s not in assignment),
+                         key=lambda s: (-costs[s], s)):
+        cost = costs[stream]
+        node = next((n for n in ring.walk(stream) if loads[n] + cost <= limits[n]), None)
+        if node is None:
+            node = min(capacities, key=lambda n: ((loads[n] + cost) / capacities[n], n))
+        assignment[stream] = node
+        loads[node] += cost
+    return assignment
+
+def merge_results(totals, results):
+    """Add per-stream result aggregates (see ClusterNode.record) into totals"""
+    for stream, result in results.items():
+        total = totals.setdefault(stream, {'frames': 0, 'faces': 0, 'names': {}})
+        total['frames'] += result['frames']
+        total['faces'] += result['faces']
+        for name, seen in result['names'].items():
+            entry = total['names'].setdefault(name, {'count': 0, 'last_seen': 0.0})
+            entry['count'] += seen['count']
+            entry['last_seen'] = max(entry['last_seen'], seen['last_seen'])
+    return totals
+
+class Coordinator:
+    """
+    Shares the cameras of a fleet config between worker nodes, each a
+    process_multiple_streams process on some host.
+
+    Workers register with their capacity (seconds of processing per
+    second, about their inference cores) and then send a heartbeat every
+    heartbeat_interval seconds. The reply holds the stream configs the
+    worker should run. Streams are placed with assign_streams, weighted by
+    the cost every worker measures for its streams. They are rebalanced
+    when a node joins, when one leaves or misses heartbeats for
+    node_timeout seconds, and when a node stays above `overload` of its
+    capacity (at most once per rebalance_interval); then only streams of
+    that node move. Config file changes only place new streams and drop
+    removed ones. An assignment that did not change is not republished.
+
+    Heartbeats also carry every stream's stats and recognition results,
+    which are aggregated here and served as JSON on /status and in
+    Prometheus format on /metrics.
+    """
+
+    def __init__(self, config_path=None, stream_configs=None, port=8700, host='127.0.0.1',
+                 heartbeat_interval=2.0, node_timeout=None, epsilon=0.25, overload=0.9,
+                 rebalance_interval=30.0, smoothing=0.3):
+        self.config_path = config_path
+        self.port = port
+        self.host = host
+        self.heartbeat_interval = heartbeat_interval
+        self.node_timeout = node_timeout or 3 * heartbeat_interval + 1
+        self.epsilon = epsilon
+        self.overload = overload
+        self.rebalance_interval = rebalance_interval
+        self.smoothing = smoothing
+        self.nodes = {}
+        self.streams = {}
+        self.costs = {}
+        self.assignment = {}
+        self.results = {}
+        # One entry per rebalance: time, reason, moved and assigned streams
+        self.history = []
+        self.generation = 0
+        self._last_overload_rebalance = 0.0
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server = None
+        self._thread = None
+        if stream_configs is not None:
+            self._set_streams(stream_configs)
+
+    def start(self):
+        if self.config_path is not None:
+            self._mtime = os.stat(self.config_path).st_mtime_ns
+            self._set_streams(load_fleet_config(self.config_path))
+        coordinator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, status, body, content_type='application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == '/status':
+                    self.send_body(200, json.dumps(coordinator.status()).encode())
+                elif path == '/metrics':
+                    self.send_body(200, coordinator.render_prometheus().encode(),
+                                   'text/plain; version=0.0.4')
+                else:
+                    self.send_body(404, b'{"error": "Not found"}')
+
+            def do_POST(self):
+                handlers = {'/register': coordinator.register,
+                            '/heartbeat': coordinator.heartbeat,
+                            '/leave': coordinator.leave}
+                handler = handlers.get(urlparse(self.path).path)
+                try:
+                    message = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                    reply = handler(message) if handler is not None else None
+                except (TypeError, ValueError, KeyError) as e:
+                    self.send_body(400, json.dumps({'error': str(e)}).encode())
+                    return
+                if reply is None:
+                    self.send_body(404, b'{"error": "Unknown node or path"}')
+                else:
+                    self.send_body(200, json.dumps(reply).encode())
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever, name='coordinator-http')
+        thread.daemon = True
+        thread.start()
+        self._thread = threading.Thread(target=self._watch, name='coordinator-watch')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info(f"Coordinator on http://{self.host}:{self.port}/ "
+                    f"for {len(self.streams)} streams")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def register(self, message):
+        """A worker starts or restarts: {'node', 'capacity'}"""
+        name = message['node']
+        capacity = float(message['capacity'])
+        if capacity <= 0:
+            raise ValueError("Capacity must be positive")
+        with self._lock:
+            node = self.nodes.get(name)
+            joined = node is None or node['capacity'] != capacity
+            self.nodes[name] = {'capacity': capacity, 'last_seen': time.time(),
+                                'cpu': None, 'streams': {}, 'overloaded': 0}
+            logger.info(f"Node {name} registered with capacity {capacity:g}")
+            if joined:
+                self._rebalance('join', keep=False)
+        return {'heartbeat_interval': self.heartbeat_interval}
+
+    def heartbeat(self, message):
+        """
+        A worker reports {'node', 'cpu', 'streams': {name: stats with
+        'cost'}, 'results'}
+        Returns:
+            {'generation', 'streams': [configs]}, or None for an unknown node
+        """
+        name = message['node']
+        with self._lock:
+            node = self.nodes.get(name)
+            if node is None:
+                return None
+            node['last_seen'] = time.time()
+            node['cpu'] = message.get('cpu')
+            node['streams'] = message.get('streams', {})
+            for stream, stats in node['streams'].items():
+                cost = stats.get('cost')
+                # Reports of a stream that just moved away are stale
+                if cost is None or self.assignment.get(stream) != name:
+                    continue
+                old = self.costs.get(stream)
+                self.costs[stream] = cost if old is None else (
+                    self.smoothing * cost + (1 - self.smoothing) * old)
+            merge_results(self.results, message.get('results', {}))
+
+            if self._node_load(name) > self.overload:
+                node['overloaded'] += 1
+            else:
+                node['overloaded'] = 0
+            # Two reports in a row, so one busy interval does not move streams
+            if (node['overloaded'] >= 2
+                    and time.time() - self._last_overload_rebalance >= self.rebalance_interval):
+                self._last_overload_rebalance = time.time()
+                logger.warning(f"Node {name} at {self._node_load(name):.0%} of its capacity")
+                self._relieve(name)
+            return {'generation': self.generation,
+                    'streams': [self.streams[stream]
+                                for stream, owner in sorted(self.assignment.items())
+                                if owner == name]}
+
+    def leave(self, message):
+        """A worker shuts down: {'node'}"""
+        with self._lock:
+            if self.nodes.pop(message['node'], None) is None:
+                return None
+            logger.info(f"Node {message['node']} left")
+            self._rebalance('leave')
+        return {}
+
+    def status(self):
+        """Nodes, stream placement, worker stats and aggregated results"""
+        with self._lock:
+            now = time.time()
+            streams = {}
+            for name, node in self.nodes.items():
+                for stream, stats in node['streams'].items():
+                    if self.assignment.get(stream) == name:
+                        streams[stream] = dict(stats, node=name)
+            for stream in self.streams:
+                entry = streams.setdefault(stream, {'node': self.assignment.get(stream)})
+                entry['cost'] = self.costs.get(stream)
+            return {
+                'generation': self.generation,
+                'nodes': {name: {'capacity': node['capacity'],
+                                 'load': self._node_load(name),
+                                 'cpu': node['cpu'],
+                                 'streams': sum(1 for owner in self.assignment.values()
+                                                if owner == name),
+                                 'last_seen': now - node['last_seen']}
+                          for name, node in self.nodes.items()},
+                'streams': streams,
+                'unassigned': sorted(s for s in self.streams if s not in self.assignment),
+                'fps': sum(stats.get('fps') or 0 for stats in streams.values()),
+                'rebalances': len(self.history),
+                'results': self.results,
+            }
+
+    def render_prometheus(self):
+        """Cluster state and worker stream stats in the Prometheus text format"""
+        status = self.status()
+        lines = ['# TYPE facerec_cluster_rebalances_total counter',
+                 f'facerec_cluster_rebalances_total {status["rebalances"]}',
+                 '# TYPE facerec_cluster_moved_streams_total counter',
+                 f'facerec_cluster_moved_streams_total {sum(h["moved"] for h in self.history)}']
+        for field in ('capacity', 'load', 'streams'):
+            lines.append(f'# TYPE facerec_cluster_node_{field} gauge')
+            for name, node in status['nodes'].items():
+                lines.append(f'facerec_cluster_node_{field}{{node="{_escape(name)}"}} '
+                             f'{node[field]}')
+        for field, kind in (('cost', 'gauge'), ('fps', 'gauge'),
+                            ('processed', 'counter'), ('dropped', 'counter')):
+            metric = f'facerec_cluster_{field}' + ('_total' if kind == 'counter' else '')
+            lines.append(f'# TYPE {metric} {kind}')
+            for stream, stats in status['streams'].items():
+                if stats.get(field) is not None:
+                    lines.append(f'{metric}{{stream="{_escape(stream)}",'
+                                 f'node="{_escape(stats["node"])}"}} {stats[field]}')
+        return '\n'.join(lines) + '\n'
+
+    def _set_streams(self, stream_configs):
+        streams = {}
+        for config in stream_configs:
+            if not is_valid_url(config['url']):
+                logger.error(f"Invalid URL format for stream {config['name']}")
+                continue
+            streams[config['name']] = config
+        with self._lock:
+            if streams == self.streams:
+                return
+            self.streams = streams
+            self.costs = {name: cost for name, cost in self.costs.items() if name in streams}
+            self._rebalance('config')
+
+    def _stream_costs(self):
+        measured = [self.costs[s] for s in self.streams if s in self.costs]
+        default = sum(measured) / len(measured) if measured else DEFAULT_STREAM_COST
+        return {stream: self.costs.get(stream, default) for stream in self.streams}
+
+    def _node_load(self, name):
+        """Share of a node's capacity in use, by stream costs or measured CPU"""
+        node = self.nodes[name]
+        costs = self._stream_costs()
+        load = sum(costs[s] for s, owner in self.assignment.items() if owner == name)
+        return max(load, node['cpu'] or 0.0) / node['capacity']
+
+    def _rebalance(self, reason, keep=True):
+        """
+        Place the streams on the current nodes. With keep, placed streams on
+        nodes that are still there stay put and only the others are placed.
+        """
+        capacities = {name: node['capacity'] for name, node in self.nodes.items()}
+        self._publish(reason, assign_streams(self._stream_costs(), capacities, self.epsilon,
+                                             self.assignment if keep else None))
+
+    def _relieve(self, name):
+        """
+        Move streams off an overloaded node. All other placements stay;
+        the node keeps its costliest streams that fit in `overload` of its
+        capacity, less the CPU it uses beyond its streams' measured cost,
+        and only the rest are placed on the other nodes.
+        """
+        node = self.nodes[name]
+        costs = self._stream_costs()
+        mine = sorted((s for s, owner in self.assignment.items() if owner == name),
+                      key=lambda s: (-costs[s], s))
+        load = sum(costs[s] for s in mine)
+        budget = self.overload * node['capacity'] - max(0.0, (node['cpu'] or 0.0) - load)
+        kept = {}
+        for stream in mine:
+            if costs[stream] <= budget:
+                kept[stream] = name
+                budget -= costs[stream]
+        others = {n: other['capacity'] for n, other in self.nodes.items() if n != name}
+        if len(kept) == len(mine) or not others:
+            return
+        placed = assign_streams({s: c for s, c in costs.items() if s not in kept}, others,
+                                self.epsilon,
+                                {s: n for s, n in self.assignment.items() if n != name})
+        self._publish('overload', dict(placed, **kept))
+
+    def _publish(self, reason, assignment):
+        """Make an assignment current; workers pick it up by its new generation"""
+        previous = self.assignment
+        if assignment == previous:
+            return
+        moved = sum(1 for stream, node in assignment.items()
+                    if previous.get(stream) not in (None, node))
+        self.assignment = assignment
+        self.generation += 1
+        self.history.append({'time': time.time(), 'reason': reason, 'moved': moved,
+                             'assigned': len(assignment), 'nodes': len(self.nodes)})
+        logger.info(f"Rebalanced after {reason}: {len(assignment)} streams on "
+                    f"{len(self.nodes)} nodes, {moved} moved")
+
+    def _watch(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            now = time.time()
+            with self._lock:
+                lost = [name for name, node in self.nodes.items()
+                        if now - node['last_seen'] > self.node_timeout]
+                for name in lost:
+                    del self.nodes[name]
+                    logger.warning(f"Node {name} missed its heartbeats, reassigning its streams")
+                if lost:
+                    self._rebalance('lost')
+            if self.config_path is None:
+                continue
+            try:
+                mtime = os.stat(self.config_path).st_mtime_ns
+                if mtime == self._mtime:
+                    continue
+                logger.info(f"Reloading {self.config_path}")
+                self._set_streams(load_fleet_config(self.config_path))
+                # Set only once loaded, so a failed reload is retried
+                self._mtime = mtime
+            except Exception as e:
+                logger.error(f"Keeping the current streams, config reload failed: {str(e)}")
+
+class ClusterNode:
+    """
+    Worker side of a Coordinator, running the streams it assigns on a
+    FleetManager. Every heartbeat reports each stream's stats and measured
+    cost (seconds spent in COST_STAGES per second), the process CPU use and
+    the results recorded since the last report. While the coordinator
+    cannot be reached, the current streams keep running.
+    Args:
+        capacity: Seconds of processing this node offers per second
+            (defaults to the number of CPU cores)
+    """
+
+    def __init__(self, coordinator_url, fleet, name=None, capacity=None,
+                 registry=REGISTRY, timeout=5.0):
+        self.url = coordinator_url.rstrip('/')
+        self.fleet = fleet
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.capacity = capacity or os.cpu_count() or 1
+        self.registry = registry
+        self.timeout = timeout
+        self.generation = None
+        self.session = requests.Session()
+        self._results = {}
+        self._busy = {}
+        self._cpu = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='cluster-node')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop reporting and hand the streams back to the coordinator"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+        try:
+            self._post('/leave', {'node': self.name})
+        except requests.RequestException as e:
+            logger.warning(f"Could not tell the coordinator this node leaves: {str(e)}")
+        self.session.close()
+
+    def record(self, result):
+        """Add a frame result to the aggregates of the next report"""
+        with self._lock:
+            aggregate = self._results.setdefault(
+                result['stream'], {'frames': 0, 'faces': 0, 'names': {}})
+            aggregate['frames'] += 1
+            aggregate['faces'] += len(result['faces'])
+            for face in result['faces']:
+                if face['name'] != 'unknown':
+                    seen = aggregate['names'].setdefault(
+                        face['name'], {'count': 0, 'last_seen': 0.0})
+                    seen['count'] += 1
+                    seen['last_seen'] = result['timestamp']
+
+    def _post(self, path, message):
+        response = self.session.post(self.url + path, json=message, timeout=self.timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def _report(self, elapsed):
+        streams = {}
+        for name, stats in self.fleet.get_stats().items():
+            metrics = self.registry.streams.get(name)
+            if metrics is None:
+                continue
+            snapshot = metrics.snapshot()
+            busy = sum(snapshot['stages'][stage]['sum'] for stage in COST_STAGES
+                       if stage in snapshot['stages'])
+            previous = self._busy.get(name)
+            self._busy[name] = busy
+            streams[name] = dict(
+                stats, fps=snapshot['fps'],
+                cost=(busy - previous) / elapsed if previous is not None and elapsed else None)
+        self._busy = {name: busy for name, busy in self._busy.items() if name in streams}
+
+        cpu = time.process_time()
+        usage = (cpu - self._cpu) / elapsed if self._cpu is not None and elapsed else None
+        self._cpu = cpu
+        with self._lock:
+            results, self._results = self._results, {}
+        return {'node': self.name, 'cpu': usage, 'streams': streams, 'results': results}
+
+    def _run(self):
+        interval = 2.0
+        registered = False
+        last = None
+        while not self._stop.is_set():
+            report = None
+            try:
+                if not registered:
+                    reply = self._post('/register', {'node': self.name,
+                                                     'capacity': self.capacity})
+                    interval = reply['heartbeat_interval']
+                    registered = True
+                    logger.info(f"Registered with {self.url} as {self.name}")
+                now = time.perf_counter()
+                report = self._report(now - last if last is not None else 0.0)
+                last = now
+                reply = self._post('/heartbeat', report)
+                if reply is None:
+                    # The coordinator restarted or timed this node out
+                    registered = False
+                    self.generation = None
+                    continue
+                if reply['generation'] != self.generation:
+                    self.fleet.apply(reply['streams'])
+                    self.generation = reply['generation']
+            except (requests.RequestException, ValueError, KeyError) as e:
+                if report is not None:
+                    # Keep the results for the next report
+                    with self._lock:
+                        self._results = merge_results(report['results'], self._results)
+                logger.warning(f"Coordinator unreachable, keeping "
+                               f"{len(self.fleet.processors)} streams: {str(e)}")
+            self._stop.wait(interval)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Share the cameras of a config file between worker nodes')
+    parser.add_argument('--config', default='cameras.json',
+                        help='Camera config file, reloaded when it changes')
+    parser.add_argument('--port', type=int, default=8700)
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address to listen on (0.0.0.0 for other hosts)')
+    parser.add_argument('--heartbeat-interval', type=float, default=2.0,
+                        help='Seconds between worker reports')
+    parser.add_argument('--node-timeout', type=float,
+                        help='Seconds without a report before a node counts as lost')
+    parser.add_argument('--epsilon', type=float, default=0.25,
+                        help='Load above its fair share a node may get')
+    parser.add_argument('--overload', type=float, default=0.9,
+                        help='Share of its capacity above which a node is relieved')
+    parser.add_argument('--rebalance-interval', type=float, default=30.0,
+                        help='Least seconds between overload rebalances')
+    args = parser.parse_args()
+
+    coordinator = Coordinator(args.config, port=args.port, host=args.host,
+                              heartbeat_interval=args.heartbeat_interval,
+                              node_timeout=args.node_timeout, epsilon=args.epsilon,
+                              overload=args.overload,
+                              rebalance_interval=args.rebalance_interval).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Program terminated by user")
+    finally:
+        coordinator.stop()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
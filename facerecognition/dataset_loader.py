@@ -0,0 +1,228 @@
+import cv2
+import io
+import json
+import logging
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = 'trainer/cache'
+
+def list_images(dataset_dir="dataset"):
+    """Return the sorted .jpg file names of the dataset"""
+    if not os.path.exists(dataset_dir):
+        return []
+    return sorted(f for f in os.listdir(dataset_dir) if f.endswith(".jpg"))
+
+def face_id_of(image_file):
+    """Face ID encoded in a dataset file name (name.id.count.jpg)"""
+    return int(image_file.split('.')[1])
+
+def decode_image(path, size=None):
+    """Read one image as grayscale, optionally resized to (width, height)"""
+    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if img is not None and size is not None and img.shape[::-1] != tuple(size):
+        img = cv2.resize(img, tuple(size), interpolation=cv2.INTER_AREA)
+    return img
+
+def _decode_chunks(image_files, dataset_dir, size, chunk_size, workers):
+    # cv2.imread releases the GIL, so threads decode in parallel. Only one
+    # chunk is in flight at a time to keep memory bounded.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(image_files), chunk_size):
+            chunk = image_files[start:start + chunk_size]
+            paths = [os.path.join(dataset_dir, f) for f in chunk]
+            images = pool.map(decode_image, paths, [size] * len(paths))
+            yield chunk, list(images)
+
+def iter_faces(image_files, dataset_dir="dataset", size=None, chunk_size=256,
+               workers=None, cache=None):
+    """
+    Decode dataset images in a thread pool and yield them in chunks
+    Args:
+        image_files: File names inside dataset_dir
+        size: Optional (width, height) every face is resized to. Chunks are
+            then uint8 arrays of shape (n, height, width), otherwise lists.
+        chunk_size: Number of images per chunk
+        workers: Decoder threads (defaults to the number of CPU cores)
+        cache: Optional FaceCache; requires size. Images already in the
+            cache with an unchanged mtime are not decoded again.
+    Yields:
+        (faces, ids) tuples; unreadable images are skipped
+    """
+    image_files = list(image_files)
+    if cache is not None:
+        if size is not None and tuple(size) != tuple(cache.size):
+            raise ValueError("Cache size does not match the requested size")
+        yield from cache.iter_faces(image_files, dataset_dir, chunk_size, workers)
+        return
+
+    for chunk, images in _decode_chunks(image_files, dataset_dir, size,
+                                        chunk_size, workers):
+        faces = []
+        ids = []
+        for image_file, img in zip(chunk, images):
+            if img is None:
+                logger.warning(f"Skipping unreadable image {image_file}")
+                continue
+            faces.append(img)
+            ids.append(face_id_of(image_file))
+        if faces:
+            yield (np.stack(faces) if size is not None else faces), ids
+
+class FaceCache:
+    """
+    Memory-mapped cache of decoded, resized dataset faces.
+
+    faces.npy holds one uint8 row per image and index.json maps each file
+    name to its row and the mtime it was decoded at. Syncing only decodes
+    new or modified images, so repeated trainings skip JPEG decoding.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, size=(100, 100)):
+        self.cache_dir = cache_dir
+        self.size = tuple(size)
+        self.faces_path = os.path.join(cache_dir, 'faces.npy')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+
+    def _load_index(self):
+        if not (os.path.exists(self.index_path) and os.path.exists(self.faces_path)):
+            return {}
+        with open(self.index_path, "r") as f:
+            data = json.load(f)
+        if tuple(data.get('size', ())) != self.size:
+            return {}
+        return data['files']
+
+    def sync(self, image_files, dataset_dir="dataset", chunk_size=256, workers=None):
+        """
+        Bring the cache in line with image_files. New images are appended
+        and modified ones decoded into their existing rows; faces.npy is
+        only rewritten (compacted) when images were removed from it.
+        Returns:
+            (faces, index): read-only memmap of all faces and the index dict
+        """
+        if not image_files:
+            width, height = self.size
+            return np.empty((0, height, width), np.uint8), {}
+
+        index = self._load_index()
+        mtimes = {f: os.path.getmtime(os.path.join(dataset_dir, f)) for f in image_files}
+        wanted = set(image_files)
+        missing = [f for f in image_files
+                   if f not in index or index[f]['mtime'] != mtimes[f]]
+        if not missing and len(index) == len(wanted):
+            return np.load(self.faces_path, mmap_mode='r'), index
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if not index or any(f not in wanted for f in index):
+            out, index = self._compact(image_files, index, mtimes, missing)
+        else:
+            out = self._grow(len(index) + sum(f not in index for f in missing))
+        if out is None:
+            # The header had no room for the new shape
+            out, index = self._compact(image_files, index, mtimes, missing)
+
+        next_row = max((entry['row'] for entry in index.values()), default=-1) + 1
+        for chunk, images in _decode_chunks(missing, dataset_dir, self.size,
+                                            chunk_size, workers):
+            for image_file, img in zip(chunk, images):
+                if image_file in index:
+                    row = index[image_file]['row']
+                else:
+                    row, next_row = next_row, next_row + 1
+                ok = img is not None
+                if ok:
+                    out[row] = img
+                else:
+                    logger.warning(f"Skipping unreadable image {image_file}")
+                index[image_file] = {'row': row, 'mtime': mtimes[image_file], 'ok': ok}
+
+        out.flush()
+        del out
+        with open(self.index_path, "w") as f:
+            json.dump({'size': list(self.size), 'files': index}, f)
+        logger.info(f"Face cache: {len(missing)} images decoded, "
+                    f"{len(image_files) - len(missing)} reused")
+        return np.load(self.faces_path, mmap_mode='r'), index
+
+    def _grow(self, rows):
+        """
+        Extend faces.npy to `rows` rows in place and return it as a writable
+        memmap, or None when its header cannot hold the new shape
+        """
+        width, height = self.size
+        with open(self.faces_path, 'r+b') as f:
+            np.lib.format.read_magic(f)
+            shape, _, _ = np.lib.format.read_array_header_1_0(f)
+            offset = f.tell()
+            header = io.BytesIO()
+            np.lib.format.write_array_header_1_0(
+                header, {'descr': '|u1', 'fortran_order': False,
+                         'shape': (rows, height, width)})
+            if len(header.getvalue()) != offset:
+                return None
+            if rows != shape[0]:
+                f.seek(0)
+                f.write(header.getvalue())
+                f.truncate(offset + rows * height * width)
+        return np.lib.format.open_memmap(self.faces_path, mode='r+')
+
+    def _compact(self, image_files, index, mtimes, missing):
+        """
+        Rewrite faces.npy with one row per image_files entry, in order.
+        Returns the writable memmap and the new index; the rows of
+        `missing` are left for the caller to decode.
+        """
+        tmp_path = self.faces_path + '.tmp.npy'
+        width, height = self.size
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                        shape=(len(image_files), height, width))
+        stale = set(missing)
+        new_index = {}
+        runs = []
+        for row, image_file in enumerate(image_files):
+            if image_file in stale:
+                new_index[image_file] = {'row': row}
+                continue
+            old_row = index[image_file]['row']
+            new_index[image_file] = dict(index[image_file], row=row)
+            # Copy runs of consecutive rows with one slice assignment each
+            if runs and (runs[-1][0] + runs[-1][2], runs[-1][1] + runs[-1][2]) == (old_row, row):
+                runs[-1][2] += 1
+            else:
+                runs.append([old_row, row, 1])
+        if runs:
+            old = np.load(self.faces_path, mmap_mode='r')
+            for old_row, row, count in runs:
+                out[row:row + count] = old[old_row:old_row + count]
+            del old
+        out.flush()
+        del out
+        os.replace(tmp_path, self.faces_path)
+        # The rows of stale images are filled in by sync()
+        return np.lib.format.open_memmap(self.faces_path, mode='r+'), new_index
+
+    def iter_faces(self, image_files, dataset_dir="dataset", chunk_size=256,
+                   workers=None, all_files=None):
+        """
+        Yield (faces, ids) chunks of cached faces
+        Args:
+            image_files: Files to yield
+            all_files: Full dataset the cache should hold (defaults to
+                image_files); lets a caller read a subset without shrinking
+                the cache
+        """
+        faces, index = self.sync(all_files if all_files is not None else image_files,
+                                 dataset_dir, chunk_size, workers)
+        usable = [f for f in image_files if index[f].get('ok', True)]
+        for start in range(0, len(usable), chunk_size):
+            chunk = usable[start:start + chunk_size]
+            rows = [index[f]['row'] for f in chunk]
+            if rows == list(range(rows[0], rows[0] + len(rows))):
+                batch = faces[rows[0]:rows[0] + len(rows)]
+            else:
+                batch = faces[rows]
+            yield batch, [face_id_of(f) for f in chunk]
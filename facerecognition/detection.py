@@ -0,0 +1,190 @@
+import cv2
+import json
+import os
+import threading
+
+# Default model files of the backends. The LBP cascade ships with OpenCV
+# (data/lbpcascades), the YuNet model with the OpenCV model zoo
+# (models/face_detection_yunet).
+HAAR_MODEL = 'haarcascade_frontalface_default.xml'
+LBP_MODEL = 'lbpcascade_frontalface_improved.xml'
+YUNET_MODEL = 'face_detection_yunet_2023mar.onnx'
+
+def load_cascade(cascade_path=HAAR_MODEL):
+    """Load a face cascade classifier"""
+    face_cascade = cv2.CascadeClassifier(cascade_path)
+    if face_cascade.empty():
+        raise IOError('Unable to load the face cascade classifier')
+    return face_cascade
+
+class CascadeDetector:
+    """
+    Haar or LBP cascade. LBP cascades use integer features and run several
+    times faster than Haar at a somewhat lower recall. The score of a face
+    is the number of neighbouring detections merged into it.
+    """
+
+    def __init__(self, model=HAAR_MODEL):
+        self.cascade = load_cascade(model)
+
+    def detect(self, gray, min_size, scaleFactor=1.3, minNeighbors=5):
+        boxes, neighbours = self.cascade.detectMultiScale2(
+            gray, scaleFactor=scaleFactor, minNeighbors=minNeighbors, minSize=min_size)
+        return [(int(x), int(y), int(w), int(h), float(n))
+                for (x, y, w, h), n in zip(boxes, neighbours)]
+
+class YuNetDetector:
+    """
+    OpenCV's FaceDetectorYN DNN on the CPU. Images larger than input_size
+    are shrunk to fit it before inference, which bounds the cost per frame
+    whatever the camera resolution. The score is the face probability;
+    scaleFactor and minNeighbors do not apply.
+    Args:
+        threads: OpenCV worker threads (cv2.setNumThreads, process wide)
+    """
+
+    def __init__(self, model=YUNET_MODEL, input_size=(320, 320), score_threshold=0.8,
+                 nms_threshold=0.3, top_k=100, threads=None):
+        if threads:
+            cv2.setNumThreads(threads)
+        self.input_size = tuple(input_size) if input_size else None
+        self.net = cv2.FaceDetectorYN.create(model, '', self.input_size or (320, 320),
+                                             score_threshold, nms_threshold, top_k)
+        self._size = None
+
+    def detect(self, gray, min_size, **params):
+        height, width = gray.shape[:2]
+        factor = 1.0
+        if self.input_size is not None:
+            factor = min(1.0, self.input_size[0] / width, self.input_size[1] / height)
+        image = gray
+        if factor < 1.0:
+            image = cv2.resize(gray, (max(1, round(width * factor)), max(1, round(height * factor))),
+                               interpolation=cv2.INTER_AREA)
+        if image.ndim == 2:
+            # The network takes three channels
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        size = (image.shape[1], image.shape[0])
+        if size != self._size:
+            self.net.setInputSize(size)
+            self._size = size
+
+        _, detections = self.net.detect(image)
+        faces = []
+        for face in detections if detections is not None else ():
+            # Boxes may reach over the image border
+            x, y, w, h = face[:4] / factor
+            x0, y0 = max(0, int(x)), max(0, int(y))
+            x1, y1 = min(width, int(x + w)), min(height, int(y + h))
+            if x1 - x0 >= min_size[0] and y1 - y0 >= min_size[1]:
+                faces.append((x0, y0, x1 - x0, y1 - y0, float(face[14])))
+        return faces
+
+# Backend name -> (class, default options)
+BACKENDS = {
+    'haar': (CascadeDetector, {'model': HAAR_MODEL}),
+    'lbp': (CascadeDetector, {'model': LBP_MODEL}),
+    'yunet': (YuNetDetector, {'model': YUNET_MODEL}),
+}
+
+def detector_config(config=None):
+    """
+    Complete a detector config with the backend's defaults and check that
+    its model file exists
+    Args:
+        config: None (Haar), a backend name ('haar', 'lbp', 'yunet'), a
+            JSON object string or a dict with 'backend' and the backend's
+            options, e.g. {"backend": "yunet", "input_size": [320, 240],
+            "threads": 2}
+    """
+    if config is None:
+        config = {}
+    elif isinstance(config, str):
+        config = json.loads(config) if config.lstrip().startswith('{') else {'backend': config}
+    backend = config.get('backend', 'haar')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend: {backend}")
+    config = {'backend': backend, **BACKENDS[backend][1], **config}
+    if not os.path.exists(config['model']):
+        raise IOError(f"Detector model {config['model']} not found")
+    return config
+
+def load_detector(config=None):
+    """Create the detector of a config (see detector_config)"""
+    config = detector_config(config)
+    backend_class = BACKENDS[config['backend']][0]
+    return backend_class(**{k: v for k, v in config.items() if k != 'backend'})
+
+def detector_key(config=None):
+    """
+    Resolved detector config as a string, for Detectors.get_key(). Lets a
+    stream resolve its config once rather than on every frame.
+    """
+    return json.dumps(detector_config(config), sort_keys=True)
+
+class Detectors:
+    """
+    Detectors by config, loaded on first use in every thread. Streams can
+    pick different backends from one Detectors, and no OpenCV detector is
+    ever shared between threads.
+    """
+
+    def __init__(self, default=None):
+        self.default = detector_config(default)
+        self.default_key = json.dumps(self.default, sort_keys=True)
+        self._local = threading.local()
+
+    def get(self, config=None):
+        """The calling thread's detector for a config (the default if None)"""
+        return self.get_key(None if config is None else detector_key(config))
+
+    def get_key(self, key=None):
+        """The calling thread's detector for a detector_key() (the default if None)"""
+        if key is None:
+            key = self.default_key
+        loaded = self._local.__dict__.setdefault('loaded', {})
+        detector = loaded.get(key)
+        if detector is None:
+            # The key is the resolved config as a JSON object
+            detector = loaded[key] = load_detector(key)
+        return detector
+
+def detect_faces(detector, gray, regions=None, scale=1.0, scaleFactor=1.3,
+                 minNeighbors=5, minSize=(30, 30), scores=False):
+    """
+    Detect faces in the whole frame or only inside the given regions
+    Args:
+        detector: Backend to run (see load_detector)
+        gray: Grayscale frame
+        regions: Optional list of (x, y, w, h) areas to scan
+        scale: Run the detector on a copy resized by this factor (e.g. 0.5
+            for half resolution). minSize is given in full-resolution
+            pixels; note a cascade cannot find faces smaller than its own
+            window (24px for the frontal face cascade) in the resized copy.
+        scaleFactor, minNeighbors: Cascade parameters
+        scores: Also return every face's score
+    Returns:
+        List of (x, y, w, h) face boxes in full-resolution coordinates, so
+        ROIs for the recognizer can still be cut from the original gray;
+        (x, y, w, h, score) with scores=True
+    """
+    if regions is None:
+        regions = [(0, 0, gray.shape[1], gray.shape[0])]
+
+    scaled_min = (max(1, int(minSize[0] * scale)), max(1, int(minSize[1] * scale)))
+
+    faces = []
+    for (rx, ry, rw, rh) in regions:
+        if rw < minSize[0] or rh < minSize[1]:
+            continue
+        area = gray[ry:ry+rh, rx:rx+rw]
+        if scale != 1.0:
+            area = cv2.resize(area, (max(1, int(rw * scale)), max(1, int(rh * scale))),
+                              interpolation=cv2.INTER_AREA)
+        found = detector.detect(area, scaled_min, scaleFactor=scaleFactor,
+                                minNeighbors=minNeighbors)
+        for (x, y, w, h, score) in found:
+            box = (int(x / scale) + rx, int(y / scale) + ry,
+                   int(w / scale), int(h / scale))
+            faces.append(box + (score,) if scores else box)
+    return faces
@@ -0,0 +1,224 @@
+import argparse
+import cv2
+import logging
+import numpy as np
+import os
+import queue
+import threading
+from batch_recognizer import FACE_SIZE
+from detection import detect_faces
+from frame_buffer import create_frame_buffer
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def face_quality(face):
+    """
+    Score a grayscale face crop resized to the enrollment size
+    Returns:
+        (sharpness, asymmetry): variance of the Laplacian (higher is
+        sharper) and the mean difference between the face and its mirror
+        image in [0, 1] (frontal faces are close to symmetric)
+    """
+    sharpness = cv2.Laplacian(face, cv2.CV_64F).var()
+    asymmetry = cv2.absdiff(face, cv2.flip(face, 1)).mean() / 255.0
+    return sharpness, asymmetry
+
+def face_hash(face):
+    """64-bit difference hash of a face crop, robust to small changes"""
+    small = cv2.resize(face, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+def hash_distance(a, b):
+    return bin(a ^ b).count('1')
+
+class EnrollmentSession:
+    """
+    Collects the training samples of one person from a stream of frames.
+
+    Only the largest face of a frame is considered. It is rejected when it
+    is too small, blurry, turned away (asymmetric) or a near duplicate of
+    an accepted sample (difference hash within `min_hash_distance` bits);
+    accepted faces are saved resized to `size`, so the dataset holds a few
+    varied, uniform samples instead of many near-identical ones.
+    """
+
+    def __init__(self, name, face_id, detector, samples=30,
+                 dataset_dir="dataset", size=FACE_SIZE, min_face_size=80,
+                 min_sharpness=40.0, max_asymmetry=0.25, min_hash_distance=6):
+        self.name = name
+        self.face_id = face_id
+        # Detector backend (detection.load_detector)
+        self.detector = detector
+        self.samples = samples
+        self.dataset_dir = dataset_dir
+        self.size = tuple(size)
+        self.min_face_size = min_face_size
+        self.min_sharpness = min_sharpness
+        self.max_asymmetry = max_asymmetry
+        self.min_hash_distance = min_hash_distance
+        self.hashes = []
+        self.last_box = None
+        self.stats = {'frames': 0, 'no_face': 0, 'too_small': 0, 'blurry': 0,
+                      'off_pose': 0, 'duplicate': 0, 'accepted': 0}
+
+    @property
+    def done(self):
+        return self.stats['accepted'] >= self.samples
+
+    def offer(self, frame):
+        """
+        Consider one BGR or grayscale frame
+        Returns:
+            The rejection reason, or 'accepted'
+        """
+        self.stats['frames'] += 1
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = detect_faces(self.detector, gray)
+        if not faces:
+            return self._count('no_face')
+
+        # Other people in the frame must not end up in this person's samples
+        x, y, w, h = max(faces, key=lambda box: box[2] * box[3])
+        self.last_box = (x, y, w, h)
+        if min(w, h) < self.min_face_size:
+            return self._count('too_small')
+
+        face = cv2.resize(gray[y:y+h, x:x+w], self.size, interpolation=cv2.INTER_AREA)
+        sharpness, asymmetry = face_quality(face)
+        if sharpness < self.min_sharpness:
+            return self._count('blurry')
+        if asymmetry > self.max_asymmetry:
+            return self._count('off_pose')
+
+        fingerprint = face_hash(face)
+        if any(hash_distance(fingerprint, h) < self.min_hash_distance
+               for h in self.hashes):
+            return self._count('duplicate')
+
+        self.hashes.append(fingerprint)
+        self._count('accepted')
+        cv2.imwrite(os.path.join(self.dataset_dir,
+                                 f"{self.name}.{self.face_id}.{self.stats['accepted']}.jpg"),
+                    face, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        return 'accepted'
+
+    def _count(self, outcome):
+        self.stats[outcome] += 1
+        return outcome
+
+def read_frames(source):
+    """
+    Yield the frames of a camera index, a video file or a folder of images
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        for image_file in sorted(os.listdir(source)):
+            if image_file.lower().endswith(IMAGE_EXTENSIONS):
+                image = cv2.imread(os.path.join(source, image_file))
+                if image is not None:
+                    yield image
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise IOError(f"Unable to open {source}")
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+def is_live_source(source):
+    return isinstance(source, int) or (isinstance(source, str) and source.isdigit())
+
+def enroll(session, source=0, show=None):
+    """
+    Feed frames from a source into an EnrollmentSession until it has all
+    samples or the source ends.
+
+    Frames are read on the calling thread and scored on a worker thread.
+    A live camera keeps only its newest frame, so the preview never waits
+    for scoring; files and folders hand over every frame.
+    Args:
+        source: Camera index, video file or image folder
+        show: Display a preview window (defaults to True for cameras)
+    Returns:
+        The session's stats
+    """
+    live = is_live_source(source)
+    if live:
+        source = int(source)
+    show = live if show is None else show
+    frames = create_frame_buffer('latest') if live else queue.Queue(maxsize=8)
+    finished = threading.Event()
+
+    def process():
+        while not (session.done or finished.is_set() and frames.empty()):
+            try:
+                frame = frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            session.offer(frame)
+
+    worker = threading.Thread(target=process, name='enrollment')
+    worker.daemon = True
+    worker.start()
+
+    try:
+        for frame in read_frames(source):
+            if session.done or not worker.is_alive():
+                break
+            if live:
+                frames.put(frame)
+            else:
+                # Blocks while the worker is behind, so no frame is skipped
+                while worker.is_alive() and not session.done:
+                    try:
+                        frames.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+
+            if show:
+                preview = frame.copy()
+                if session.last_box is not None:
+                    x, y, w, h = session.last_box
+                    cv2.rectangle(preview, (x, y), (x+w, y+h), (255, 0, 0), 2)
+                cv2.putText(preview, f"{session.stats['accepted']}/{session.samples}",
+                            (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+                cv2.imshow('Collecting Faces', preview)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+    finally:
+        finished.set()
+        worker.join()
+        if show:
+            cv2.destroyAllWindows()
+
+    logger.info(f"Enrollment of {session.name}: {session.stats}")
+    return session.stats
+
+if __name__ == "__main__":
+    from train_faces import collect_face_data, train_model
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Enroll a person from a camera, video or image folder')
+    parser.add_argument('name', help='Name of the person')
+    parser.add_argument('--source', default='0',
+                        help='Camera index, video file or image folder')
+    parser.add_argument('--samples', type=int, default=30)
+    parser.add_argument('--no-train', action='store_true',
+                        help='Only collect samples, do not update the model')
+    parser.add_argument('--detector',
+                        help='Detector backend: haar, lbp, yunet or a JSON config')
+    args = parser.parse_args()
+
+    collect_face_data(args.name, args.source, args.samples, args.detector)
+    if not args.no_train:
+        train_model()
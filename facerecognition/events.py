@@ -0,0 +1,338 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+class EventDebouncer:
+    """
+    Turns per-frame sightings into enter/update/leave events per identity
+    and stream.
+
+    The first sighting of a known identity on a stream emits 'enter'. While
+    it stays in view at most one 'update' is emitted every
+    `update_interval` seconds, carrying the best confidence seen since the
+    last event. When it has not been seen for `leave_after` seconds a
+    'leave' event is emitted.
+    """
+
+    def __init__(self, update_interval=30.0, leave_after=3.0):
+        self.update_interval = update_interval
+        self.leave_after = leave_after
+        self._present = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stream, faces, timestamp=None):
+        """
+        Record the faces of one frame
+        Args:
+            faces: Track.to_dict() dicts; unknown faces are ignored
+        Returns:
+            List of events
+        """
+        now = timestamp if timestamp is not None else time.time()
+        events = []
+        with self._lock:
+            for face in faces:
+                if face['name'] == "unknown" or face['confidence'] is None:
+                    continue
+                key = (stream, face['name'])
+                state = self._present.get(key)
+                if state is None:
+                    state = self._present[key] = {
+                        'first_seen': now, 'last_event': now,
+                        'confidence': face['confidence'],
+                    }
+                    events.append(self._event('enter', key, state, now, face))
+                else:
+                    state['confidence'] = min(state['confidence'], face['confidence'])
+                    if now - state['last_event'] >= self.update_interval:
+                        state['last_event'] = now
+                        events.append(self._event('update', key, state, now, face))
+                        state['confidence'] = face['confidence']
+                state['last_seen'] = now
+                state['track_id'] = face['track_id']
+            events.extend(self._expire(now, stream))
+        return events
+
+    def expire(self, now=None):
+        """Emit 'leave' for identities not seen recently on any stream"""
+        with self._lock:
+            return self._expire(now if now is not None else time.time())
+
+    def _expire(self, now, stream=None):
+        events = []
+        for key, state in list(self._present.items()):
+            if stream is not None and key[0] != stream:
+                continue
+            if now - state['last_seen'] >= self.leave_after:
+                del self._present[key]
+                events.append(self._event('leave', key, state, state['last_seen']))
+        return events
+
+    @staticmethod
+    def _event(kind, key, state, now, face=None):
+        return {
+            'type': kind,
+            'stream': key[0],
+            'name': key[1],
+            'track_id': face['track_id'] if face else state.get('track_id'),
+            'confidence': round(float(state['confidence']), 2),
+            'timestamp': now,
+            'first_seen': state['first_seen'],
+            'duration': round(now - state['first_seen'], 3),
+        }
+
+class EventDispatcher:
+    """
+    Non-blocking event pipeline. publish() debounces a frame result on the
+    calling thread and appends the resulting events to a bounded queue; a
+    background writer hands them to the sinks in batches. When the queue is
+    full new events are dropped and counted instead of blocking inference;
+    batches that every sink rejected are counted as failed.
+    """
+
+    def __init__(self, sinks, debouncer=None, max_queue=10000, batch_size=200,
+                 flush_interval=1.0):
+        self.sinks = list(sinks)
+        self.debouncer = debouncer or EventDebouncer()
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.published = 0
+        self.dropped = 0
+        self.written = 0
+        # Events no sink accepted
+        self.failed = 0
+        self.sink_errors = 0
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread = None
+
+        metrics = REGISTRY.stream('events')
+        metrics.set_counter('events_published', lambda: self.published)
+        metrics.set_counter('events_dropped', lambda: self.dropped)
+        metrics.set_counter('events_written', lambda: self.written)
+        metrics.set_counter('events_failed', lambda: self.failed)
+        metrics.set_counter('event_sink_errors', lambda: self.sink_errors)
+        metrics.set_gauge('event_queue_depth', lambda: len(self._queue))
+
+    def publish(self, result):
+        """Debounce a frame result ({'stream', 'timestamp', 'faces'})"""
+        events = self.debouncer.observe(result.get('stream'), result['faces'],
+                                        result.get('timestamp'))
+        for event in events:
+            # deque.append is atomic, the length check is only approximate
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                continue
+            self._queue.append(event)
+            self.published += 1
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='event-writer')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Flush pending events (including final 'leave' events) and stop"""
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        for event in self.debouncer.expire(float('inf')):
+            self._queue.append(event)
+        self._flush()
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logger.error(f"Closing event sink failed: {str(e)}")
+
+    def get_stats(self):
+        return {
+            'published': self.published,
+            'written': self.written,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'sink_errors': self.sink_errors,
+            'queued': len(self._queue),
+        }
+
+    def _run(self):
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            for event in self.debouncer.expire():
+                self._queue.append(event)
+            self._flush()
+
+    def _flush(self):
+        while self._queue:
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            accepted = False
+            for sink in self.sinks:
+                try:
+                    sink.write(batch)
+                    accepted = True
+                except Exception as e:
+                    self.sink_errors += 1
+                    logger.error(f"Event sink {type(sink).__name__} failed: {str(e)}")
+            # Written once any sink has the batch
+            if accepted:
+                self.written += len(batch)
+            else:
+                self.failed += len(batch)
+
+class LogSink:
+    """Logs one line per event"""
+
+    def __init__(self, log=logger):
+        self.log = log
+
+    def write(self, events):
+        for event in events:
+            self.log.info(format_event(event))
+
+    def close(self):
+        pass
+
+class TextFileSink:
+    """Appends one human readable line per event to a file"""
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def write(self, events):
+        self.file.writelines(
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(e['timestamp']))} "
+            f"{format_event(e)}\n" for e in events)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class JSONLSink:
+    """Appends one JSON object per event to a file"""
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def write(self, events):
+        self.file.writelines(json.dumps(e) + '\n' for e in events)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class WebhookSink:
+    """POSTs every batch as a JSON list to a URL"""
+
+    def __init__(self, url, timeout=5.0):
+        import requests
+
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def write(self, events):
+        response = self.session.post(self.url, json=events, timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self):
+        self.session.close()
+
+class SQLiteSink:
+    """Inserts events into an `events` table of a SQLite database"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    def write(self, events):
+        # Opened lazily so the writer thread creates the connection
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS events (type TEXT, stream TEXT, "
+                "name TEXT, track_id INTEGER, confidence REAL, timestamp REAL, "
+                "first_seen REAL, duration REAL)")
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO events VALUES (:type, :stream, :name, :track_id, "
+                ":confidence, :timestamp, :first_seen, :duration)", events)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+def format_event(event):
+    stream = f"Stream {event['stream']}: " if event['stream'] else ""
+    text = f"{stream}{event['name']} {event['type']}"
+    if event['type'] == 'leave':
+        return f"{text} after {event['duration']:.1f}s"
+    return f"{text} (track {event['track_id']}, confidence {round(100 - event['confidence'])}%)"
+
+def create_event_sinks(file=None, jsonl=None, sqlite=None, webhook=None):
+    """Build the configured sinks; events are logged when none is given"""
+    sinks = []
+    if file:
+        sinks.append(TextFileSink(file))
+    if jsonl:
+        sinks.append(JSONLSink(jsonl))
+    if sqlite:
+        sinks.append(SQLiteSink(sqlite))
+    if webhook:
+        sinks.append(WebhookSink(webhook))
+    return sinks or [LogSink()]
+
+def add_event_arguments(parser):
+    """Add the event sink options to an argparse parser"""
+    parser.add_argument('--events-file', help='Append recognition events to a text file')
+    parser.add_argument('--events-jsonl', help='Append recognition events as JSON lines')
+    parser.add_argument('--events-sqlite', help='Store recognition events in SQLite')
+    parser.add_argument('--events-webhook', help='POST recognition events to this URL')
+
+def sinks_from_args(args):
+    return create_event_sinks(args.events_file, args.events_jsonl,
+                              args.events_sqlite, args.events_webhook)
+
+if __name__ == "__main__":
+    # Local webhook stand-in: prints and stores every batch it receives
+    import argparse
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Local webhook receiver for recognition events')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--jsonl', help='Also append received events here')
+    args = parser.parse_args()
+    sink = JSONLSink(args.jsonl) if args.jsonl else None
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            events = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            for event in events:
+                logger.info(format_event(event))
+            if sink is not None:
+                sink.write(events)
+            self.send_response(204)
+            self.end_headers()
+
+    logger.info(f"Receiving events on http://127.0.0.1:{args.port}/")
+    ThreadingHTTPServer(('127.0.0.1', args.port), Handler).serve_forever()
@@ -0,0 +1,135 @@
+import argparse
+import cv2
+import logging
+import numpy as np
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+def synthetic_frames(count=50, size=(640, 480), seed=0, moving_boxes=3):
+    """
+    Deterministic BGR test frames: a smooth textured background with a few
+    bright boxes moving across it, so motion gating and the detector have
+    something to scan
+    Args:
+        size: (width, height)
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    small = rng.integers(0, 255, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+    background = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    starts = rng.integers(0, [width, height], (moving_boxes, 2))
+    speeds = rng.integers(-8, 9, (moving_boxes, 2))
+
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        for (x, y), (dx, dy) in zip(starts, speeds):
+            cx = int(x + dx * i) % width
+            cy = int(y + dy * i) % height
+            cv2.rectangle(frame, (cx, cy), (cx + 60, cy + 80), (220, 220, 220), -1)
+        frames.append(frame)
+    return frames
+
+class FakeMJPEGServer:
+    """
+    Local HTTP server streaming looping frames as multipart MJPEG at a
+    fixed frame rate, like an IP camera. Every path is a stream, so
+    http://host:port/cam1 and /cam2 can be opened as separate cameras.
+    Like some cameras it can send the stream with chunked transfer
+    encoding and leave out the parts' Content-Length headers.
+    """
+
+    def __init__(self, frames=None, fps=25.0, port=0, host='127.0.0.1', quality=80,
+                 chunked=False, content_length=True):
+        frames = frames if frames is not None else synthetic_frames()
+        self.jpegs = [cv2.imencode('.jpg', f, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+                      for f in frames]
+        self.fps = fps
+        self.host = host
+        self.port = port
+        self.chunked = chunked
+        self.content_length = content_length
+        self.frames_sent = 0
+        self._server = None
+
+    def url(self, path='cam'):
+        return f"http://{self.host}:{self.port}/{path}"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Chunked transfer encoding needs HTTP/1.1
+            protocol_version = 'HTTP/1.1' if fake.chunked else 'HTTP/1.0'
+
+            def log_message(self, format, *args):
+                pass
+
+            def write_part(self, jpeg):
+                headers = b'--frame\r\nContent-Type: image/jpeg\r\n'
+                if fake.content_length:
+                    headers += f'Content-Length: {len(jpeg)}\r\n'.encode()
+                part = headers + b'\r\n' + jpeg + b'\r\n'
+                if fake.chunked:
+                    part = f'{len(part):x}\r\n'.encode() + part + b'\r\n'
+                self.wfile.write(part)
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                if fake.chunked:
+                    self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                interval = 1.0 / fake.fps
+                next_frame = time.perf_counter()
+                i = 0
+                try:
+                    while fake._server is not None:
+                        jpeg = fake.jpegs[i % len(fake.jpegs)]
+                        self.write_part(jpeg)
+                        fake.frames_sent += 1
+                        i += 1
+                        next_frame += interval
+                        time.sleep(max(0.0, next_frame - time.perf_counter()))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        server, self._server = self._server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Serve synthetic frames as an MJPEG camera')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fps', type=float, default=25.0)
+    parser.add_argument('--size', default='640x480', help='Frame size WxH')
+    parser.add_argument('--chunked', action='store_true',
+                        help='Use chunked transfer encoding')
+    parser.add_argument('--no-content-length', action='store_true',
+                        help='Leave out the Content-Length of every part')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split('x'))
+    server = FakeMJPEGServer(synthetic_frames(size=(width, height)), args.fps,
+                             args.port, chunked=args.chunked,
+                             content_length=not args.no_content_length).start()
+    logger.info(f"Serving {server.url()} (any path works)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import threading
+from detection import detector_config
+from metrics import REGISTRY
+from recognise_face_http import create_processor, is_valid_url, stream_settings
+
+logger = logging.getLogger(__name__)
+
+# Settings that need a new capture; everything else is retuned in place
+RESTART_KEYS = ('url', 'capture_mode', 'buffer_size', 'open_timeout', 'read_timeout',
+                'ingest', 'decode_reduce')
+
+def load_fleet_config(path):
+    """
+    Read a camera config file: a JSON list of stream configs, or an object
+    with a "streams" list. Every stream needs a unique 'name' and a 'url'.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    streams = data['streams'] if isinstance(data, dict) else data
+    names = [config['name'] for config in streams]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate stream names: {', '.join(sorted(duplicates))}")
+    for config in streams:
+        if 'url' not in config:
+            raise ValueError(f"Stream {config['name']} has no url")
+    return streams
+
+class FleetManager:
+    """
+    Runs one StreamProcessor per configured camera and keeps them in sync
+    with the config file. Every poll_interval seconds the file is checked
+    for changes; added cameras are started and removed ones stopped, while
+    detection settings of a running camera are retuned in place. Only
+    cameras whose url, capture mode, buffer size, timeouts or decoding changed
+    are reconnected. The recognizer, gallery and the other streams are never
+    touched. A config file that fails to load is logged and ignored, and a
+    camera whose new config is invalid keeps its running processor.
+    """
+
+    def __init__(self, recognizer, detectors, names, config_path=None,
+                 poll_interval=2.0, **processor_kwargs):
+        self.recognizer = recognizer
+        self.detectors = detectors
+        self.names = names
+        self.config_path = config_path
+        self.poll_interval = poll_interval
+        # Passed to every StreamProcessor (pool, headless, renderers, ...)
+        self.processor_kwargs = processor_kwargs
+        self.processors = {}
+        self.configs = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the configured streams and watch the config file"""
+        if self.config_path is not None:
+            mtime = os.stat(self.config_path).st_mtime_ns
+            if not self.apply(load_fleet_config(self.config_path)):
+                self._mtime = mtime
+            self._thread = threading.Thread(target=self._watch, name='fleet-watch')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop watching and stop every stream"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._lock:
+            # Signal every stream first so slow captures close in parallel
+            for processor in self.processors.values():
+                processor.stop(wait=False)
+            for name, processor in self.processors.items():
+                processor.stop()
+                logger.info(f"Stream {name} stats: {processor.get_stats()}")
+
+    def apply(self, stream_configs):
+        """
+        Start, stop, restart or retune streams to match the configs.
+
+        New processors and settings are built for every changed camera
+        before any stream is touched. A camera whose config is invalid
+        (bad URL, detector, capture mode, missing ROI mask, ...) is logged
+        and keeps running with its previous config. Returns the names of
+        the cameras that could not be applied.
+        """
+        failed = []
+        changes = {}
+        with self._lock:
+            wanted = set()
+            for config in stream_configs:
+                name = config['name']
+                wanted.add(name)
+                current = self.configs.get(name)
+                if current == config:
+                    continue
+                try:
+                    changes[name] = self._prepare(current, config)
+                except Exception as e:
+                    logger.error(f"Invalid config for stream {name}, not applied: {str(e)}")
+                    failed.append(name)
+                    if current is None:
+                        # Metrics a half-built processor may have registered
+                        REGISTRY.remove(name)
+
+            for name in [n for n in self.processors if n not in wanted]:
+                self._remove(name)
+                REGISTRY.remove(name)
+                logger.info(f"Stream {name} removed")
+
+            for name, (action, config, change) in changes.items():
+                try:
+                    if action == 'add':
+                        self._start(config, change)
+                        logger.info(f"Stream {name} added")
+                    elif action == 'restart':
+                        # The new processor shares the stream's metrics
+                        self._remove(name)
+                        self._start(config, change)
+                        logger.info(f"Stream {name} restarted with new capture settings")
+                    else:
+                        self.processors[name].retune(**change)
+                        self.configs[name] = config
+                        logger.info(f"Stream {name} retuned")
+                except Exception as e:
+                    logger.error(f"Could not apply config of stream {name}: {str(e)}")
+                    failed.append(name)
+        return failed
+
+    def _prepare(self, current, config):
+        """
+        Validate a new or changed camera config and build what applying it
+        needs: an unstarted processor for 'add' and 'restart', the retune
+        settings for 'retune'. Raises on an invalid config.
+        """
+        if not is_valid_url(config['url']):
+            raise ValueError(f"Invalid URL format: {config['url']}")
+        if config.get('detector') is not None:
+            detector_config(config['detector'])
+        if current is None:
+            return 'add', config, self._create(config)
+        if any(current.get(key) != config.get(key) for key in RESTART_KEYS):
+            return 'restart', config, self._create(config)
+        settings = stream_settings(config)
+        if (current.get('motion'), current.get('roi_mask')) == (
+                config.get('motion'), config.get('roi_mask')):
+            # Keep the learned motion background
+            del settings['motion_gate']
+        return 'retune', config, settings
+
+    def get_stats(self):
+        with self._lock:
+            return {name: p.get_stats() for name, p in self.processors.items()}
+
+    def _create(self, config):
+        return create_processor(config, self.recognizer, self.detectors,
+                                self.names, **self.processor_kwargs)
+
+    def _start(self, config, processor):
+        processor.start()
+        self.processors[config['name']] = processor
+        self.configs[config['name']] = config
+
+    def _remove(self, name):
+        processor = self.processors.pop(name)
+        del self.configs[name]
+        processor.stop()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                mtime = os.stat(self.config_path).st_mtime_ns
+                if mtime == self._mtime:
+                    continue
+                logger.info(f"Reloading {self.config_path}")
+                # Cameras that failed are retried on the next poll
+                if not self.apply(load_fleet_config(self.config_path)):
+                    self._mtime = mtime
+            except Exception as e:
+                logger.error(f"Keeping the current streams, config reload failed: {str(e)}")
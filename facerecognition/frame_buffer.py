@@ -0,0 +1,105 @@
+import logging
+import threading
+from collections import deque
+from queue import Empty
+
+logger = logging.getLogger(__name__)
+
+class FrameBuffer:
+    """
+    Thread-safe frame buffer with a choice of overflow policy.
+
+    With drop_oldest=False a full buffer rejects the new frame (the old
+    Queue(maxsize=10) behaviour). With drop_oldest=True the oldest frame is
+    evicted instead, so consumers always see the newest frames; a size of 1
+    gives a single-slot "latest frame wins" buffer. Every rejected or
+    evicted frame is counted in `dropped`.
+    """
+
+    def __init__(self, maxsize=10, drop_oldest=False, on_drop=None):
+        self.maxsize = max(1, maxsize)
+        self.drop_oldest = drop_oldest
+        # Called with every rejected, evicted or cleared item
+        self.on_drop = on_drop
+        self.captured = 0
+        self.dropped = 0
+        self._frames = deque()
+        self._cond = threading.Condition()
+
+    def put(self, frame):
+        """Store a frame. Returns False if the frame itself was dropped."""
+        with self._cond:
+            self.captured += 1
+            if len(self._frames) >= self.maxsize:
+                self.dropped += 1
+                if not self.drop_oldest:
+                    self._discard(frame)
+                    return False
+                self._discard(self._frames.popleft())
+            self._frames.append(frame)
+            self._cond.notify()
+            return True
+
+    def would_drop(self):
+        """True if put() would reject the next frame"""
+        return not self.drop_oldest and len(self._frames) >= self.maxsize
+
+    def drop(self):
+        """Count a captured frame that was rejected without being stored"""
+        with self._cond:
+            self.captured += 1
+            self.dropped += 1
+
+    def get(self, timeout=None):
+        """Return the next frame, raising queue.Empty after `timeout` seconds"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frames, timeout):
+                raise Empty
+            return self._frames.popleft()
+
+    def get_nowait(self):
+        """Return the next frame or raise queue.Empty"""
+        with self._cond:
+            if not self._frames:
+                raise Empty
+            return self._frames.popleft()
+
+    def clear(self):
+        """Discard all buffered frames, counting them as dropped"""
+        with self._cond:
+            count = len(self._frames)
+            self.dropped += count
+            while self._frames:
+                self._discard(self._frames.popleft())
+            return count
+
+    def _discard(self, frame):
+        if self.on_drop is not None:
+            self.on_drop(frame)
+
+    def qsize(self):
+        return len(self._frames)
+
+    def empty(self):
+        return not self._frames
+
+    def full(self):
+        return len(self._frames) >= self.maxsize
+
+def create_frame_buffer(capture_mode='queue', buffer_size=10, on_drop=None):
+    """
+    Create the frame buffer for a capture mode
+    Args:
+        capture_mode: 'queue' keeps up to buffer_size frames and drops new
+            ones when full, 'ring' keeps the newest buffer_size frames,
+            'latest' keeps only the newest frame
+        buffer_size: Capacity for the 'queue' and 'ring' modes
+        on_drop: Optional callable receiving every dropped frame
+    """
+    if capture_mode == 'queue':
+        return FrameBuffer(buffer_size, drop_oldest=False, on_drop=on_drop)
+    if capture_mode == 'ring':
+        return FrameBuffer(buffer_size, drop_oldest=True, on_drop=on_drop)
+    if capture_mode == 'latest':
+        return FrameBuffer(1, drop_oldest=True, on_drop=on_drop)
+    raise ValueError(f"Unknown capture mode: {capture_mode}")
@@ -0,0 +1,218 @@
+import cv2
+import logging
+import numpy as np
+import os
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = -1
+GALLERY_PATH = 'trainer/gallery.npz'
+
+def load_name_mappings(path="faces.txt"):
+    """Load the trained mappings from faces.txt"""
+    names = {}
+    with open(path, "r") as f:
+        for line in f:
+            face_id, name = line.strip().split(":")
+            names[int(face_id)] = name
+    return names
+
+class Gallery:
+    """
+    In-memory index of enrolled face features.
+
+    All vectors live in one contiguous float32 matrix, kept sorted by label
+    so every identity's samples are a contiguous slice. Vectors are expected
+    to be L2 normalized (see batch_recognizer.lbp_features); similarity is a
+    dot product and distance is (1 - similarity) * distance_scale, so lower
+    is better and values below `threshold` are a match.
+
+    Lookups first compare queries with one centroid per identity. Queries
+    whose best centroid is further than `reject_distance` are answered as
+    unknown straight away; the rest are only compared with the samples of
+    their `candidates` closest identities.
+    """
+
+    def __init__(self, vectors=None, labels=None, names=None, distance_scale=500.0,
+                 threshold=100.0, reject_distance=150.0, candidates=5):
+        self.names = names or {}
+        self.distance_scale = distance_scale
+        self.threshold = threshold
+        self.reject_distance = reject_distance
+        self.candidates = candidates
+        self.vectors = np.empty((0, 0), np.float32)
+        self.labels = np.empty(0, np.int32)
+        self._build_index()
+        if vectors is not None and len(vectors):
+            self.add(vectors, labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def identities(self):
+        return self._identities
+
+    def add(self, vectors, labels):
+        """Append feature vectors for the given labels and rebuild the index"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int32)
+        if len(self.labels):
+            vectors = np.vstack([self.vectors, vectors])
+            labels = np.concatenate([self.labels, labels])
+        self._set(vectors, labels)
+
+    def remove(self, label):
+        """Drop every vector of one identity"""
+        keep = self.labels != label
+        self._set(self.vectors[keep], self.labels[keep])
+
+    def _set(self, vectors, labels):
+        order = np.argsort(labels, kind='stable')
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.labels = labels[order]
+        self._build_index()
+
+    def _build_index(self):
+        identities, starts, counts = np.unique(
+            self.labels, return_index=True, return_counts=True)
+        self._identities = identities
+        self._slices = [slice(s, s + c) for s, c in zip(starts, counts)]
+        if len(identities):
+            centroids = np.vstack([self.vectors[s].mean(axis=0) for s in self._slices])
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            self.centroids = centroids / np.maximum(norms, 1e-12)
+        else:
+            self.centroids = np.empty((0, self.vectors.shape[1]), np.float32)
+
+    def aggregated(self, method='mean', clusters=3):
+        """
+        Return a smaller gallery with a few vectors per identity
+        Args:
+            method: 'mean' keeps one centroid per identity, 'kmeans' keeps
+                up to `clusters` k-means centers per identity
+        """
+        vectors = []
+        labels = []
+        for label, rows in zip(self._identities, self._slices):
+            samples = self.vectors[rows]
+            if method == 'kmeans' and len(samples) > clusters:
+                criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1e-4)
+                _, _, centers = cv2.kmeans(samples, clusters, None, criteria, 3,
+                                           cv2.KMEANS_PP_CENTERS)
+            elif method in ('mean', 'kmeans'):
+                centers = samples.mean(axis=0, keepdims=True)
+            else:
+                raise ValueError(f"Unknown aggregation method: {method}")
+            centers /= np.maximum(np.linalg.norm(centers, axis=1, keepdims=True), 1e-12)
+            vectors.append(centers)
+            labels.extend([label] * len(centers))
+
+        gallery = Gallery(names=self.names, distance_scale=self.distance_scale,
+                          threshold=self.threshold,
+                          reject_distance=self.reject_distance,
+                          candidates=self.candidates)
+        if vectors:
+            gallery.add(np.vstack(vectors), labels)
+        return gallery
+
+    def search(self, queries, k=1):
+        """
+        Find the k nearest enrolled vectors for every query
+        Returns:
+            One list of (label, distance) tuples per query, nearest first.
+            Rejected queries get [(UNKNOWN, distance to best centroid)].
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if not len(self.labels):
+            return [[(UNKNOWN, self.distance_scale)] for _ in queries]
+
+        coarse = queries @ self.centroids.T
+        results = []
+        for query, scores in zip(queries, coarse):
+            best = float((1.0 - scores.max()) * self.distance_scale)
+            if self.reject_distance is not None and best > self.reject_distance:
+                results.append([(UNKNOWN, best)])
+                continue
+
+            if len(scores) > self.candidates:
+                picked = np.argpartition(-scores, self.candidates)[:self.candidates]
+            else:
+                picked = range(len(scores))
+
+            found = []
+            for i in picked:
+                rows = self._slices[i]
+                distances = (1.0 - self.vectors[rows] @ query) * self.distance_scale
+                for j in np.argsort(distances)[:k]:
+                    found.append((int(self._identities[i]), float(distances[j])))
+            found.sort(key=lambda item: item[1])
+            results.append(found[:k])
+        return results
+
+    def identify(self, queries, k=1):
+        """
+        Return one (label, distance) per query. With k > 1 the label with
+        most votes among the k nearest wins; its best distance is returned.
+        """
+        identities = []
+        for neighbours in self.search(queries, k):
+            votes = {}
+            for label, distance in neighbours:
+                count, best = votes.get(label, (0, distance))
+                votes[label] = (count + 1, min(best, distance))
+            label, (_, distance) = max(votes.items(),
+                                       key=lambda item: (item[1][0], -item[1][1]))
+            identities.append((label, distance))
+        return identities
+
+    def name(self, label, distance):
+        """Map a search result to a display name"""
+        if label == UNKNOWN or distance >= self.threshold:
+            return "unknown"
+        return self.names.get(label, "unknown")
+
+    def save(self, path):
+        """Write the gallery to a .npz file"""
+        np.savez(path, vectors=self.vectors, labels=self.labels,
+                 distance_scale=self.distance_scale)
+
+    @classmethod
+    def load(cls, path, names=None, **kwargs):
+        """Read a gallery written by save()"""
+        with np.load(path) as data:
+            return cls(data['vectors'], data['labels'], names,
+                       distance_scale=float(data['distance_scale']), **kwargs)
+
+def load_gallery(path=GALLERY_PATH, names_path='faces.txt',
+                 dataset_dir='dataset', aggregate=None, rebuild=False, cache=None,
+                 **kwargs):
+    """
+    Load the shared face gallery that every entry point recognizes
+    against with batch recognition
+    Args:
+        path: Saved gallery; built from dataset_dir and written here when it
+            does not exist yet or rebuild is True
+        names_path: faces.txt with the ID to name mappings
+        aggregate: Optional 'mean' or 'kmeans' to shrink the gallery to a
+            few vectors per identity
+        cache: Optional dataset_loader.FaceCache to build from
+        kwargs: Gallery lookup settings (threshold, reject_distance, ...)
+    """
+    names = load_name_mappings(names_path) if os.path.exists(names_path) else {}
+
+    if os.path.exists(path) and not rebuild:
+        gallery = Gallery.load(path, names, **kwargs)
+    else:
+        # Imported here because batch_recognizer builds on this module
+        from batch_recognizer import BatchRecognizer
+
+        gallery = Gallery(names=names, **kwargs)
+        BatchRecognizer(gallery).enroll_dataset(dataset_dir, cache)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        gallery.save(path)
+        logger.info(f"Built gallery with {len(gallery)} faces from {dataset_dir}")
+
+    if aggregate:
+        gallery = gallery.aggregated(aggregate)
+    return gallery
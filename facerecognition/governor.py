@@ -0,0 +1,174 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class FrameRateGovernor:
+    """
+    Shares the inference capacity between streams when they need more than
+    it can deliver.
+
+    Every `interval` seconds it measures each live stream's processing cost
+    per frame, the rate its camera delivers and its frame latency (queue
+    wait plus processing). The capacity (inference workers times
+    `headroom`) is then granted by priority: every stream gets `min_fps`,
+    higher priority streams get their full rate first and the rest share
+    what is left. Streams missing their latency target are throttled
+    further until they meet it. The grant becomes the stream's fps_limit,
+    so the capture thread grabs surplus frames without decoding them; a
+    stream thinned below half its rate also detects at a lower scale
+    (down to `min_scale`). Limits are lifted again as load drops.
+    """
+
+    def __init__(self, streams, capacity=None, latency_target=0.5,
+                 interval=2.0, headroom=0.9, min_fps=1.0, min_scale=0.5,
+                 scale_step=0.75):
+        # Callable returning the StreamProcessors to govern
+        self.streams = streams
+        # Seconds of inference available per second (inference workers)
+        self.capacity = capacity or os.cpu_count() or 1
+        self.latency_target = latency_target
+        self.interval = interval
+        self.headroom = headroom
+        self.min_fps = min_fps
+        self.min_scale = min_scale
+        self.scale_step = scale_step
+        self._state = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='governor')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        for processor in self.streams():
+            processor.fps_limit = None
+            processor.scale_limit = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f"Governor update failed: {str(e)}")
+
+    def update(self):
+        """Measure every stream and set new limits"""
+        now = time.perf_counter()
+        streams = []
+        for processor in list(self.streams()):
+            if not processor.is_live:
+                # Dead streams cost nothing; forget their measurements
+                self._state.pop(processor.stream_name, None)
+                continue
+            sample = self._measure(processor, now)
+            if sample is not None:
+                streams.append((processor, sample))
+
+        grants = self._allocate(streams)
+        for processor, sample in streams:
+            self._apply(processor, sample, grants[processor.stream_name])
+
+    def _measure(self, processor, now):
+        snapshot = processor.metrics.snapshot()
+        stages = snapshot['stages']
+        total = stages.get('total', {'count': 0, 'sum': 0.0})
+        wait = stages.get('queue_wait', {'count': 0, 'sum': 0.0})
+        arrived = processor.frame_queue.captured + processor.frames_skipped
+        current = (now, arrived, total['count'], total['sum'],
+                   wait['count'], wait['sum'])
+
+        state = self._state.setdefault(processor.stream_name, {'factor': 1.0})
+        previous = state.get('sample')
+        state['sample'] = current
+        if previous is None or now - previous[0] <= 0:
+            return None
+
+        elapsed = now - previous[0]
+        frames = current[2] - previous[2]
+        waits = current[4] - previous[4]
+        if frames > 0:
+            state['cost'] = (current[3] - previous[3]) / frames
+        cost = state.get('cost')
+        if cost is None:
+            return None  # Nothing processed yet
+        wait_time = (current[5] - previous[5]) / waits if waits > 0 else 0.0
+        return {
+            'cost': cost,
+            'native_fps': (current[1] - previous[1]) / elapsed,
+            'wait': wait_time,
+            'latency': wait_time + cost,
+        }
+
+    def _allocate(self, streams):
+        """Grant frame rates by priority within the capacity budget"""
+        budget = self.capacity * self.headroom
+        demand = {}
+        grants = {}
+        for processor, sample in streams:
+            wanted = sample['native_fps']
+            if processor.target_fps:
+                wanted = min(wanted, processor.target_fps)
+            demand[processor.stream_name] = wanted
+            grants[processor.stream_name] = min(self.min_fps, wanted)
+            budget -= grants[processor.stream_name] * sample['cost']
+
+        for priority in sorted({p.priority for p, _ in streams}, reverse=True):
+            tier = [(p, s) for p, s in streams if p.priority == priority]
+            need = sum((demand[p.stream_name] - grants[p.stream_name]) * s['cost']
+                       for p, s in tier)
+            if need <= 0:
+                continue
+            ratio = min(1.0, max(0.0, budget) / need)
+            for processor, sample in tier:
+                name = processor.stream_name
+                grants[name] += (demand[name] - grants[name]) * ratio
+            budget -= need * ratio
+        return {name: (grants[name], demand[name]) for name in grants}
+
+    def _apply(self, processor, sample, grant):
+        granted, wanted = grant
+        state = self._state[processor.stream_name]
+
+        # Streams missing their latency target are thinned further while
+        # frames wait in the queue; when processing itself is too slow only
+        # a lower detection scale helps. Both recover slowly.
+        target = processor.latency_target or self.latency_target
+        too_slow = sample['latency'] > target and sample['wait'] <= sample['cost']
+        if sample['latency'] > target and not too_slow:
+            state['factor'] = max(0.05, state['factor'] * 0.7)
+        elif sample['latency'] < target / 2:
+            state['factor'] = min(1.0, state['factor'] + 0.1)
+        granted = max(self.min_fps, granted * state['factor'])
+
+        throttled = granted < wanted * 0.95
+        limit = granted if throttled else None
+        if limit != processor.fps_limit:
+            if limit is None:
+                logger.info(f"Stream {processor.stream_name}: full rate restored")
+            elif processor.fps_limit is None:
+                logger.info(f"Stream {processor.stream_name}: limited to {limit:.1f} fps "
+                            f"(camera {wanted:.1f} fps, latency {sample['latency'] * 1000:.0f} ms)")
+        processor.fps_limit = limit
+
+        # Heavily thinned streams also detect at a lower resolution
+        scale = processor.scale_limit
+        if granted < wanted * 0.5 or too_slow:
+            current = scale if scale is not None else processor.detect_scale
+            scale = max(self.min_scale, current * self.scale_step)
+        elif not throttled and scale is not None and sample['latency'] < target / 2:
+            scale = scale / self.scale_step
+            if scale >= processor.detect_scale:
+                scale = None
+        processor.scale_limit = scale
+
+        processor.metrics.set_gauge('governed_fps', processor.fps_limit or wanted)
+        processor.metrics.set_gauge('detect_scale', processor.effective_scale)
@@ -0,0 +1,403 @@
+import argparse
+import cv2
+import json
+import logging
+import numpy as np
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from batch_recognizer import BatchRecognizer, recognize_crops
+from detection import Detectors, detect_faces
+from gallery import load_gallery, load_name_mappings
+from metrics import REGISTRY, start_metrics
+from mjpeg_ingest import multipart_boundary
+from worker_pool import load_models
+
+logger = logging.getLogger(__name__)
+
+# Largest request body accepted (all images of a batch together)
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+class IdentificationService:
+    """
+    Identifies the faces in still images with a pool of worker threads.
+
+    Images are queued as they arrive and every worker takes a micro-batch:
+    the first waiting image plus whatever else arrives within batch_window
+    seconds, up to max_batch images. Faces are detected per image, and the
+    faces of the whole batch are recognized together, which a
+    BatchRecognizer does in one vectorized pass. Every worker loads its own
+    detectors and recognizer once at start, as in InferenceWorkerPool.
+    """
+
+    def __init__(self, model_loader=load_models, names=None, num_workers=None,
+                 batch_window=0.005, max_batch=16, max_pending=256,
+                 detect_scale=1.0, detect_params=None, metrics=None):
+        self.model_loader = model_loader
+        self.names = names if names is not None else load_name_mappings()
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.detect_scale = detect_scale
+        self.detect_params = detect_params or {}
+        self.ready_workers = 0
+        self._pending = queue.Queue(max_pending)
+        self.metrics = metrics if metrics is not None else REGISTRY.stream('identify')
+        self.metrics.set_gauge('pending', self._pending.qsize)
+        self._stop = threading.Event()
+        self._workers = []
+        self._loaded = threading.Semaphore(0)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the workers and wait until they have loaded their models"""
+        self._stop.clear()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._run_worker, name=f'identify-{i}')
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        for _ in self._workers:
+            self._loaded.acquire()
+        if not self.ready_workers:
+            self.stop()
+            raise RuntimeError("No identification worker could load its models")
+        logger.info(f"Started identification with {self.ready_workers} workers")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._workers = []
+
+    def submit(self, gray):
+        """
+        Queue a grayscale image
+        Returns:
+            Future of its list of face dicts
+        Raises:
+            queue.Full: Too many images are waiting
+        """
+        future = Future()
+        self._pending.put_nowait((gray, future, time.perf_counter()))
+        return future
+
+    def identify(self, grays, timeout=10.0):
+        """
+        Identify the faces of several images; blocks until all are done.
+        When the queue fills up part way or the timeout passes, the images
+        of the request that no worker has started on are cancelled.
+        """
+        futures = []
+        try:
+            for gray in grays:
+                futures.append(self.submit(gray))
+            deadline = time.perf_counter() + timeout
+            return [future.result(max(0.0, deadline - time.perf_counter()))
+                    for future in futures]
+        except (queue.Full, FutureTimeout):
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _next_batch(self):
+        try:
+            batch = [self._pending.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Past the window, images that are already waiting still join
+                batch.append(self._pending.get(timeout=remaining) if remaining > 0
+                             else self._pending.get_nowait())
+            except queue.Empty:
+                break
+        # Images of a rejected or timed out request are skipped
+        return [item for item in batch if item[1].set_running_or_notify_cancel()]
+
+    def _run_worker(self):
+        try:
+            detectors, recognizer = self.model_loader()
+            detector = detectors.get()
+        except Exception as e:
+            logger.error(f"Identification worker failed to load models: {str(e)}")
+            return
+        else:
+            with self._lock:
+                self.ready_workers += 1
+        finally:
+            self._loaded.release()
+
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._process(batch, detector, recognizer)
+            except Exception as e:
+                logger.error(f"Identification error: {str(e)}")
+                self.metrics.inc('errors')
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _process(self, batch, detector, recognizer):
+        started = time.perf_counter()
+        for _, _, queued in batch:
+            self.metrics.observe('queue_wait', started - queued)
+        self.metrics.inc('batches')
+
+        with self.metrics.time('detect'):
+            detections = [detect_faces(detector, gray, scale=self.detect_scale,
+                                       scores=True, **self.detect_params)
+                          for gray, _, _ in batch]
+        crops = [gray[y:y+h, x:x+w]
+                 for (gray, _, _), boxes in zip(batch, detections)
+                 for (x, y, w, h, _) in boxes]
+        # The faces of every image in the batch are recognized together
+        with self.metrics.time('recognize'):
+            predictions = iter(recognize_crops(recognizer, crops))
+        self.metrics.inc('faces', len(crops))
+
+        for (_, future, _), boxes in zip(batch, detections):
+            faces = []
+            for (x, y, w, h, score), (label, confidence) in zip(boxes, predictions):
+                faces.append({
+                    'box': (x, y, w, h),
+                    'score': score,
+                    'label': int(label),
+                    'name': (self.names.get(label, "unknown")
+                             if confidence < 100 else "unknown"),
+                    'confidence': float(confidence),
+                })
+            future.set_result(faces)
+
+def form_parts(body, boundary):
+    """
+    Split a multipart/form-data body into (name, payload) pairs. The name
+    is the part's filename or field name; payloads are memoryviews of body.
+    """
+    delimiter = b'--' + boundary.encode('latin-1')
+    view = memoryview(body)
+    parts = []
+    start = body.find(delimiter)
+    while start >= 0:
+        start += len(delimiter)
+        if body[start:start + 2] == b'--':
+            break
+        head_end = body.find(b'\r\n\r\n', start)
+        end = body.find(b'\r\n' + delimiter, head_end)
+        if head_end < 0 or end < 0:
+            raise ValueError("Malformed multipart body")
+        head = body[start:head_end].decode('latin-1')
+        name = (re.search(r'filename="([^"]*)"', head)
+                or re.search(r';\s*name="([^"]*)"', head))
+        parts.append((name.group(1) if name else None, view[head_end + 4:end]))
+        start = end + 2
+    return parts
+
+def decode_gray(data):
+    """Decode an encoded image straight to grayscale, None if it is not one"""
+    if not len(data):
+        return None
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+
+class IdentificationServer:
+    """
+    Local HTTP front end of an IdentificationService.
+
+    POST /identify with an image as the body returns {"faces": [...]}; a
+    multipart/form-data body with several images returns {"images":
+    [{"name", "faces"}, ...]} in part order. Every face has its box
+    [x, y, w, h], detector score, label, name and confidence (lower is
+    better). Connections are kept alive (HTTP/1.1), so clients can send
+    many requests without reconnecting. GET /health reports readiness and
+    GET /metrics the service metrics in Prometheus format.
+    """
+
+    def __init__(self, service, port=8090, host='127.0.0.1', timeout=10.0,
+                 registry=REGISTRY):
+        self.service = service
+        self.port = port
+        self.host = host
+        self.timeout = timeout
+        self.registry = registry
+        self._server = None
+
+    def start(self):
+        service = self.service
+        server = self
+        metrics = service.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Small responses on kept-alive connections must not wait for
+            # delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, status, body, content_type='application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_json(self, status, value):
+                self.send_body(status, json.dumps(value).encode())
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == '/health':
+                    self.send_json(200, {'status': 'ok', 'workers': service.ready_workers})
+                elif path == '/metrics':
+                    self.send_body(200, server.registry.render_prometheus().encode(),
+                                   'text/plain; version=0.0.4')
+                else:
+                    self.send_json(404, {'error': 'Not found'})
+
+            def do_POST(self):
+                if urlparse(self.path).path != '/identify':
+                    self.send_json(404, {'error': 'Not found'})
+                    return
+                length = self.headers.get('Content-Length')
+                if length is None:
+                    self.close_connection = True
+                    self.send_json(411, {'error': 'Content-Length required'})
+                    return
+                if int(length) > MAX_BODY_BYTES:
+                    # The body is never read, so the connection cannot be reused
+                    self.close_connection = True
+                    self.send_json(413, {'error': 'Request too large'})
+                    return
+                started = time.perf_counter()
+                body = self.rfile.read(int(length))
+                status, response = server.handle(body, self.headers.get('Content-Type', ''))
+                self.send_json(status, response)
+                metrics.inc('requests')
+                if status != 200:
+                    metrics.inc('failed_requests')
+                metrics.observe('request', time.perf_counter() - started)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler,
+                                           bind_and_activate=False)
+        self._server.daemon_threads = True
+        # Bursts of clients connecting at once
+        self._server.request_queue_size = 128
+        self._server.server_bind()
+        self._server.server_activate()
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        logger.info(f"Identification on http://{self.host}:{self.port}/identify")
+        return self
+
+    def handle(self, body, content_type):
+        """
+        Identify the images of a request body
+        Returns:
+            (HTTP status, JSON-serializable response)
+        """
+        metrics = self.service.metrics
+        boundary = multipart_boundary(content_type)
+        try:
+            parts = form_parts(body, boundary) if boundary else [(None, body)]
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        if not parts:
+            return 400, {'error': 'No images'}
+
+        with metrics.time('decode'):
+            grays = [decode_gray(data) for _, data in parts]
+        for (name, _), gray in zip(parts, grays):
+            if gray is None:
+                return 400, {'error': f"Cannot decode image {name or ''}".strip()}
+        metrics.inc('images', len(grays))
+
+        try:
+            results = self.service.identify(grays, self.timeout)
+        except queue.Full:
+            metrics.inc('rejected')
+            return 503, {'error': 'Too many pending images'}
+        except FutureTimeout:
+            return 504, {'error': 'Identification timed out'}
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+        if not boundary:
+            return 200, {'faces': results[0]}
+        return 200, {'images': [{'name': name, 'faces': faces}
+                                for (name, _), faces in zip(parts, results)]}
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Local HTTP service identifying faces in images')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--workers', type=int, help='Inference threads')
+    parser.add_argument('--batch-window-ms', type=float, default=5.0,
+                        help='How long a worker waits for more images to batch')
+    parser.add_argument('--max-batch', type=int, default=16,
+                        help='Most images per batch')
+    parser.add_argument('--max-pending', type=int, default=256,
+                        help='Queued images before requests are rejected')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='Seconds a request may wait for its results')
+    parser.add_argument('--detect-scale', type=float, default=1.0,
+                        help='Detect faces on images resized by this factor')
+    parser.add_argument('--detector',
+                        help='Detector backend: haar, lbp, yunet or a JSON config')
+    parser.add_argument('--batch-recognition', action='store_true',
+                        help='Recognize against the vectorized gallery')
+    parser.add_argument('--metrics-log-interval', type=float, default=60.0,
+                        help='Seconds between metrics summaries in the log (0 disables)')
+    args = parser.parse_args()
+
+    if args.batch_recognition:
+        batch_recognizer = BatchRecognizer(load_gallery())
+        logger.info(f"Loaded {len(batch_recognizer.gallery)} gallery faces for batch recognition")
+
+        def model_loader():
+            # Workers share the gallery but each gets its own crop buffer
+            return Detectors(args.detector), batch_recognizer.clone()
+    else:
+        def model_loader():
+            return load_models(detector=args.detector)
+
+    service = IdentificationService(
+        model_loader, num_workers=args.workers, batch_window=args.batch_window_ms / 1000,
+        max_batch=args.max_batch, max_pending=args.max_pending,
+        detect_scale=args.detect_scale).start()
+    server = IdentificationServer(service, args.port, args.host, args.timeout).start()
+    reporters = start_metrics(log_interval=args.metrics_log_interval)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Program terminated by user")
+    finally:
+        server.stop()
+        service.stop()
+        for reporter in reporters:
+            reporter.stop()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
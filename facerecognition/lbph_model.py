@@ -0,0 +1,345 @@
+import cv2
+import json
+import logging
+import numpy as np
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows; writers are then only serialized per process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = 'trainer/trainer.yml'
+# Compact binary copy of MODEL_PATH. Every save is a new version directory
+# (by_bin.npy, labels.npy, sums.npy, params.json); CURRENT names the
+# published one.
+BINARY_MODEL_DIR = 'trainer/lbph'
+VERSION_PREFIX = 'v-'
+
+_thread_lock = threading.Lock()
+
+_EPSILON = np.finfo(np.float32).eps
+
+def elbp(src, radius=1, neighbors=8):
+    """Extended (circular) LBP image, computed the same way as OpenCV's LBPH"""
+    src = np.asarray(src, dtype=np.float32)
+    h = src.shape[0] - 2 * radius
+    w = src.shape[1] - 2 * radius
+    dst = np.zeros((max(h, 0), max(w, 0)), np.int32)
+    if h <= 0 or w <= 0:
+        return dst
+
+    center = src[radius:radius + h, radius:radius + w]
+
+    def shifted(dy, dx):
+        return src[radius + dy:radius + dy + h, radius + dx:radius + dx + w]
+
+    for n in range(neighbors):
+        # Angles in double precision, sample offsets in float, as OpenCV does
+        x = np.float32(radius * np.cos(2.0 * np.pi * n / float(neighbors)))
+        y = np.float32(-radius * np.sin(2.0 * np.pi * n / float(neighbors)))
+        fx, fy = int(np.floor(x)), int(np.floor(y))
+        cx, cy = int(np.ceil(x)), int(np.ceil(y))
+        ty = np.float32(y - fy)
+        tx = np.float32(x - fx)
+        w1 = np.float32((1 - tx) * (1 - ty))
+        w2 = np.float32(tx * (1 - ty))
+        w3 = np.float32((1 - tx) * ty)
+        w4 = np.float32(tx * ty)
+        t = (w1 * shifted(fy, fx) + w2 * shifted(fy, cx)
+             + w3 * shifted(cy, fx) + w4 * shifted(cy, cx))
+        dst += (((t > center) | (np.abs(t - center) < _EPSILON))
+                .astype(np.int32) << n)
+    return dst
+
+def spatial_histogram(lbp, patterns, grid_x=8, grid_y=8):
+    """Concatenated, L1-normalized per-cell histograms as in OpenCV's LBPH"""
+    ch = lbp.shape[0] // grid_y
+    cw = lbp.shape[1] // grid_x
+    cells = grid_x * grid_y
+    if ch == 0 or cw == 0:
+        return np.zeros(cells * patterns, np.float32)
+
+    blocks = lbp[:grid_y * ch, :grid_x * cw].reshape(grid_y, ch, grid_x, cw)
+    blocks = blocks.transpose(0, 2, 1, 3).reshape(cells, ch * cw)
+    offsets = (np.arange(cells, dtype=np.int64) * patterns)[:, None]
+    hist = np.bincount((blocks + offsets).ravel(), minlength=cells * patterns)
+    return hist.astype(np.float32) / np.float32(ch * cw)
+
+def write_lbph_yaml(path, histograms, labels, radius=1, neighbors=8,
+                    grid_x=8, grid_y=8, threshold=sys.float_info.max):
+    """Write histograms and labels in OpenCV's LBPH YAML/XML model format"""
+    fs = cv2.FileStorage(path, cv2.FILE_STORAGE_WRITE)
+    fs.startWriteStruct('opencv_lbphfaces', cv2.FileNode_MAP)
+    fs.write('threshold', float(threshold))
+    fs.write('radius', int(radius))
+    fs.write('neighbors', int(neighbors))
+    fs.write('grid_x', int(grid_x))
+    fs.write('grid_y', int(grid_y))
+    fs.startWriteStruct('histograms', cv2.FileNode_SEQ)
+    for histogram in histograms:
+        fs.write('', np.asarray(histogram, dtype=np.float32).reshape(1, -1))
+    fs.endWriteStruct()
+    fs.write('labels', np.asarray(labels, dtype=np.int32).reshape(-1, 1))
+    fs.endWriteStruct()
+    fs.release()
+
+class LBPHModel:
+    """
+    Read-only LBPH model stored as one histogram matrix plus a labels array.
+
+    predict() reproduces cv2.face.LBPHFaceRecognizer.predict (extended LBP,
+    spatial histograms, chi-square distance) in NumPy, so the model can be
+    used wherever the OpenCV recognizer is. The matrix is kept bin-major
+    (one row per histogram bin) so a query only reads the rows of its
+    non-empty bins. Loaded with mmap, it is shared through the page cache
+    by every process on the host that opens the same model.
+    """
+
+    def __init__(self, histograms, labels, radius=1, neighbors=8, grid_x=8,
+                 grid_y=8, threshold=sys.float_info.max, sums=None):
+        # A no-op for the transposed view of a loaded model
+        self.by_bin = np.ascontiguousarray(np.asarray(histograms, np.float32).T)
+        self.labels = labels
+        self.sums = (sums if sums is not None
+                     else self.by_bin.sum(axis=0, dtype=np.float64))
+        self.radius = radius
+        self.neighbors = neighbors
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.threshold = threshold
+
+    @property
+    def histograms(self):
+        """(samples, bins) view of the histogram matrix"""
+        return self.by_bin.T
+
+    def params(self):
+        return {'radius': self.radius, 'neighbors': self.neighbors,
+                'grid_x': self.grid_x, 'grid_y': self.grid_y,
+                'threshold': self.threshold}
+
+    @classmethod
+    def from_recognizer(cls, recognizer):
+        """Copy the histograms out of a trained cv2 LBPH recognizer"""
+        histograms = recognizer.getHistograms()
+        labels = recognizer.getLabels()
+        matrix = (np.vstack([h.reshape(1, -1) for h in histograms]).astype(np.float32)
+                  if histograms else np.empty((0, 0), np.float32))
+        return cls(matrix,
+                   np.asarray(labels if labels is not None else [], np.int32).ravel(),
+                   recognizer.getRadius(), recognizer.getNeighbors(),
+                   recognizer.getGridX(), recognizer.getGridY(),
+                   recognizer.getThreshold())
+
+    @classmethod
+    def load(cls, model_dir=BINARY_MODEL_DIR, mmap=True):
+        """Load the current binary model, memory-mapped read-only by default"""
+        mode = 'r' if mmap else None
+        for attempt in range(2):
+            path = current_version(model_dir)
+            if path is None:
+                raise FileNotFoundError(f"No binary model in {model_dir}")
+            try:
+                with open(os.path.join(path, 'params.json'), 'r') as f:
+                    params = json.load(f)
+                by_bin = np.load(os.path.join(path, 'by_bin.npy'), mmap_mode=mode)
+                labels = np.load(os.path.join(path, 'labels.npy'), mmap_mode=mode)
+                sums = np.load(os.path.join(path, 'sums.npy'))
+                return cls(by_bin.T, labels, sums=sums, **params)
+            except FileNotFoundError:
+                # A newer model was published and this one cleaned up
+                # between reading CURRENT and opening the files
+                if attempt:
+                    raise
+
+    def save(self, model_dir=BINARY_MODEL_DIR):
+        """
+        Publish the model as a new version of model_dir. The files are
+        written to a directory of their own and CURRENT is then pointed at
+        it with one rename, so readers always load a complete model and
+        processes that have an older version mapped keep a valid copy.
+        """
+        with model_lock(model_dir):
+            self._publish(model_dir)
+
+    def _publish(self, model_dir):
+        previous = current_version(model_dir)
+        path = tempfile.mkdtemp(prefix=VERSION_PREFIX, dir=model_dir)
+        np.save(os.path.join(path, 'by_bin.npy'), self.by_bin)
+        np.save(os.path.join(path, 'labels.npy'), np.asarray(self.labels, dtype=np.int32))
+        np.save(os.path.join(path, 'sums.npy'), np.asarray(self.sums, dtype=np.float64))
+        with open(os.path.join(path, 'params.json'), 'w') as f:
+            json.dump(self.params(), f)
+
+        fd, pointer = tempfile.mkstemp(prefix='.CURRENT.', dir=model_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(os.path.basename(path))
+        os.replace(pointer, os.path.join(model_dir, 'CURRENT'))
+
+        # The previous version stays for readers that are just opening it
+        keep = {os.path.basename(path), os.path.basename(previous or '')}
+        for name in os.listdir(model_dir):
+            if name.startswith(VERSION_PREFIX) and name not in keep:
+                shutil.rmtree(os.path.join(model_dir, name), ignore_errors=True)
+
+    def histograms_of(self, faces):
+        """LBPH histograms of grayscale faces, computed by OpenCV with this model's parameters"""
+        recognizer = cv2.face.LBPHFaceRecognizer_create(
+            self.radius, self.neighbors, self.grid_x, self.grid_y)
+        recognizer.train(list(faces), np.zeros(len(faces), np.int32))
+        return np.vstack([h.reshape(1, -1) for h in recognizer.getHistograms()])
+
+    def with_samples(self, histograms, labels):
+        """Copy of the model with more samples appended"""
+        histograms = np.asarray(histograms, np.float32)
+        sums = histograms.sum(axis=1, dtype=np.float64)
+        if len(self.labels):
+            histograms = np.hstack([self.by_bin, histograms.T]).T
+            labels = np.concatenate([self.labels, labels])
+            sums = np.concatenate([self.sums, sums])
+        return LBPHModel(histograms, np.asarray(labels, np.int32), sums=sums,
+                         **self.params())
+
+    def without_labels(self, labels):
+        """Copy of the model without the samples of the given labels"""
+        keep = np.flatnonzero(~np.isin(self.labels, list(labels)))
+        return LBPHModel(self.by_bin[:, keep].T, np.asarray(self.labels)[keep],
+                         sums=np.asarray(self.sums)[keep], **self.params())
+
+    def write_yaml(self, path):
+        """Write the model in OpenCV's YAML format"""
+        write_lbph_yaml(path, self.histograms, self.labels, **self.params())
+
+    def histogram(self, src):
+        """LBPH feature histogram of one grayscale face"""
+        lbp = elbp(src, self.radius, self.neighbors)
+        return spatial_histogram(lbp, 2 ** self.neighbors, self.grid_x, self.grid_y)
+
+    def distances(self, query, chunk_samples=256):
+        """
+        Chi-square distance (HISTCMP_CHISQR_ALT) of a query histogram to
+        every sample: 2 * sum((h - q)^2 / (h + q)) over the non-empty bins.
+        As (h - q)^2 / (h + q) = h + q - 4hq / (h + q), bins where the query
+        is empty only add h, so the distance is
+        2 * (sum(h) + sum(q) - 4 * sum(hq / (h + q) for bins with q > 0))
+        and only the query's non-empty bins (about a quarter) are read.
+        Samples are processed in chunks that stay in the CPU cache.
+        """
+        nonzero = np.flatnonzero(query)
+        q = query[nonzero, None]
+        overlap = np.empty(len(self.sums), np.float64)
+        for start in range(0, len(overlap), chunk_samples):
+            block = self.by_bin[nonzero, start:start + chunk_samples]
+            total = block + q
+            block *= q
+            block /= total
+            overlap[start:start + chunk_samples] = block.sum(axis=0, dtype=np.float64)
+        return 2.0 * (self.sums + query.sum(dtype=np.float64) - 4.0 * overlap)
+
+    def predict(self, src):
+        """
+        Return (label, distance) of the nearest training sample, like
+        LBPHFaceRecognizer.predict. Label is -1 when the distance is not
+        below the model threshold.
+        """
+        if not len(self.labels):
+            return -1, sys.float_info.max
+        distances = self.distances(self.histogram(src))
+        i = int(distances.argmin())
+        if distances[i] >= self.threshold:
+            return -1, float(distances[i])
+        return int(self.labels[i]), float(distances[i])
+
+def current_version(model_dir=BINARY_MODEL_DIR):
+    """Directory of the published binary model, or None"""
+    try:
+        with open(os.path.join(model_dir, 'CURRENT'), 'r') as f:
+            return os.path.join(model_dir, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+@contextmanager
+def model_lock(model_dir=BINARY_MODEL_DIR):
+    """
+    Serialize writers of a binary model across the threads of this
+    process and, where fcntl exists, across processes
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(model_dir, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def convert_yaml_to_binary(yaml_path=MODEL_PATH, model_dir=BINARY_MODEL_DIR):
+    """Convert an OpenCV LBPH YAML model to the binary format"""
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(yaml_path)
+    model = LBPHModel.from_recognizer(recognizer)
+    model.save(model_dir)
+    return model
+
+def convert_binary_to_yaml(model_dir=BINARY_MODEL_DIR, yaml_path=MODEL_PATH):
+    """Convert a binary model back to OpenCV's LBPH YAML format"""
+    LBPHModel.load(model_dir, mmap=True).write_yaml(yaml_path)
+
+def _binary_is_current(yaml_path, model_dir):
+    pointer = os.path.join(model_dir, 'CURRENT')
+    return os.path.exists(pointer) and (
+        not os.path.exists(yaml_path)
+        or os.path.getmtime(pointer) >= os.path.getmtime(yaml_path))
+
+def load_recognizer(yaml_path=MODEL_PATH, model_dir=BINARY_MODEL_DIR):
+    """
+    Load the trained recognizer for an entry point.
+
+    Uses the memory-mapped binary model when it is at least as new as the
+    YAML model. Otherwise the YAML model is converted once, under the
+    model lock, so workers starting together wait for one conversion and
+    then all map the same files; if that fails the OpenCV recognizer is
+    returned.
+    """
+    if _binary_is_current(yaml_path, model_dir):
+        return LBPHModel.load(model_dir)
+
+    try:
+        with model_lock(model_dir):
+            # Another worker may have converted it while this one waited
+            if not _binary_is_current(yaml_path, model_dir):
+                recognizer = cv2.face.LBPHFaceRecognizer_create()
+                recognizer.read(yaml_path)
+                LBPHModel.from_recognizer(recognizer)._publish(model_dir)
+                logger.info(f"Converted {yaml_path} to binary model in {model_dir}")
+        return LBPHModel.load(model_dir)
+    except OSError as e:
+        logger.warning(f"Could not write binary model: {str(e)}")
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.read(yaml_path)
+        return recognizer
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert LBPH models between YAML and binary')
+    parser.add_argument('direction', choices=['to-binary', 'to-yaml'])
+    parser.add_argument('--yaml', default=MODEL_PATH, help='YAML model path')
+    parser.add_argument('--binary', default=BINARY_MODEL_DIR, help='Binary model directory')
+    args = parser.parse_args()
+
+    if args.direction == 'to-binary':
+        convert_yaml_to_binary(args.yaml, args.binary)
+    else:
+        convert_binary_to_yaml(args.binary, args.yaml)
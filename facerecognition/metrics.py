@@ -0,0 +1,279 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075,
+                   0.1, 0.15, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0, float('inf'))
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram. Memory does not grow with the number
+    of samples; quantiles are interpolated inside the bucket they fall in,
+    like Prometheus' histogram_quantile.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Estimated q-quantile in seconds, or None without samples"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                if upper == float('inf'):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-2]
+
+class StreamMetrics:
+    """
+    Latency histograms per pipeline stage plus counters and gauges of one
+    stream. Counters and gauges may be callables that are read on demand,
+    so existing counters (e.g. FrameBuffer.dropped) need no extra updates.
+    """
+
+    def __init__(self, name, smoothing=0.1):
+        self.name = name
+        self.smoothing = smoothing
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.fps = 0.0
+        self._last_tick = None
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        """Record the duration of one pass through a stage"""
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Context manager timing a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_counter(self, name, value):
+        """Set a counter to a value or to a callable returning it"""
+        self.counters[name] = value
+
+    def set_gauge(self, name, value):
+        """Set a gauge to a value or to a callable returning it"""
+        self.gauges[name] = value
+
+    def tick(self):
+        """
+        Mark one processed frame
+        Returns:
+            Exponentially smoothed processing rate in frames per second
+        """
+        now = time.perf_counter()
+        with self._lock:
+            if self._last_tick is not None:
+                rate = 1.0 / max(now - self._last_tick, 1e-6)
+                self.fps = rate if not self.fps else (
+                    self.smoothing * rate + (1 - self.smoothing) * self.fps)
+            self._last_tick = now
+            return self.fps
+
+    def snapshot(self):
+        """Plain dict of the current values"""
+        def read(value):
+            return value() if callable(value) else value
+
+        with self._lock:
+            return {
+                'fps': self.fps,
+                'counters': {k: read(v) for k, v in self.counters.items()},
+                'gauges': {k: read(v) for k, v in self.gauges.items()},
+                'stages': {
+                    stage: {
+                        'count': h.count,
+                        'sum': h.sum,
+                        'p50': h.quantile(0.5),
+                        'p95': h.quantile(0.95),
+                        'p99': h.quantile(0.99),
+                        'buckets': list(zip(h.buckets, h.counts)),
+                    }
+                    for stage, h in self.histograms.items()
+                },
+            }
+
+class MetricsRegistry:
+    """All StreamMetrics of a process"""
+
+    def __init__(self):
+        self.streams = {}
+        self._lock = threading.Lock()
+
+    def stream(self, name):
+        """Return the metrics of a stream, creating them on first use"""
+        with self._lock:
+            metrics = self.streams.get(name)
+            if metrics is None:
+                metrics = self.streams[name] = StreamMetrics(name)
+            return metrics
+
+    def remove(self, name):
+        """Forget the metrics of a stream that was shut down"""
+        with self._lock:
+            self.streams.pop(name, None)
+
+    def render_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        snapshots = {name: m.snapshot() for name, m in list(self.streams.items())}
+        lines = []
+
+        lines.append('# TYPE facerec_stage_seconds histogram')
+        for name, snap in snapshots.items():
+            for stage, h in snap['stages'].items():
+                labels = f'stream="{_escape(name)}",stage="{stage}"'
+                cumulative = 0
+                for bound, count in h['buckets']:
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'facerec_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'facerec_stage_seconds_sum{{{labels}}} {h["sum"]}')
+                lines.append(f'facerec_stage_seconds_count{{{labels}}} {h["count"]}')
+
+        counters = sorted({c for snap in snapshots.values() for c in snap['counters']})
+        for counter in counters:
+            lines.append(f'# TYPE facerec_{counter}_total counter')
+            for name, snap in snapshots.items():
+                if counter in snap['counters']:
+                    lines.append(f'facerec_{counter}_total{{stream="{_escape(name)}"}} '
+                                 f'{snap["counters"][counter]}')
+
+        gauges = sorted({g for snap in snapshots.values() for g in snap['gauges']})
+        for gauge in gauges + ['fps']:
+            lines.append(f'# TYPE facerec_{gauge} gauge')
+            for name, snap in snapshots.items():
+                value = snap['fps'] if gauge == 'fps' else snap['gauges'].get(gauge)
+                if value is not None:
+                    lines.append(f'facerec_{gauge}{{stream="{_escape(name)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary_lines(self):
+        """One human readable line per stream"""
+        lines = []
+        for name, metrics in list(self.streams.items()):
+            snap = metrics.snapshot()
+            parts = [f"fps {snap['fps']:.1f}"]
+            parts += [f"{k} {v}" for k, v in sorted(snap['gauges'].items())]
+            parts += [f"{k} {v}" for k, v in sorted(snap['counters'].items())]
+            for stage, h in snap['stages'].items():
+                if h['count']:
+                    parts.append(f"{stage} p50/p95/p99 {h['p50'] * 1000:.1f}/"
+                                 f"{h['p95'] * 1000:.1f}/{h['p99'] * 1000:.1f} ms")
+            lines.append(f"{name}: " + ", ".join(parts))
+        return lines
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+# Process-wide registry used by the stream entry points
+REGISTRY = MetricsRegistry()
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text format) on a local port"""
+
+    def __init__(self, registry=REGISTRY, port=9100, host='127.0.0.1'):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self._server = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        logger.info(f"Metrics on http://{self.host}:{self.port}/metrics")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+class MetricsReporter:
+    """Logs a per-stream metrics summary every `interval` seconds"""
+
+    def __init__(self, registry=REGISTRY, interval=60.0):
+        self.registry = registry
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for line in self.registry.summary_lines():
+                logger.info(f"Metrics {line}")
+
+def start_metrics(port=None, log_interval=60.0, registry=REGISTRY):
+    """Start the optional metrics endpoint and periodic log summary"""
+    services = []
+    if port:
+        services.append(MetricsServer(registry, port).start())
+    if log_interval:
+        services.append(MetricsReporter(registry, log_interval).start())
+    return services
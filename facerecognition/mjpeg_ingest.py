@@ -0,0 +1,333 @@
+import asyncio
+import base64
+import concurrent.futures
+import logging
+import os
+import threading
+from urllib.parse import urlparse
+from stream_supervisor import CONNECTING, STOPPED, CaptureSupervisor
+
+logger = logging.getLogger(__name__)
+
+# Largest header line or part without Content-Length a camera may send
+MAX_PART_BYTES = 16 * 1024 * 1024
+
+class HTTPBody:
+    """
+    Reads an HTTP response body, undoing chunked transfer encoding.
+
+    readexactly() of a plain body returns the bytes object the StreamReader
+    hands out, which is never copied again; chunked bodies only join reads
+    that span chunk boundaries.
+    """
+
+    def __init__(self, reader, chunked=False):
+        self.reader = reader
+        self.chunked = chunked
+        self._buffer = bytearray()
+        self._chunk_left = 0
+
+    async def readexactly(self, n):
+        if not self.chunked:
+            return await self.reader.readexactly(n)
+        parts = []
+        if self._buffer:
+            take = min(n, len(self._buffer))
+            parts.append(bytes(self._buffer[:take]))
+            del self._buffer[:take]
+            n -= take
+        while n:
+            take = min(n, await self._chunk())
+            parts.append(await self._read_chunk(take))
+            n -= take
+        return parts[0] if len(parts) == 1 else b''.join(parts)
+
+    async def readuntil(self, separator):
+        if not self.chunked:
+            return await self.reader.readuntil(separator)
+        start = 0
+        while True:
+            end = self._buffer.find(separator, start)
+            if end >= 0:
+                end += len(separator)
+                data = bytes(self._buffer[:end])
+                del self._buffer[:end]
+                return data
+            if len(self._buffer) > MAX_PART_BYTES:
+                raise IOError("Separator not found")
+            # The separator may start at the end of the previous chunk
+            start = max(0, len(self._buffer) - len(separator) + 1)
+            self._buffer += await self._read_chunk(await self._chunk())
+
+    async def _chunk(self):
+        """Bytes left in the current chunk, reading the next chunk size if needed"""
+        if not self._chunk_left:
+            line = await self.reader.readuntil(b'\r\n')
+            self._chunk_left = int(line.split(b';', 1)[0], 16)
+            if not self._chunk_left:
+                raise EOFError("Stream ended")
+        return self._chunk_left
+
+    async def _read_chunk(self, n):
+        data = await self.reader.readexactly(n)
+        self._chunk_left -= n
+        if not self._chunk_left:
+            await self.reader.readexactly(2)  # CRLF after the chunk data
+        return data
+
+class MultipartReader:
+    """
+    Splits a multipart/x-mixed-replace body into its parts. Parts with a
+    Content-Length are read in one go; without one the body is scanned for
+    the next boundary and the part returned as a memoryview of the read.
+    """
+
+    def __init__(self, body, boundary):
+        boundary = boundary.encode('latin-1')
+        # Some cameras put the leading dashes into the boundary parameter
+        self.delimiter = boundary if boundary.startswith(b'--') else b'--' + boundary
+        self.body = body
+        self._at_part = False
+
+    async def next_part(self):
+        """Return the payload of the next part (bytes or memoryview)"""
+        if not self._at_part:
+            await self.body.readuntil(self.delimiter)
+        if (await self.body.readuntil(b'\r\n')).startswith(b'--'):
+            raise EOFError("Stream ended")
+        length = None
+        while True:
+            line = await self.body.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value)
+
+        if length is not None:
+            self._at_part = False
+            return await self.body.readexactly(length)
+        data = await self.body.readuntil(b'\r\n' + self.delimiter)
+        self._at_part = True
+        return memoryview(data)[:-len(self.delimiter) - 2]
+
+async def read_response_head(reader):
+    """Read an HTTP status line and headers; header names are lowercased"""
+    status = int((await reader.readuntil(b'\r\n')).split()[1])
+    headers = {}
+    while True:
+        line = (await reader.readuntil(b'\r\n')).decode('latin-1').strip()
+        if not line:
+            return status, headers
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+def multipart_boundary(content_type):
+    """The boundary of a multipart Content-Type, or None"""
+    kind, _, params = content_type.partition(';')
+    if not kind.strip().lower().startswith('multipart/'):
+        return None
+    for param in params.split(';'):
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'boundary':
+            return value.strip().strip('"')
+    return None
+
+def request_head(url):
+    """GET request for a parsed camera URL, with basic auth from its user info"""
+    path = url.path or '/'
+    if url.query:
+        path += '?' + url.query
+    lines = [f"GET {path} HTTP/1.1", f"Host: {url.netloc.rpartition('@')[2]}",
+             "Accept: */*", "Connection: close"]
+    if url.username is not None:
+        credentials = f"{url.username}:{url.password or ''}".encode()
+        lines.append(f"Authorization: Basic {base64.b64encode(credentials).decode()}")
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+class MJPEGStream(CaptureSupervisor):
+    """
+    One camera of an MJPEGIngestor. Keeps the CaptureSupervisor interface,
+    states, backoff and metrics, but runs as a coroutine on the ingestor's
+    event loop instead of holding a thread and a VideoCapture.
+
+    accept() runs on the loop for every received JPEG and returns False to
+    skip it without decoding. on_jpeg(data) runs on the decode pool; the
+    next frame is read while one is decoded, and a stream never has more
+    than one decode pending, so its frames stay in order.
+    """
+
+    def __init__(self, ingestor, url, name, on_jpeg, accept=None, **kwargs):
+        super().__init__(url, name, None, **kwargs)
+        self.ingestor = ingestor
+        self.on_jpeg = on_jpeg
+        self.accept = accept
+        self.bytes_received = 0
+        self._future = None
+        self._started = False
+        self._done = threading.Event()
+        self._transport = None
+        self._deadline = None
+        self._stalled = False
+
+    def start(self):
+        """Run the stream on the ingestor's event loop"""
+        self.ingestor.streams.add(self)
+        self._future = asyncio.run_coroutine_threadsafe(self._run(), self.ingestor.loop)
+        self._future.add_done_callback(self._cancelled_early)
+        return self
+
+    def stop(self, wait=True, timeout=None):
+        self._stop.set()
+        if self._future is not None:
+            self._future.cancel()
+            if wait:
+                self._done.wait(timeout if timeout is not None else 5.0)
+
+    def _cancelled_early(self, future):
+        # A stream stopped before its coroutine ran never reaches its finally
+        if not self._started:
+            self.ingestor.streams.discard(self)
+            self._done.set()
+
+    def run(self):
+        raise RuntimeError("MJPEG streams run on their ingestor's event loop")
+
+    def check_deadline(self, now):
+        """Abort a connection that sent nothing for too long; called on the loop"""
+        if self._transport is not None and self._deadline is not None and now > self._deadline:
+            self._stalled = True
+            self._transport.abort()
+
+    async def _run(self):
+        self._started = True
+        try:
+            while not self._stop.is_set():
+                self._set_state(CONNECTING)
+                try:
+                    await self._receive()
+                except Exception as e:
+                    if self._stop.is_set():
+                        break
+                    if self._stalled:
+                        e = TimeoutError("No data from the camera")
+                    await asyncio.sleep(self._failed(e))
+        finally:
+            self.ingestor.streams.discard(self)
+            self._set_state(STOPPED)
+            self._done.set()
+
+    async def _receive(self):
+        """Connect and read parts until the connection fails"""
+        loop = asyncio.get_running_loop()
+        url = urlparse(self.url)
+        secure = url.scheme == 'https'
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(url.hostname, url.port or (443 if secure else 80),
+                                    ssl=secure or None, limit=MAX_PART_BYTES),
+            self.open_timeout)
+        # Headers and the first frame are due within the open timeout
+        self._transport = writer.transport
+        self._deadline = loop.time() + self.open_timeout
+        self._stalled = False
+        decoding = None
+        try:
+            writer.write(request_head(url))
+            status, headers = await read_response_head(reader)
+            if status != 200:
+                raise IOError(f"HTTP status {status}")
+            boundary = multipart_boundary(headers.get('content-type', ''))
+            if boundary is None:
+                raise IOError(f"Not an MJPEG stream: {headers.get('content-type')}")
+            chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+            parts = MultipartReader(HTTPBody(reader, chunked), boundary)
+
+            while True:
+                data = await parts.next_part()
+                self._deadline = loop.time() + self.read_timeout
+                self.bytes_received += len(data)
+                self._received()
+                if self.accept is not None and not self.accept():
+                    continue
+                if decoding is not None:
+                    await decoding
+                decoding = loop.run_in_executor(self.ingestor.decoder, self._decode, data)
+        finally:
+            self._transport = None
+            self._deadline = None
+            writer.close()
+
+    def _decode(self, data):
+        try:
+            self.on_jpeg(data)
+        except Exception as e:
+            logger.error(f"Stream {self.name} decode error: {str(e)}")
+
+class MJPEGIngestor:
+    """
+    Reads many HTTP MJPEG cameras on one asyncio event loop thread instead
+    of one blocking VideoCapture thread per camera. Parts are split off the
+    socket without copying and handed as raw JPEG bytes to a small decode
+    thread pool (cv2.imdecode releases the GIL), which can decode them at
+    reduced size. Stalled connections are aborted by a single watchdog, and
+    every stream reconnects with the backoff of a CaptureSupervisor.
+    """
+
+    def __init__(self, decode_workers=None, check_interval=0.5):
+        self.decode_workers = decode_workers or os.cpu_count() or 1
+        self.check_interval = check_interval
+        self.streams = set()
+        self.loop = None
+        self.decoder = None
+        self._thread = None
+
+    @staticmethod
+    def handles(url):
+        """True for the camera URLs the ingestor can read"""
+        return urlparse(url).scheme in ('http', 'https')
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.decoder = concurrent.futures.ThreadPoolExecutor(
+            self.decode_workers, thread_name_prefix='decode')
+        self._thread = threading.Thread(target=self._run, name='mjpeg-ingest')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stream(self, url, name, on_jpeg, accept=None, **kwargs):
+        """
+        Create an MJPEGStream; start() it to connect. Takes the
+        CaptureSupervisor options (timeouts, backoff, metrics, on_state).
+        """
+        return MJPEGStream(self, url, name, on_jpeg, accept, **kwargs)
+
+    def stop(self):
+        """Stop every stream, the event loop and the decode pool"""
+        streams = list(self.streams)
+        for stream in streams:
+            stream.stop(wait=False)
+        for stream in streams:
+            stream.stop()
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+        if self.decoder is not None:
+            self.decoder.shutdown(wait=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.create_task(self._watch())
+        self.loop.run_forever()
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            now = self.loop.time()
+            for stream in list(self.streams):
+                stream.check_deadline(now)
@@ -0,0 +1,155 @@
+import cv2
+import numpy as np
+
+class MotionGate:
+    """
+    Decides where a CCTV frame needs face detection.
+
+    Each frame is downscaled and compared against a running-average
+    background. regions() returns no regions for static frames so detection
+    can be skipped, and otherwise the padded bounding boxes of the moving
+    areas in full-resolution coordinates. An optional static ROI mask
+    (white = watch, black = ignore) limits both motion and detection; with
+    motion=False only the ROI is applied.
+    """
+
+    def __init__(self, motion=True, roi_mask=None, width=160, threshold=25,
+                 min_area=0.002, learning_rate=0.05, padding=0.5,
+                 full_frame_ratio=0.6):
+        self.motion = motion
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.learning_rate = learning_rate
+        self.padding = padding
+        self.full_frame_ratio = full_frame_ratio
+        self.background = None
+        self.frames_checked = 0
+        self.frames_static = 0
+
+        if isinstance(roi_mask, str):
+            mask = cv2.imread(roi_mask, cv2.IMREAD_GRAYSCALE)
+            if mask is None:
+                raise IOError(f'Unable to load ROI mask {roi_mask}')
+            roi_mask = mask
+        self.roi_mask = roi_mask
+        self._small_roi = None
+        self._roi_regions = None
+
+    def reset(self):
+        """Forget the background model, e.g. after a reconnect"""
+        self.background = None
+
+    def regions(self, gray, keep=()):
+        """
+        Return the (x, y, w, h) areas of gray that should be scanned
+        Args:
+            gray: Full-resolution grayscale frame
+            keep: Boxes (e.g. of live tracks) to scan as well whenever the
+                frame is not static
+        Returns:
+            Empty list when nothing moved, otherwise merged regions
+        """
+        self.frames_checked += 1
+        height, width = gray.shape[:2]
+
+        if not self.motion:
+            return self._static_roi_regions(width, height)
+
+        scale = self.width / float(width)
+        small = cv2.resize(gray, (self.width, max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+
+        if self.background is None or self.background.shape != small.shape:
+            # Nothing to compare with yet, scan everything we are allowed to
+            self.background = small.astype(np.float32)
+            return self._static_roi_regions(width, height)
+
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(small, self.background, self.learning_rate)
+
+        _, moving = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        roi = self._small_roi_mask(small.shape)
+        if roi is not None:
+            moving = cv2.bitwise_and(moving, roi)
+        moving = cv2.dilate(moving, None, iterations=2)
+
+        contours, _ = cv2.findContours(moving, cv2.RETR_EXTERNAL,
+                                       cv2.CHAIN_APPROX_SIMPLE)
+        min_area = self.min_area * small.shape[0] * small.shape[1]
+        boxes = [cv2.boundingRect(c) for c in contours
+                 if cv2.contourArea(c) >= min_area]
+        if not boxes:
+            self.frames_static += 1
+            return []
+
+        inv = 1.0 / scale
+        boxes = [(int(x * inv), int(y * inv), int(w * inv), int(h * inv))
+                 for (x, y, w, h) in boxes]
+        boxes.extend(keep)
+        return self._merge(boxes, width, height)
+
+    def _static_roi_regions(self, width, height):
+        if self.roi_mask is None:
+            return [(0, 0, width, height)]
+        if self._roi_regions is None:
+            mask = cv2.resize(self.roi_mask, (width, height),
+                              interpolation=cv2.INTER_NEAREST)
+            contours, _ = cv2.findContours(
+                cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)[1],
+                cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            self._roi_regions = self._merge(
+                [cv2.boundingRect(c) for c in contours], width, height, pad=False)
+        return self._roi_regions
+
+    def _small_roi_mask(self, shape):
+        if self.roi_mask is None:
+            return None
+        if self._small_roi is None or self._small_roi.shape != shape:
+            mask = cv2.resize(self.roi_mask, (shape[1], shape[0]),
+                              interpolation=cv2.INTER_NEAREST)
+            self._small_roi = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)[1]
+        return self._small_roi
+
+    def _merge(self, boxes, width, height, pad=True):
+        # Pad every box so whole faces fit, then union overlapping boxes
+        rects = []
+        for (x, y, w, h) in boxes:
+            px = int(w * self.padding) if pad else 0
+            py = int(h * self.padding) if pad else 0
+            rects.append([max(0, x - px), max(0, y - py),
+                          min(width, x + w + px), min(height, y + h + py)])
+
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(rects)):
+                for j in range(i + 1, len(rects)):
+                    a, b = rects[i], rects[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        rects[i] = [min(a[0], b[0]), min(a[1], b[1]),
+                                    max(a[2], b[2]), max(a[3], b[3])]
+                        del rects[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects)
+        if area >= self.full_frame_ratio * width * height and self.roi_mask is None:
+            return [(0, 0, width, height)]
+        return [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in rects]
+
+def create_motion_gate(motion=None, roi_mask=None):
+    """
+    Build a MotionGate from stream settings, or None when gating is off
+    Args:
+        motion: True, False/None, or a dict of MotionGate keyword arguments
+        roi_mask: Optional path to (or array of) a static ROI mask image
+    """
+    if not motion and roi_mask is None:
+        return None
+    if isinstance(motion, dict):
+        return MotionGate(roi_mask=roi_mask, **motion)
+    return MotionGate(motion=bool(motion), roi_mask=roi_mask)
@@ -0,0 +1,281 @@
+import logging
+import multiprocessing as mp
+import numpy as np
+import os
+import time
+from multiprocessing import shared_memory
+from queue import Empty
+from batch_recognizer import BatchRecognizer
+from detection import Detectors
+from gallery import load_gallery, load_name_mappings
+from preprocess import FramePreprocessor
+from recognise_face_http import create_processor, is_valid_url
+from stream_supervisor import STATES, CaptureSupervisor
+from worker_pool import load_models
+
+logger = logging.getLogger(__name__)
+
+# Largest frame a slot holds by default (1080p BGR)
+MAX_FRAME_SHAPE = (1080, 1920, 3)
+
+# Per-stream counters shared between the processes; STATE holds an index
+# into stream_supervisor.STATES
+CAPTURED, DROPPED, PROCESSED, RECONNECTS, STATE, ERRORS = range(6)
+
+class SharedFrameRing:
+    """
+    Fixed number of frame slots in one shared memory block.
+
+    Frames never travel through a queue: a capture process decodes into a
+    free slot and only (stream, slot, shape, timestamp) is sent to the
+    inference process, which reads the frame in place and hands the slot
+    back through the stream's free-slot queue.
+    """
+
+    def __init__(self, slots=4, max_shape=MAX_FRAME_SHAPE, name=None):
+        self.slots = slots
+        self.max_shape = tuple(max_shape)
+        self.slot_bytes = int(np.prod(self.max_shape))
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True,
+                                                  size=slots * self.slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+    def spec(self):
+        """Arguments another process passes to attach()"""
+        return self.slots, self.max_shape, self.shm.name
+
+    @classmethod
+    def attach(cls, spec):
+        slots, max_shape, name = spec
+        return cls(slots, max_shape, name)
+
+    def view(self, slot, shape):
+        """uint8 array of the given shape backed by a slot"""
+        return np.ndarray(shape, np.uint8, buffer=self.shm.buf,
+                          offset=slot * self.slot_bytes)
+
+    def close(self):
+        """Detach; the creating process also frees the block"""
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def _add(counters, index, amount=1):
+    with counters.get_lock():
+        counters[index] += amount
+
+def capture_process(config, ring_spec, free_slots, tasks, counters, stop_event,
+                    stream_index):
+    """
+    Read one stream and decode its frames straight into the shared ring.
+    Frames that arrive while every slot is busy are grabbed but never
+    decoded. Frames are decoded as luma only where the backend allows it.
+    Reconnects are supervised as in the threaded pipeline.
+    """
+    ring = SharedFrameRing.attach(ring_spec)
+    stream_name = config['name']
+    shape = None
+
+    def read_frame(cap):
+        nonlocal shape
+        if not cap.grab():
+            return False
+        _add(counters, CAPTURED)
+        try:
+            slot = free_slots.get_nowait()
+        except Empty:
+            _add(counters, DROPPED)
+            return True
+
+        # Decode in place when the frame size is already known
+        frame = ring.view(slot, shape) if shape is not None else None
+        ret, decoded = cap.retrieve(frame)
+        if not ret:
+            free_slots.put(slot)
+            raise IOError("Failed to decode frame")
+        if frame is None or not np.may_share_memory(decoded, frame):
+            # First frame or a new resolution; copy it in once
+            if decoded.nbytes > ring.slot_bytes:
+                logger.error(f"Stream {stream_name}: frame {decoded.shape} "
+                             f"exceeds slot size {ring.max_shape}")
+                free_slots.put(slot)
+                _add(counters, DROPPED)
+                return True
+            shape = decoded.shape
+            frame = ring.view(slot, shape)
+            frame[...] = decoded
+        frame = decoded = None
+
+        tasks.put((stream_index, slot, shape, time.time()))
+        return True
+
+    def on_state(state):
+        with counters.get_lock():
+            counters[STATE] = STATES.index(state)
+            counters[RECONNECTS] = supervisor.health.reconnects
+
+    supervisor = CaptureSupervisor(
+        config['url'], stream_name, read_frame,
+        config.get('open_timeout', 10.0), config.get('read_timeout', 10.0),
+        on_state=on_state, stop_event=stop_event,
+        # Inference never draws, so slots only need the luma plane
+        configure=FramePreprocessor(luma=True).configure)
+    try:
+        supervisor.run()
+    finally:
+        ring.close()
+
+def inference_process(streams, tasks, results, stop_event, batch_recognition,
+                      detector=None):
+    """
+    Run detection, tracking and recognition for the streams assigned to
+    this process. Each stream is served by exactly one process, so its
+    tracker sees the frames in order.
+    Args:
+        streams: {stream index: (config, ring spec, free-slot queue, counters)}
+        results: Optional queue receiving every frame result dict
+        detector: Default detector config
+    """
+    if batch_recognition:
+        detectors, recognizer = Detectors(detector), BatchRecognizer(load_gallery())
+    else:
+        detectors, recognizer = load_models(detector=detector)
+    names = load_name_mappings()
+
+    rings = {}
+    processors = {}
+    for index, (config, ring_spec, _, _) in streams.items():
+        rings[index] = SharedFrameRing.attach(ring_spec)
+        processors[index] = create_processor(config, recognizer, detectors,
+                                             names, headless=True)
+
+    try:
+        while not stop_event.is_set():
+            try:
+                index, slot, shape, captured_at = tasks.get(timeout=0.1)
+            except Empty:
+                continue
+
+            _, _, free_slots, counters = streams[index]
+            processor = processors[index]
+            frame = rings[index].view(slot, shape)
+            try:
+                processor.handle_frame(frame, detectors, recognizer)
+                _add(counters, PROCESSED)
+                if results is not None:
+                    results.put(processor.latest_result)
+            except Exception as e:
+                logger.error(f"Processing error in {processor.stream_name}: {str(e)}")
+                _add(counters, ERRORS)
+            finally:
+                frame = None
+                free_slots.put(slot)
+    finally:
+        for ring in rings.values():
+            ring.close()
+
+def run_multiprocess(stream_configs, num_workers=None, batch_recognition=False,
+                     on_result=None, duration=None, detector=None):
+    """
+    Process streams with one capture process per stream and a pool of
+    inference processes
+    Args:
+        stream_configs: Stream config dictionaries as for
+            recognise_face_http.process_multiple_streams. 'buffer_size' is
+            the number of shared frame slots (default 4) and
+            'max_frame_shape' the largest (height, width, 3) frame expected.
+        num_workers: Number of inference processes (defaults to the number
+            of CPU cores, at most one per stream)
+        on_result: Optional callable receiving every frame result dict in
+            this process
+        duration: Stop after this many seconds
+        detector: Detector config of streams without their own 'detector'
+    Returns:
+        {stream name: frame stats} of every stream
+    """
+    configs = []
+    for config in stream_configs:
+        if not is_valid_url(config['url']):
+            logger.error(f"Invalid URL format for stream {config['name']}")
+            continue
+        configs.append(config)
+    if not configs:
+        return {}
+
+    # spawn gives every process its own OpenCV state
+    ctx = mp.get_context('spawn')
+    num_workers = min(num_workers or os.cpu_count() or 1, len(configs))
+    stop_event = ctx.Event()
+    results = ctx.Queue() if on_result is not None else None
+    worker_tasks = [ctx.Queue() for _ in range(num_workers)]
+    worker_streams = [{} for _ in range(num_workers)]
+
+    rings = []
+    processes = []
+    stream_counters = []
+    try:
+        for index, config in enumerate(configs):
+            ring = SharedFrameRing(config.get('buffer_size', 4),
+                                   config.get('max_frame_shape', MAX_FRAME_SHAPE))
+            rings.append(ring)
+            free_slots = ctx.Queue()
+            for slot in range(ring.slots):
+                free_slots.put(slot)
+            counters = ctx.Array('q', ERRORS + 1)
+            stream_counters.append(counters)
+
+            worker = index % num_workers
+            worker_streams[worker][index] = (config, ring.spec(), free_slots, counters)
+            processes.append(ctx.Process(
+                target=capture_process, name=f"capture-{index}", daemon=True,
+                args=(config, ring.spec(), free_slots, worker_tasks[worker],
+                      counters, stop_event, index)))
+
+        workers = [
+            ctx.Process(target=inference_process, name=f"inference-{i}", daemon=True,
+                        args=(worker_streams[i], worker_tasks[i], results,
+                              stop_event, batch_recognition, detector))
+            for i in range(num_workers)
+        ]
+        captures = processes[:]
+        processes.extend(workers)
+        for process in processes:
+            process.start()
+        logger.info(f"Started {len(captures)} capture and {num_workers} inference processes")
+
+        # Capture processes only exit when stopped or if they crash
+        deadline = time.time() + duration if duration is not None else None
+        while any(process.is_alive() for process in captures):
+            if deadline is not None and time.time() >= deadline:
+                break
+            if results is None:
+                time.sleep(0.5)
+                continue
+            try:
+                on_result(results.get(timeout=0.5))
+            except Empty:
+                continue
+
+    except KeyboardInterrupt:
+        logger.info("Program terminated by user")
+    finally:
+        stop_event.set()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        stats = {}
+        for config, counters in zip(configs, stream_counters):
+            stats[config['name']] = {'captured': counters[CAPTURED],
+                                     'processed': counters[PROCESSED],
+                                     'dropped': counters[DROPPED],
+                                     'state': STATES[counters[STATE]],
+                                     'reconnects': counters[RECONNECTS],
+                                     'errors': counters[ERRORS]}
+            logger.info(f"Stream {config['name']} stats: {stats[config['name']]}")
+        for ring in rings:
+            ring.close()
+    return stats
@@ -0,0 +1,202 @@
+import cv2
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+logger = logging.getLogger(__name__)
+
+def draw_faces(frame, faces):
+    """Draw boxes, names and confidences of face results onto a frame"""
+    for face in faces:
+        x, y, w, h = face['box']
+        name = face['name']
+        if face.get('track_id') is not None:
+            name = f"{name} #{face['track_id']}"
+
+        cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
+        cv2.putText(frame, name, (x+5, y-5),
+                   cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        if face.get('confidence') is not None:
+            confidence_text = f"{round(100 - face['confidence'])}%"
+            cv2.putText(frame, confidence_text, (x+5, y+h-5),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 1)
+    return frame
+
+def draw_status(frame, lines):
+    """Draw status lines (FPS, stream name, ...) in the top left corner"""
+    for i, line in enumerate(lines):
+        cv2.putText(frame, line, (10, 30 + 30 * i),
+                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    return frame
+
+def annotate(frame, result):
+    """Draw a frame result (see StreamProcessor.analyze_frame) onto frame"""
+    draw_faces(frame, result['faces'])
+    status = []
+    if result.get('fps') is not None:
+        status.append(f"FPS: {result['fps']:.1f}")
+    if result.get('stream'):
+        status.append(f"Stream: {result['stream']}")
+    return draw_status(frame, status)
+
+class FrameRenderer:
+    """
+    Draws annotated frames off the inference path.
+
+    submit() only stores a reference to the newest frame and result of a
+    stream, so it never blocks the caller. A background thread wakes every
+    `interval` seconds and renders the latest submission of each stream on a
+    copy of the frame. Subclasses decide what to do with the image.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.running = False
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, stream_name, frame, result):
+        """Offer the newest frame and result of a stream"""
+        with self._lock:
+            self._latest[stream_name] = (frame, result)
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            with self._lock:
+                pending = self._latest
+                self._latest = {}
+            for stream_name, (frame, result) in pending.items():
+                try:
+                    self.render(stream_name, annotate(frame.copy(), result))
+                except Exception as e:
+                    logger.error(f"Rendering error in {stream_name}: {str(e)}")
+
+    def render(self, stream_name, image):
+        raise NotImplementedError
+
+class SnapshotWriter(FrameRenderer):
+    """Writes an annotated JPEG per stream every `interval` seconds"""
+
+    def __init__(self, output_dir, interval=5.0, keep_history=False):
+        super().__init__(interval)
+        self.output_dir = output_dir
+        self.keep_history = keep_history
+        os.makedirs(output_dir, exist_ok=True)
+
+    def render(self, stream_name, image):
+        name = "".join(c if c.isalnum() or c in "-_" else "_" for c in stream_name)
+        if self.keep_history:
+            name = f"{name}_{time.strftime('%Y%m%d-%H%M%S')}"
+        cv2.imwrite(os.path.join(self.output_dir, f"{name}.jpg"), image)
+
+class MJPEGPreviewServer(FrameRenderer):
+    """
+    Local MJPEG preview of every stream at a reduced frame rate.
+
+    http://host:port/ lists the streams, /stream/<name> is a multipart MJPEG
+    stream and /snapshot/<name> a single JPEG.
+    """
+
+    def __init__(self, port=8080, host='127.0.0.1', interval=0.5):
+        super().__init__(interval)
+        self.host = host
+        self.port = port
+        self._jpegs = {}
+        self._server = None
+
+    def render(self, stream_name, image):
+        ok, jpeg = cv2.imencode('.jpg', image)
+        if ok:
+            self._jpegs[stream_name] = jpeg.tobytes()
+
+    def start(self):
+        super().start()
+        preview = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/':
+                    links = "".join(
+                        f'<h3>{name}</h3><img src="/stream/{quote(name)}"><br>'
+                        for name in sorted(preview._jpegs))
+                    body = f"<html><body>{links}</body></html>".encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                elif self.path.startswith('/snapshot/'):
+                    jpeg = preview._jpegs.get(unquote(self.path[len('/snapshot/'):]))
+                    if jpeg is None:
+                        self.send_error(404)
+                        return
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'image/jpeg')
+                    self.send_header('Content-Length', str(len(jpeg)))
+                    self.end_headers()
+                    self.wfile.write(jpeg)
+                elif self.path.startswith('/stream/'):
+                    preview._serve_stream(self, unquote(self.path[len('/stream/'):]))
+                else:
+                    self.send_error(404)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        server_thread = threading.Thread(target=self._server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        logger.info(f"MJPEG preview on http://{self.host}:{self.port}/")
+        return self
+
+    def stop(self):
+        super().stop()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _serve_stream(self, handler, stream_name):
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+        handler.end_headers()
+        last = None
+        try:
+            while self.running:
+                jpeg = self._jpegs.get(stream_name)
+                if jpeg is not None and jpeg is not last:
+                    handler.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\n'
+                                        + f'Content-Length: {len(jpeg)}\r\n\r\n'.encode()
+                                        + jpeg + b'\r\n')
+                    last = jpeg
+                time.sleep(self.interval)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def create_renderers(snapshot_dir=None, snapshot_interval=5.0, preview_port=None,
+                     preview_interval=0.5):
+    """Start the optional snapshot writer and MJPEG preview"""
+    renderers = []
+    if snapshot_dir:
+        renderers.append(SnapshotWriter(snapshot_dir, snapshot_interval).start())
+    if preview_port:
+        renderers.append(MJPEGPreviewServer(preview_port, interval=preview_interval).start())
+    return renderers
@@ -0,0 +1,129 @@
+import cv2
+import numpy as np
+import threading
+
+# imdecode flags by (luma, reduction); reduced decoding skips most of the
+# IDCT work instead of resizing afterwards
+DECODE_FLAGS = {
+    (False, 1): cv2.IMREAD_COLOR,
+    (False, 2): cv2.IMREAD_REDUCED_COLOR_2,
+    (False, 4): cv2.IMREAD_REDUCED_COLOR_4,
+    (False, 8): cv2.IMREAD_REDUCED_COLOR_8,
+    (True, 1): cv2.IMREAD_GRAYSCALE,
+    (True, 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (True, 4): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (True, 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+class FramePreprocessor:
+    """
+    Turns decoded frames into the grayscale image the detector needs with
+    as few allocations as possible, per stream.
+
+    - luma: ask the FFmpeg decoder for its luma (Y) plane instead of a BGR
+      frame (CAP_PROP_CONVERT_RGB off), so headless streams never build
+      a color image or convert it. Y is limited range (16-235), which the
+      cascade and LBPH are insensitive to.
+    - recycle: decode into frame buffers returned with release() instead
+      of a fresh array per frame. Only safe when nothing else keeps
+      frames, i.e. headless streams without renderers.
+    - gray() converts color frames into one reused buffer (dst=); the
+      tracker and motion gate copy what they keep, and a stream is never
+      analyzed on two threads at once.
+
+    Allocations and explicit copies are counted, so the savings show up in
+    the metrics at high resolutions.
+    """
+
+    def __init__(self, luma=False, recycle=False, pool_size=4, metrics=None):
+        self.luma = luma
+        self.recycle = recycle
+        self.pool_size = pool_size
+        self.frames = 0
+        self.allocations = 0
+        self.bytes_allocated = 0
+        self.bytes_copied = 0
+        self._free = []
+        self._gray = None
+        self._lock = threading.Lock()
+        if metrics is not None:
+            metrics.set_counter('frame_allocations', lambda: self.allocations)
+            metrics.set_counter('frame_bytes_allocated', lambda: self.bytes_allocated)
+            metrics.set_counter('frame_bytes_copied', lambda: self.bytes_copied)
+
+    def configure(self, cap):
+        """Set up a newly opened capture; returns True if it delivers luma"""
+        if self.luma and cap.getBackendName() == 'FFMPEG':
+            if not cap.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+                return False
+            # The backend warns about the raw pixel format on every frame
+            # (yuv420p/yuvj420p "treated as 8UC1"); OpenCV's log level is
+            # process wide, so only errors are logged once luma is in use
+            cv2.utils.logging.setLogLevel(cv2.utils.logging.LOG_LEVEL_ERROR)
+            return True
+        return False
+
+    def retrieve(self, cap):
+        """cap.retrieve() into a recycled buffer when one is free"""
+        buffer = None
+        if self.recycle:
+            with self._lock:
+                buffer = self._free.pop() if self._free else None
+        ret, frame = cap.retrieve(buffer)
+        if ret:
+            self.frames += 1
+            if buffer is None or not np.may_share_memory(frame, buffer):
+                # New stream, new resolution or nothing free yet
+                self._allocated(frame.nbytes)
+        return ret, frame
+
+    def decode(self, data, reduce=1):
+        """
+        Decode a JPEG (bytes or memoryview, used without copying) at
+        1/reduce of its size; luma streams only decode the Y channel
+        Returns:
+            The frame, or None if the data is not a valid image
+        """
+        if (self.luma, reduce) not in DECODE_FLAGS:
+            raise ValueError(f"Unsupported decode reduction: {reduce}")
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), DECODE_FLAGS[self.luma, reduce])
+        if frame is not None:
+            # imdecode cannot decode into an existing buffer
+            self.frames += 1
+            self._allocated(frame.nbytes)
+        return frame
+
+    def release(self, frame):
+        """Hand a frame from retrieve() back once nothing uses it anymore"""
+        if not self.recycle or frame is None:
+            return
+        with self._lock:
+            if len(self._free) < self.pool_size:
+                self._free.append(frame)
+
+    def gray(self, frame):
+        """The grayscale version of a frame; luma frames are used as is"""
+        if frame.ndim == 2:
+            return frame
+        shape = frame.shape[:2]
+        if self._gray is None or self._gray.shape != shape:
+            self._gray = np.empty(shape, np.uint8)
+            self._allocated(self._gray.nbytes)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+    def copy(self, frame):
+        """frame.copy(), counted"""
+        self.bytes_copied += frame.nbytes
+        return frame.copy()
+
+    def get_stats(self):
+        frames = max(self.frames, 1)
+        return {
+            'allocations_per_frame': round(self.allocations / frames, 3),
+            'bytes_allocated_per_frame': round(self.bytes_allocated / frames),
+            'bytes_copied_per_frame': round(self.bytes_copied / frames),
+        }
+
+    def _allocated(self, nbytes):
+        self.allocations += 1
+        self.bytes_allocated += nbytes
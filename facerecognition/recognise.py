@@ -1,17 +1,36 @@
 import cv2
+from detection import detect_faces, load_detector
+from tracker import FaceTracker
 
 # Use openCV to recognise the face
 
-def recognize_faces():
-    """Recognizes faces from the laptop camera."""
+def recognize_faces(detect_interval=5, detect_scale=1.0, detector=None):
+    """
+    Recognizes faces from the laptop camera.
+    Args:
+        detect_interval: Run the face detector every N frames and track the
+            faces in between
+        detect_scale: Run the detector on a frame resized by this factor
+        detector: Detector backend: 'haar' (default), 'lbp', 'yunet' or a
+            config dict (see detection.detector_config)
+    """
 
-    # Load the pre-trained Haar cascade classifier for face detection.
-    # You may need to download 'haarcascade_frontalface_default.xml'
-    # and place it in the same directory as this script, or provide the full path.
-    face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
+    # Load the face detector. The Haar cascade needs
+    # 'haarcascade_frontalface_default.xml' in the same directory as this
+    # script; the other backends need their own model file.
+    face_detector = load_detector(detector)
 
-    if face_cascade.empty():
-        raise IOError('Unable to load the face cascade classifier')
+    def detect(gray):
+        return detect_faces(
+            face_detector,
+            gray,
+            scale=detect_scale, # Smaller is faster on large frames
+            scaleFactor=1.3, # Adjust scaleFactor for better detection
+            minNeighbors=5,  # Adjust minNeighbors to reduce false positives
+            minSize=(30, 30) # Minimum face size
+        )
+
+    tracker = FaceTracker(detect_interval)
 
     # Open the default camera (camera index 0).
     cap = cv2.VideoCapture(0)
@@ -26,17 +45,15 @@ def recognize_faces():
         # Convert the frame to grayscale for face detection.
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-        # Detect faces in the grayscale frame.
-        faces = face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.3, # Adjust scaleFactor for better detection
-            minNeighbors=5,  # Adjust minNeighbors to reduce false positives
-            minSize=(30, 30) # Minimum face size
-        )
+        # Detect or track faces in the grayscale frame.
+        tracks = tracker.update(gray, detect)
 
-        # Draw rectangles around the detected faces.
-        for (x, y, w, h) in faces:
+        # Draw rectangles around the tracked faces.
+        for track in tracks:
+            x, y, w, h = track.box
             cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2) # Green rectangle
+            cv2.putText(frame, f"#{track.track_id}", (x + 5, y - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
 
         # Display the frame with detected faces.
         cv2.imshow('Face Recognition', frame)
@@ -50,4 +67,9 @@ def recognize_faces():
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    recognize_faces()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Detect faces in the camera')
+    parser.add_argument('--detector',
+                        help='Detector backend: haar, lbp, yunet or a JSON config')
+    recognize_faces(detector=parser.parse_args().detector)
\ No newline at end of file
@@ -1,6 +1,12 @@
 import cv2
 import logging
 import os
+from batch_recognizer import BatchRecognizer, predict_faces
+from detection import detect_faces, load_detector
+from events import EventDispatcher, LogSink
+from gallery import load_gallery, load_name_mappings
+from lbph_model import load_recognizer
+from tracker import FaceTracker
 
 logging.basicConfig(
     level=logging.INFO,
@@ -8,63 +14,74 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def load_name_mappings():
-    """Load the trained mappings from faces.txt"""
-    names = {}
-    with open("faces.txt", "r") as f:
-        for line in f:
-            face_id, name = line.strip().split(":")
-            names[int(face_id)] = name
-    return names
+def recognize_faces(detect_interval=5, detect_scale=1.0, detector=None,
+                    batch_recognition=False):
+    """
+    Recognizes faces from the laptop camera.
+    Args:
+        detect_interval: Run the face detector every N frames and track the
+            faces in between, reusing each track's recognized identity
+        detect_scale: Run the detector on a frame resized by this factor;
+            faces are still recognized from the full-resolution frame
+        detector: Detector backend: 'haar' (default), 'lbp', 'yunet' or a
+            config dict (see detection.detector_config)
+        batch_recognition: Recognize a frame's faces in one vectorized
+            batch against the shared gallery (gallery.load_gallery) instead
+            of calling the LBPH model once per face
+    """
 
-def recognize_faces():
-    """Recognizes faces from the laptop camera."""
-
-    # Load the trained model
-    recognizer = cv2.face.LBPHFaceRecognizer_create()
-    recognizer.read('trainer/trainer.yml')
-    
-    face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
+    # Load the trained model, or the shared gallery for batch recognition
+    recognizer = BatchRecognizer(load_gallery()) if batch_recognition else load_recognizer()
     
-    if face_cascade.empty():
-        raise IOError('Unable to load the face cascade classifier')
+    face_detector = load_detector(detector)
 
     # Load name mappings
     names = load_name_mappings()
-    
-    cap = cv2.VideoCapture(0)
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(
+    def detect(gray):
+        return detect_faces(
+            face_detector,
             gray,
+            scale=detect_scale,
             scaleFactor=1.3,
             minNeighbors=5,
             minSize=(30, 30)
         )
 
-        for (x, y, w, h) in faces:
-            # Recognize the face
-            roi_gray = gray[y:y+h, x:x+w]
-            id_, confidence = recognizer.predict(roi_gray)
-            
+    def identify(gray, boxes):
+        results = []
+        for id_, confidence in predict_faces(recognizer, gray, boxes):
             # If confidence is less than 100, it's a perfect match
             # Lower confidence is better
             if confidence < 100:
-                name = names.get(id_, "unknown")
-                confidence_text = f"{round(100 - confidence)}%"
-                logger.info(f"Detected {name} with confidence {confidence_text}")
+                results.append((names.get(id_, "unknown"), confidence))
             else:
-                name = "unknown"
-                confidence_text = f"{round(100 - confidence)}%"
+                results.append(("unknown", confidence))
+        return results
+
+    tracker = FaceTracker(detect_interval)
+    # Recognitions are logged as debounced enter/update/leave events
+    events = EventDispatcher([LogSink()]).start()
+    
+    cap = cv2.VideoCapture(0)
+    
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        tracks = tracker.update(gray, detect, identify)
+        events.publish({'stream': 'camera', 'faces': [t.to_dict() for t in tracks]})
+
+        for track in tracks:
+            x, y, w, h = track.box
+            name = track.name
+            confidence_text = f"{round(100 - track.confidence)}%"
             
             # Draw rectangle and put text
             cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            cv2.putText(frame, name, (x+5, y-5), 
+            cv2.putText(frame, f"{name} #{track.track_id}", (x+5, y-5), 
                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
             cv2.putText(frame, confidence_text, (x+5, y+h-5), 
                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 1)
@@ -75,7 +92,16 @@ def recognize_faces():
             break
 
     cap.release()
+    events.stop()
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    recognize_faces()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Recognize faces in the camera')
+    parser.add_argument('--detector',
+                        help='Detector backend: haar, lbp, yunet or a JSON config')
+    parser.add_argument('--batch-recognition', action='store_true',
+                        help='Recognize against the vectorized gallery')
+    args = parser.parse_args()
+    recognize_faces(detector=args.detector, batch_recognition=args.batch_recognition)
\ No newline at end of file
@@ -6,8 +6,22 @@ import numpy as np
 import requests
 from urllib.parse import urlparse
 import threading
-from queue import Queue
+from queue import Empty
 import concurrent.futures
+from batch_recognizer import BatchRecognizer, predict_faces
+from detection import Detectors, detect_faces, detector_key
+from events import EventDispatcher, add_event_arguments, create_event_sinks, sinks_from_args
+from frame_buffer import create_frame_buffer
+from governor import FrameRateGovernor
+from gallery import load_gallery, load_name_mappings
+from metrics import REGISTRY, start_metrics
+from mjpeg_ingest import MJPEGIngestor
+from motion import create_motion_gate
+from overlay import annotate, create_renderers
+from preprocess import FramePreprocessor
+from stream_supervisor import HEALTHY, CaptureSupervisor
+from tracker import FaceTracker
+from worker_pool import InferenceWorkerPool, load_models
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,132 +29,325 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Per-stream detect_faces parameters accepted in stream configs
+DETECT_PARAMS = ('scaleFactor', 'minNeighbors', 'minSize')
+
 class StreamProcessor:
-    def __init__(self, stream_url, stream_name, recognizer, face_cascade, names):
+    def __init__(self, stream_url, stream_name, recognizer, detectors, names,
+                 pool=None, capture_mode='queue', buffer_size=10,
+                 detect_interval=5, motion_gate=None, detect_scale=1.0,
+                 headless=False, renderers=(), on_result=None, metrics=None,
+                 open_timeout=10.0, read_timeout=10.0, target_fps=None,
+                 priority=0, detect_params=None, latency_target=None,
+                 ingestor=None, decode_reduce=1, detector=None):
         self.stream_url = stream_url
         self.stream_name = stream_name
         self.recognizer = recognizer
-        self.face_cascade = face_cascade
+        self.detectors = detectors
         self.names = names
+        self.pool = pool
+        self.latest_frame = None
+        self.latest_result = None
         self.running = False
-        self.last_frame_time = time.time()
         self.fps = 0
-        self.frame_queue = Queue(maxsize=10)
-        self.retry_count = 0
-        self.max_retries = 5
+        # Per-stage latencies, counters and gauges (see metrics.py)
+        self.metrics = metrics or REGISTRY.stream(stream_name)
+        # HTTP cameras are read by the shared asyncio ingestor when there is
+        # one; its JPEGs are decoded at 1/decode_reduce (1, 2, 4 or 8) size
+        self.ingested = ingestor is not None and ingestor.handles(stream_url)
+        self.decode_reduce = decode_reduce
+        self.decode_errors = 0
+        # Without anything drawing, frames are decoded as luma only into
+        # recycled buffers; otherwise gray is converted into a reused buffer
+        color_needed = not headless or bool(renderers)
+        self.preprocess = FramePreprocessor(luma=not color_needed,
+                                            recycle=not color_needed and not self.ingested,
+                                            pool_size=buffer_size + 2,
+                                            metrics=self.metrics)
+        # 'queue' drops new frames when full, 'latest'/'ring' drop the oldest
+        self.capture_mode = capture_mode
+        self.frame_queue = create_frame_buffer(
+            capture_mode, buffer_size,
+            on_drop=lambda item: self.preprocess.release(item[1]))
+        self.frames_processed = 0
+        # Per-stream tracks; the pool never runs two frames of a stream at once
+        self.tracker = FaceTracker(detect_interval)
+        # Optional motion/ROI gate deciding where detection runs
+        self.motion_gate = motion_gate
+        # Detection runs on a resized copy; recognition uses the full frame
+        self.detect_scale = detect_scale
+        # scaleFactor, minNeighbors and minSize for detect_faces
+        self.detect_params = detect_params or {}
+        # Detector backend config of this camera, resolved once; None uses
+        # the default of the Detectors passed in
+        self.detector_key = detector_key(detector) if detector is not None else None
+        # Frames above target_fps are grabbed but never decoded
+        self.target_fps = target_fps
+        self.frames_skipped = 0
+        self._next_frame_at = 0.0
+        # Scheduling priority of the stream (higher is more important) and
+        # the frame latency the governor aims for (see governor.py)
+        self.priority = priority
+        self.latency_target = latency_target
+        # Lower frame rate and detection scale set by the governor under
+        # load; None leaves target_fps and detect_scale as configured
+        self.fps_limit = None
+        self.scale_limit = None
+        # Headless processors never draw; renderers (overlay.FrameRenderer)
+        # get the raw frame and result and draw on their own threads
+        self.headless = headless
+        self.renderers = list(renderers)
+        self.on_result = on_result
+        self.metrics.set_counter('frames_captured', lambda: self.frame_queue.captured)
+        self.metrics.set_counter('frames_dropped', lambda: self.frame_queue.dropped)
+        self.metrics.set_counter('frames_processed', lambda: self.frames_processed)
+        self.metrics.set_counter('frames_skipped', lambda: self.frames_skipped)
+        self.metrics.set_gauge('queue_depth', self.frame_queue.qsize)
+        self.metrics.set_counter('decode_errors', lambda: self.decode_errors)
+        if self.ingested:
+            # Read on the ingestor's event loop, decoded on its pool
+            self.supervisor = ingestor.stream(
+                stream_url, stream_name, self.decode_jpeg, accept=self._want_frame,
+                open_timeout=open_timeout, read_timeout=read_timeout,
+                metrics=self.metrics, on_state=self._on_stream_state)
+        else:
+            # Connects, reads and reconnects with backoff on its own thread
+            self.supervisor = CaptureSupervisor(
+                stream_url, stream_name, self.capture_frame, open_timeout,
+                read_timeout, metrics=self.metrics, on_state=self._on_stream_state,
+                configure=self.preprocess.configure)
+
+    @property
+    def health(self):
+        """Connection state of the stream (stream_supervisor.StreamHealth)"""
+        return self.supervisor.health
+
+    @property
+    def is_live(self):
+        return self.supervisor.health.is_live
+
+    @property
+    def effective_scale(self):
+        """Detection scale after the governor's limit"""
+        if self.scale_limit is None:
+            return self.detect_scale
+        return min(self.detect_scale, self.scale_limit)
 
     def start(self):
         """Start processing the stream"""
         self.running = True
-        # Start capture thread
-        self.capture_thread = threading.Thread(target=self.capture_stream)
-        self.capture_thread.daemon = True
-        self.capture_thread.start()
-        # Start processing thread
-        self.process_thread = threading.Thread(target=self.process_frames)
-        self.process_thread.daemon = True
-        self.process_thread.start()
-
-    def stop(self):
+        self.supervisor.start()
+        # Frames are processed by the shared pool when one is given
+        if self.pool is None:
+            self.process_thread = threading.Thread(target=self.process_frames)
+            self.process_thread.daemon = True
+            self.process_thread.start()
+
+    def stop(self, wait=True):
         """Stop processing the stream"""
         self.running = False
-        if hasattr(self, 'cap'):
-            self.cap.release()
+        # The supervisor releases its VideoCapture itself; releasing it
+        # here while read() is running can crash OpenCV
+        self.supervisor.stop(wait)
 
-    def capture_stream(self):
-        """Capture frames from the stream"""
-        while self.running and self.retry_count < self.max_retries:
-            try:
-                self.cap = cv2.VideoCapture(self.stream_url)
-                if not self.cap.isOpened():
-                    raise Exception("Failed to open stream")
-
-                while self.running:
-                    ret, frame = self.cap.read()
-                    if not ret:
-                        raise Exception("Failed to read frame")
-                    
-                    if not self.frame_queue.full():
-                        self.frame_queue.put(frame)
-                    
-                    # Reset retry count on successful frame
-                    self.retry_count = 0
+    def retune(self, **settings):
+        """
+        Change detection settings of a running stream without reconnecting.
+        Accepts detect_interval, motion_gate, detect_scale, detect_params,
+        target_fps, priority, latency_target and detector.
+        """
+        for key, value in settings.items():
+            if key == 'detect_interval':
+                self.tracker.detect_interval = max(1, value)
+            elif key == 'detector':
+                self.detector_key = detector_key(value) if value is not None else None
+            elif key in ('motion_gate', 'detect_scale', 'detect_params',
+                         'target_fps', 'priority', 'latency_target'):
+                setattr(self, key, value)
+            else:
+                raise ValueError(f"Setting {key} cannot be changed on a running stream")
 
-            except Exception as e:
-                logger.error(f"Stream {self.stream_name} error: {str(e)}")
-                self.retry_count += 1
-                time.sleep(2)
-                continue
+    def capture_frame(self, cap):
+        """Read one frame into the buffer; called by the capture supervisor"""
+        with self.metrics.time('capture'):
+            if not cap.grab():
+                return False
+            if not self._want_frame():
+                return True
+            ret, frame = self.preprocess.retrieve(cap)
+        if not ret:
+            return False
+        self._queue_frame(frame)
+        return True
+
+    def decode_jpeg(self, data):
+        """Decode a JPEG from the ingestor into the buffer; runs on its decode pool"""
+        with self.metrics.time('decode'):
+            frame = self.preprocess.decode(data, self.decode_reduce)
+        if frame is None:
+            self.decode_errors += 1
+            return
+        self._queue_frame(frame)
+
+    def _want_frame(self):
+        """Decide whether a received frame is worth decoding"""
+        target_fps = min((fps for fps in (self.target_fps, self.fps_limit) if fps),
+                         default=None)
+        if target_fps:
+            now = time.perf_counter()
+            if now < self._next_frame_at:
+                self.frames_skipped += 1
+                return False
+            self._next_frame_at = max(self._next_frame_at + 1.0 / target_fps, now)
+        if self.frame_queue.would_drop():
+            # The frame would be rejected anyway, so don't decode it
+            self.frame_queue.drop()
+            return False
+        return True
+
+    def _queue_frame(self, frame):
+        # Queued with its arrival time to measure the queue wait
+        if (self.frame_queue.put((time.perf_counter(), frame))
+                and self.pool is not None):
+            self.pool.notify(self)
+
+    def _on_stream_state(self, state):
+        if state != HEALTHY:
+            # Frames from before a disconnect are stale by the time the
+            # stream is back
+            self.frame_queue.clear()
 
     def process_frames(self):
         """Process frames from the queue"""
         while self.running:
             try:
-                if not self.frame_queue.empty():
-                    frame = self.frame_queue.get()
-                    
-                    # Calculate FPS
-                    current_time = time.time()
-                    self.fps = 1 / (current_time - self.last_frame_time)
-                    self.last_frame_time = current_time
-
-                    # Process frame
-                    processed_frame = self.process_single_frame(frame)
-                    
-                    # Display the frame
-                    cv2.imshow(f'Stream: {self.stream_name}', processed_frame)
-                    
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        self.running = False
-                        break
+                # Sleep through outages instead of polling a dead stream
+                if not self.supervisor.wait_live(0.5):
+                    continue
+                # Block briefly instead of spinning on an empty queue
+                try:
+                    queued_at, frame = self.frame_queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                self.metrics.observe('queue_wait', time.perf_counter() - queued_at)
+
+                try:
+                    processed_frame = self.handle_frame(frame)
+                finally:
+                    self.preprocess.release(frame)
+                if self.headless:
+                    continue
+
+                # Display the frame
+                cv2.imshow(f'Stream: {self.stream_name}', processed_frame)
+
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    self.running = False
+                    break
             except Exception as e:
                 logger.error(f"Processing error in {self.stream_name}: {str(e)}")
                 continue
 
-    def process_single_frame(self, frame):
-        """Process a single frame"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.3,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
-
-        for (x, y, w, h) in faces:
-            roi_gray = gray[y:y+h, x:x+w]
-            id_, confidence = self.recognizer.predict(roi_gray)
-            
-            if confidence < 100:
-                name = self.names.get(id_, "unknown")
-                confidence_text = f"{round(100 - confidence)}%"
-                logger.info(f"Stream {self.stream_name}: Detected {name} with confidence {confidence_text}")
-            else:
-                name = "unknown"
-                confidence_text = f"{round(100 - confidence)}%"
-            
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            cv2.putText(frame, name, (x+5, y-5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            cv2.putText(frame, confidence_text, (x+5, y+h-5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 1)
-
-        # Add FPS and stream info
-        cv2.putText(frame, f'FPS: {self.fps:.1f}', (10, 30),
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        cv2.putText(frame, f'Stream: {self.stream_name}', (10, 60),
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
-        return frame
-
-def load_name_mappings():
-    """Load the trained mappings from faces.txt"""
-    names = {}
-    with open("faces.txt", "r") as f:
-        for line in f:
-            face_id, name = line.strip().split(":")
-            names[int(face_id)] = name
-    return names
+    def has_pending_frames(self):
+        """Return True if captured frames are waiting to be processed"""
+        return not self.frame_queue.empty()
+
+    def process_next_frame(self, detectors, recognizer):
+        """Process one queued frame with the models of a pool worker"""
+        try:
+            queued_at, frame = self.frame_queue.get_nowait()
+        except Empty:
+            return
+        self.metrics.observe('queue_wait', time.perf_counter() - queued_at)
+        try:
+            self.latest_frame = self.handle_frame(frame, detectors, recognizer)
+        finally:
+            self.preprocess.release(frame)
+
+    def handle_frame(self, frame, detectors=None, recognizer=None):
+        """
+        Update the FPS counter, analyze a frame and hand the result to the
+        renderers and the result callback
+        Returns:
+            The annotated frame, or None in headless mode
+        """
+        self.fps = self.metrics.tick()
+        self.frames_processed += 1
+
+        with self.metrics.time('total'):
+            result = self.analyze_frame(frame, detectors, recognizer)
+            self.latest_result = result
+            for renderer in self.renderers:
+                renderer.submit(self.stream_name, frame, result)
+            if self.on_result is not None:
+                self.on_result(result)
+
+            if self.headless:
+                return None
+            # Renderers still hold the raw frame, so draw on a copy
+            with self.metrics.time('draw'):
+                return annotate(self.preprocess.copy(frame) if self.renderers else frame,
+                                result)
+
+    def get_stats(self):
+        """Return frame counts and the connection state"""
+        return {
+            'captured': self.frame_queue.captured,
+            'processed': self.frames_processed,
+            'dropped': self.frame_queue.dropped,
+            'queued': self.frame_queue.qsize(),
+            'skipped': self.frames_skipped,
+            'decode_errors': self.decode_errors,
+            'state': self.health.state,
+            'reconnects': self.health.reconnects,
+            **self.preprocess.get_stats(),
+        }
+
+    def process_single_frame(self, frame, detectors=None, recognizer=None):
+        """Process a single frame and return it annotated"""
+        return annotate(frame, self.analyze_frame(frame, detectors, recognizer))
+
+    def analyze_frame(self, frame, detectors=None, recognizer=None):
+        """
+        Detect, track and recognize the faces of a frame without drawing
+        Returns:
+            {'stream', 'timestamp', 'fps', 'faces'}; faces holds one
+            Track.to_dict() per active track
+        """
+        detector = (detectors or self.detectors).get_key(self.detector_key)
+        recognizer = recognizer or self.recognizer
+
+        def detect(gray):
+            regions = None
+            if self.motion_gate is not None:
+                with self.metrics.time('motion'):
+                    regions = self.motion_gate.regions(
+                        gray, [t.box for t in self.tracker.tracks])
+                if not regions:
+                    return None  # Static frame, keep tracking only
+            with self.metrics.time('detect'):
+                return detect_faces(detector, gray, regions,
+                                    scale=self.effective_scale, **self.detect_params)
+
+        def identify(gray, boxes):
+            # All new faces of the frame are recognized together
+            with self.metrics.time('recognize'):
+                return [
+                    (self.names.get(id_, "unknown") if confidence < 100 else "unknown",
+                     confidence)
+                    for id_, confidence in predict_faces(recognizer, gray, boxes)
+                ]
+
+        with self.metrics.time('gray'):
+            gray = self.preprocess.gray(frame)
+        tracks = self.tracker.update(gray, detect, identify)
+
+        return {
+            'stream': self.stream_name,
+            'timestamp': time.time(),
+            'fps': self.fps,
+            'faces': [track.to_dict() for track in tracks],
+        }
 
 def is_valid_url(url):
     """Validate URL format"""
@@ -150,46 +357,213 @@ def is_valid_url(url):
     except:
         return False
 
-def process_multiple_streams(stream_configs):
+def stream_settings(config):
+    """
+    StreamProcessor settings of a stream config that can be changed on a
+    running stream with StreamProcessor.retune()
+    """
+    detect_params = {key: config[key] for key in DETECT_PARAMS if key in config}
+    if 'minSize' in detect_params:
+        detect_params['minSize'] = tuple(detect_params['minSize'])
+    return {
+        'detect_interval': config.get('detect_interval', 5),
+        'motion_gate': create_motion_gate(config.get('motion'),
+                                          config.get('roi_mask')),
+        'detect_scale': config.get('detect_scale', 1.0),
+        'detect_params': detect_params,
+        'target_fps': config.get('target_fps'),
+        'priority': config.get('priority', 0),
+        'latency_target': config.get('latency_target'),
+        'detector': config.get('detector'),
+    }
+
+def create_processor(config, recognizer, detectors, names, **kwargs):
+    """Create a StreamProcessor from one stream config dictionary"""
+    if config.get('ingest') == 'opencv':
+        # This camera keeps its own VideoCapture thread
+        kwargs['ingestor'] = None
+    return StreamProcessor(
+        config['url'],
+        config['name'],
+        recognizer,
+        detectors,
+        names,
+        capture_mode=config.get('capture_mode', 'queue'),
+        buffer_size=config.get('buffer_size', 10),
+        open_timeout=config.get('open_timeout', 10.0),
+        read_timeout=config.get('read_timeout', 10.0),
+        decode_reduce=config.get('decode_reduce', 1),
+        **stream_settings(config),
+        **kwargs
+    )
+
+def process_multiple_streams(stream_configs, num_workers=None,
+                             batch_recognition=False, headless=False,
+                             snapshot_dir=None, snapshot_interval=5.0,
+                             preview_port=None, on_result=None,
+                             multiprocess=False, metrics_port=None,
+                             metrics_log_interval=60.0, duration=None,
+                             event_sinks=None, config_path=None,
+                             latency_target=None, async_ingest=False,
+                             decode_workers=None, detector=None, coordinator=None,
+                             node_name=None, node_capacity=None):
     """
     Process multiple streams simultaneously
     Args:
-        stream_configs: List of dictionaries containing stream URLs and names
+        stream_configs: List of dictionaries containing stream URLs and names,
+            plus an optional 'capture_mode' ('queue', 'ring' or 'latest')
+            and 'buffer_size', 'detect_interval', 'motion' (True or a dict
+            of motion.MotionGate settings), 'roi_mask' (mask image path),
+            'detect_scale', 'open_timeout'/'read_timeout' in seconds,
+            'target_fps', 'priority', 'decode_reduce', 'ingest', 'detector'
+            (see detection.detector_config) and the detector's
+            'scaleFactor', 'minNeighbors' and 'minSize'. Ignored when
+            config_path is given.
+        num_workers: Size of the shared inference pool (defaults to the
+            number of CPU cores). Pass 0 to give every stream its own
+            processing thread sharing one cascade and recognizer.
+        batch_recognition: Recognize each frame's faces in one vectorized
+            batch against the shared gallery (gallery.load_gallery) instead
+            of calling the LBPH model once per face
+        headless: Never draw or open windows; frames only go through
+            detection and recognition
+        snapshot_dir: Write an annotated JPEG per stream to this directory
+            every snapshot_interval seconds
+        preview_port: Serve an MJPEG preview of all streams on this local port
+        on_result: Optional callable receiving every frame result dict
+        multiprocess: Capture and infer in separate processes that exchange
+            frames through shared memory (see multiprocess_pipeline). Always
+            headless; num_workers is the number of inference processes.
+        metrics_port: Serve per-stage latency histograms, queue depths,
+            drops and reconnects on http://127.0.0.1:<port>/metrics
+        metrics_log_interval: Seconds between metrics summaries in the log
+            (0 to disable)
+        duration: Stop after this many seconds instead of running until
+            interrupted
+        event_sinks: Sinks (see events.py) receiving debounced enter,
+            update and leave events; recognitions are logged by default
+        config_path: Camera config file (see fleet.py) watched for changes;
+            cameras are added, removed and retuned while running
+        latency_target: Frame latency in seconds to aim for under load. The
+            governor (see governor.py) then thins and downscales streams by
+            priority when they need more than the workers can deliver;
+            cameras may set their own 'latency_target'.
+        async_ingest: Read HTTP MJPEG cameras on one asyncio event loop
+            (see mjpeg_ingest.py) instead of a VideoCapture thread per
+            camera. Cameras may set 'decode_reduce' (2, 4 or 8) to decode
+            at reduced size, or 'ingest': 'opencv' to keep VideoCapture.
+        decode_workers: JPEG decode threads of the ingestor (defaults to
+            the number of CPU cores)
+        detector: Detector backend of cameras without a 'detector' of
+            their own: 'haar' (default), 'lbp', 'yunet' or a config dict
+        coordinator: URL of a cluster.Coordinator. The streams are then
+            the ones it assigns to this node instead of stream_configs or
+            config_path, and results and stats are reported back to it.
+        node_name, node_capacity: Name and capacity (seconds of processing
+            per second) this node registers with; default to the host name
+            and process id, and to the number of inference workers
+    Returns:
+        {stream name: frame stats} of every stream
     """
-    # Load face recognition resources
-    recognizer = cv2.face.LBPHFaceRecognizer_create()
-    recognizer.read('trainer/trainer.yml')
-    
-    face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
-    
-    if face_cascade.empty():
-        raise IOError('Unable to load the face cascade classifier')
+    # Recognitions become debounced events, written off the inference path
+    events = EventDispatcher(event_sinks or create_event_sinks()).start()
+    user_on_result = on_result
+    cluster_node = None
+
+    def on_result(result):
+        events.publish(result)
+        if cluster_node is not None:
+            cluster_node.record(result)
+        if user_on_result is not None:
+            user_on_result(result)
+
+    # Imported here because fleet builds on this module
+    from fleet import FleetManager, load_fleet_config
+
+    if multiprocess:
+        if coordinator is not None:
+            raise ValueError("Cluster nodes are not supported in multiprocess mode")
+        if snapshot_dir or preview_port:
+            raise ValueError("Snapshots and previews are not supported in multiprocess mode")
+        if config_path is not None:
+            logger.warning("Multiprocess mode reads the camera config once, without hot reload")
+            stream_configs = load_fleet_config(config_path)
+        if latency_target is not None:
+            logger.warning("The frame rate governor is not supported in multiprocess mode")
+        if async_ingest:
+            logger.warning("The asyncio ingestor is not supported in multiprocess mode")
+        # Imported here because multiprocess_pipeline builds on this module
+        from multiprocess_pipeline import run_multiprocess
+        try:
+            return run_multiprocess(stream_configs, num_workers, batch_recognition,
+                                    on_result, duration, detector)
+        finally:
+            events.stop()
+
+    pool = None
+    recognizer = None
+    detectors = None
+
+    if batch_recognition:
+        batch_recognizer = BatchRecognizer(load_gallery())
+        logger.info(f"Loaded {len(batch_recognizer.gallery)} gallery faces for batch recognition")
+
+        def model_loader():
+            # Workers share the gallery but each gets its own crop buffer
+            return Detectors(detector), batch_recognizer.clone()
+    else:
+        def model_loader():
+            return load_models(detector=detector)
+
+    if num_workers == 0:
+        # Load face recognition resources
+        detectors, recognizer = model_loader()
+    else:
+        # Every pool worker loads its own detectors and recognizer
+        pool = InferenceWorkerPool(num_workers, model_loader)
 
     names = load_name_mappings()
+    # Drawing happens on the renderers' own threads, never in inference
+    renderers = create_renderers(snapshot_dir, snapshot_interval, preview_port)
+    metrics_services = start_metrics(metrics_port, metrics_log_interval)
+    ingestor = MJPEGIngestor(decode_workers).start() if async_ingest else None
 
-    # Create stream processors
-    processors = []
-    for config in stream_configs:
-        if not is_valid_url(config['url']):
-            logger.error(f"Invalid URL format for stream {config['name']}")
-            continue
-            
-        processor = StreamProcessor(
-            config['url'],
-            config['name'],
-            recognizer,
-            face_cascade,
-            names
-        )
-        processors.append(processor)
-
-    # Start all processors
-    for processor in processors:
-        processor.start()
+    # Stream processors are started, stopped and retuned by the fleet
+    fleet = FleetManager(recognizer, detectors, names, config_path,
+                         pool=pool, headless=headless, renderers=renderers,
+                         on_result=on_result, ingestor=ingestor)
+    if pool is not None:
+        pool.start()
+    if coordinator is not None:
+        # Imported here because cluster builds on this module
+        from cluster import ClusterNode
+        cluster_node = ClusterNode(coordinator, fleet, node_name,
+                                   node_capacity or (pool.num_workers if pool is not None else None))
+        cluster_node.start()
+    else:
+        fleet.start()
+        if config_path is None:
+            fleet.apply(stream_configs)
+    governor = None
+    if latency_target is not None:
+        governor = FrameRateGovernor(lambda: list(fleet.processors.values()),
+                                     pool.num_workers if pool is not None else None,
+                                     latency_target).start()
 
+    deadline = time.time() + duration if duration is not None else None
     try:
         # Keep main thread alive
-        while True:
+        while deadline is None or time.time() < deadline:
+            if headless:
+                time.sleep(0.5)
+                continue
+            # Pool workers only store their output; display it from here
+            if pool is not None:
+                for processor in list(fleet.processors.values()):
+                    frame = processor.latest_frame
+                    if frame is not None:
+                        processor.latest_frame = None
+                        cv2.imshow(f'Stream: {processor.stream_name}', frame)
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
             time.sleep(0.1)  # Reduce CPU usage
@@ -197,28 +571,76 @@ def process_multiple_streams(stream_configs):
     except KeyboardInterrupt:
         logger.info("Program terminated by user")
     finally:
-        # Stop all processors
-        for processor in processors:
-            processor.stop()
-        cv2.destroyAllWindows()
+        if governor is not None:
+            governor.stop()
+        if cluster_node is not None:
+            # Leave first so the coordinator reassigns the streams at once
+            cluster_node.stop()
+        fleet.stop()
+        if ingestor is not None:
+            ingestor.stop()
+        if pool is not None:
+            pool.stop()
+        for service in renderers + metrics_services:
+            service.stop()
+        events.stop()
+        logger.info(f"Event stats: {events.get_stats()}")
+        if not headless:
+            cv2.destroyAllWindows()
+
+    return fleet.get_stats()
 
 def main():
-    stream_configs = [
-        {
-            "url": "http://singapore:9081",
-            "name": "Camera 1"
-        },
-        {
-            "url": "http://singapore:9082",
-            "name": "Camera 2"
-        },
-        {
-            "url": "http://d09:9083",
-            "name": "Camera 3"
-        }
-    ]
-    
-    process_multiple_streams(stream_configs)
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Recognize faces in HTTP streams')
+    parser.add_argument('--headless', action='store_true',
+                        help='Do not draw or display frames')
+    parser.add_argument('--snapshot-dir', help='Write annotated JPEG snapshots here')
+    parser.add_argument('--snapshot-interval', type=float, default=5.0,
+                        help='Seconds between snapshots')
+    parser.add_argument('--preview-port', type=int,
+                        help='Serve an MJPEG preview on this local port')
+    parser.add_argument('--multiprocess', action='store_true',
+                        help='Capture and infer in separate processes')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Serve Prometheus metrics on this local port')
+    parser.add_argument('--config', default='cameras.json',
+                        help='Camera config file, reloaded when it changes')
+    parser.add_argument('--latency-target', type=float,
+                        help='Thin and downscale streams by priority to keep '
+                             'frame latency under this many seconds')
+    parser.add_argument('--async-ingest', action='store_true',
+                        help='Read HTTP MJPEG cameras on one asyncio event loop')
+    parser.add_argument('--decode-workers', type=int,
+                        help='JPEG decode threads of the asyncio ingestor')
+    parser.add_argument('--detector',
+                        help="Default detector backend: haar, lbp, yunet or a JSON config")
+    parser.add_argument('--coordinator',
+                        help='Run the streams a cluster coordinator assigns (see cluster.py)')
+    parser.add_argument('--node-name', help='Name of this node in the cluster')
+    parser.add_argument('--capacity', type=float,
+                        help='Seconds of processing per second this node offers '
+                             '(defaults to its inference workers)')
+    add_event_arguments(parser)
+    args = parser.parse_args()
+
+    # A cluster node runs the streams the coordinator assigns, not its own config
+    config_path = args.config if args.coordinator is None else None
+    process_multiple_streams(None, config_path=config_path, headless=args.headless,
+                             snapshot_dir=args.snapshot_dir,
+                             snapshot_interval=args.snapshot_interval,
+                             preview_port=args.preview_port,
+                             multiprocess=args.multiprocess,
+                             metrics_port=args.metrics_port,
+                             event_sinks=sinks_from_args(args),
+                             latency_target=args.latency_target,
+                             async_ingest=args.async_ingest,
+                             decode_workers=args.decode_workers,
+                             detector=args.detector,
+                             coordinator=args.coordinator,
+                             node_name=args.node_name,
+                             node_capacity=args.capacity)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,194 @@
+import cv2
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Stream health states
+CONNECTING = 'connecting'
+HEALTHY = 'healthy'
+BACKOFF = 'backoff'
+STOPPED = 'stopped'
+STATES = (CONNECTING, HEALTHY, BACKOFF, STOPPED)
+
+class Backoff:
+    """
+    Jittered exponential backoff. The n-th delay is drawn from
+    [(1 - jitter) * d, d] with d = min(maximum, initial * factor ** n), so
+    cameras that dropped together do not all reconnect at the same moment.
+    """
+
+    def __init__(self, initial=1.0, maximum=60.0, factor=2.0, jitter=0.5,
+                 rng=None):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempts = 0
+        self._rng = rng or random.Random()
+
+    def next_delay(self):
+        """Return the next delay in seconds and advance the attempt count"""
+        delay = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay * (1 - self.jitter * self._rng.random())
+
+    def reset(self):
+        self.attempts = 0
+
+def open_capture(url, open_timeout=10.0, read_timeout=10.0):
+    """
+    Open a cv2.VideoCapture whose open and read calls give up after the
+    given number of seconds instead of blocking on a dead host (honoured by
+    the FFmpeg backend used for HTTP and RTSP streams)
+    """
+    params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(open_timeout * 1000),
+              cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(read_timeout * 1000)]
+    return cv2.VideoCapture(url, cv2.CAP_ANY, params)
+
+class StreamHealth:
+    """Connection state of one stream, updated by its CaptureSupervisor"""
+
+    def __init__(self):
+        self.state = CONNECTING
+        self.changed_at = time.time()
+        self.failures = 0
+        self.reconnects = 0
+        self.last_error = None
+        self.last_frame_at = None
+        self.retry_at = None
+
+    @property
+    def is_live(self):
+        return self.state == HEALTHY
+
+    def to_dict(self):
+        return {
+            'state': self.state,
+            'since': self.changed_at,
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+            'last_frame_at': self.last_frame_at,
+            'retry_at': self.retry_at,
+        }
+
+class CaptureSupervisor:
+    """
+    Keeps one stream connected. Opens happen with timeouts on the
+    supervisor's own thread, failures are retried with jittered exponential
+    backoff and the supervisor never gives up, so a flapping camera comes
+    back by itself and never delays the other streams.
+
+    read_frame(cap) is called in a loop while connected and returns False
+    (or raises) when the stream failed. The capture is only ever used and
+    released on the supervisor thread.
+    """
+
+    def __init__(self, url, name, read_frame, open_timeout=10.0,
+                 read_timeout=10.0, backoff=None, metrics=None,
+                 on_state=None, configure=None, stop_event=None):
+        self.url = url
+        self.name = name
+        self.read_frame = read_frame
+        self.open_timeout = open_timeout
+        self.read_timeout = read_timeout
+        self.backoff = backoff or Backoff()
+        # Called with the new state on every change
+        self.on_state = on_state
+        # Called with every newly opened capture, e.g. to set properties
+        self.configure = configure
+        self.health = StreamHealth()
+        self._stop = stop_event or threading.Event()
+        self._live = threading.Event()
+        self._thread = None
+        if metrics is not None:
+            metrics.set_counter('reconnects', lambda: self.health.reconnects)
+            metrics.set_gauge('stream_up', lambda: int(self.health.is_live))
+
+    def start(self):
+        """Run the supervisor on a background thread"""
+        self._thread = threading.Thread(target=self.run,
+                                        name=f'capture-{self.name}')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True, timeout=None):
+        """Stop the supervisor and wait for it to release the capture"""
+        self._stop.set()
+        if wait and self._thread is not None:
+            # An open or read returns within its timeout
+            self._thread.join(timeout if timeout is not None
+                              else self.open_timeout + self.read_timeout)
+
+    @property
+    def stopping(self):
+        return self._stop.is_set()
+
+    def wait_live(self, timeout=None):
+        """Wait until the stream delivers frames; returns True if it does"""
+        return self._live.wait(timeout)
+
+    def run(self):
+        """Connect, read and reconnect until stopped"""
+        while not self._stop.is_set():
+            self._set_state(CONNECTING)
+            cap = open_capture(self.url, self.open_timeout, self.read_timeout)
+            try:
+                if not cap.isOpened():
+                    raise IOError("Failed to open stream")
+                if self.configure is not None:
+                    self.configure(cap)
+                while not self._stop.is_set():
+                    if not self.read_frame(cap):
+                        raise IOError("Failed to read frame")
+                    self._received()
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self._fail(e)
+            finally:
+                cap.release()
+        self._set_state(STOPPED)
+
+    def _received(self):
+        """Record a frame; the first one after a (re)connect makes the stream healthy"""
+        self.health.last_frame_at = time.time()
+        if self.health.state != HEALTHY:
+            self.health.failures = 0
+            self.health.retry_at = None
+            self.backoff.reset()
+            self._set_state(HEALTHY)
+
+    def _fail(self, error):
+        self._stop.wait(self._failed(error))
+
+    def _failed(self, error):
+        """Record a failure and return the backoff delay before the next attempt"""
+        self.health.failures += 1
+        if self.health.state == HEALTHY:
+            # A live stream dropped; retries of a dead one are only failures
+            self.health.reconnects += 1
+        self.health.last_error = str(error)
+        delay = self.backoff.next_delay()
+        self.health.retry_at = time.time() + delay
+        self._set_state(BACKOFF)
+        logger.error(f"Stream {self.name} error: {error}; retry "
+                     f"{self.health.failures} in {delay:.1f}s")
+        return delay
+
+    def _set_state(self, state):
+        if state == self.health.state:
+            return
+        self.health.state = state
+        self.health.changed_at = time.time()
+        if state == HEALTHY:
+            self._live.set()
+            logger.info(f"Stream {self.name} connected")
+        else:
+            self._live.clear()
+        if self.on_state is not None:
+            self.on_state(state)
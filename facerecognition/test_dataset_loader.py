@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+import os
+from dataset_loader import FaceCache
+
+def write_faces(dataset_dir, count, start=0):
+    os.makedirs(dataset_dir, exist_ok=True)
+    rng = np.random.default_rng(start)
+    for i in range(start, start + count):
+        face = rng.integers(0, 255, (120, 110)).astype(np.uint8)
+        cv2.imwrite(os.path.join(dataset_dir, f"person.1.{i}.jpg"), face)
+    return sorted(os.listdir(dataset_dir))
+
+def test_sync_empty_dataset(tmp_path):
+    cache = FaceCache(str(tmp_path / 'cache'), size=(100, 100))
+    faces, index = cache.sync([], str(tmp_path / 'dataset'))
+    assert faces.shape == (0, 100, 100)
+    assert faces.dtype == np.uint8
+    assert index == {}
+    assert list(cache.iter_faces([], str(tmp_path / 'dataset'))) == []
+
+def test_sync_appends_and_compacts(tmp_path):
+    dataset_dir = str(tmp_path / 'dataset')
+    cache = FaceCache(str(tmp_path / 'cache'), size=(100, 100))
+    cache.sync(write_faces(dataset_dir, 5), dataset_dir)
+    files = write_faces(dataset_dir, 3, start=5)
+    faces, index = cache.sync(files, dataset_dir)
+    assert faces.shape == (8, 100, 100)
+
+    os.remove(os.path.join(dataset_dir, files[0]))
+    files = files[1:]
+    faces, index = cache.sync(files, dataset_dir)
+    assert faces.shape == (7, 100, 100)
+    for image_file in files:
+        img = cv2.imread(os.path.join(dataset_dir, image_file), cv2.IMREAD_GRAYSCALE)
+        expected = cv2.resize(img, (100, 100), interpolation=cv2.INTER_AREA)
+        assert np.array_equal(faces[index[image_file]['row']], expected)
@@ -0,0 +1,186 @@
+import cv2
+import itertools
+
+class Track:
+    """A face followed across frames under a stable ID"""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.name = "unknown"
+        self.confidence = None
+        # True on the frames where the recognizer was actually run
+        self.identified = False
+        self.score = 1.0
+        self.misses = 0
+        self.template = None
+
+    @property
+    def is_known(self):
+        return self.confidence is not None and self.name != "unknown"
+
+    def to_dict(self):
+        """Plain snapshot of the track for consumers outside the tracker"""
+        return {
+            'track_id': self.track_id,
+            'box': tuple(int(v) for v in self.box),
+            'name': self.name,
+            'confidence': self.confidence,
+            'identified': self.identified,
+        }
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter)
+
+class FaceTracker:
+    """
+    Runs full detection only every `detect_interval` frames and follows
+    faces with template matching in between.
+
+    Detections are associated with existing tracks by IoU, so a track keeps
+    its ID and its recognized identity; the recognizer only runs for new
+    tracks and for tracks that are still unknown. Detection is forced on the
+    next frame whenever a template match falls below `min_track_score`.
+    A track that neither a detection nor its template confirms is dropped
+    after `max_misses` frames, also while motion gating skips detection.
+    """
+
+    def __init__(self, detect_interval=5, iou_threshold=0.3,
+                 min_track_score=0.6, max_misses=2, search_margin=0.5):
+        self.detect_interval = max(1, detect_interval)
+        self.iou_threshold = iou_threshold
+        self.min_track_score = min_track_score
+        self.max_misses = max_misses
+        self.search_margin = search_margin
+        self.tracks = []
+        self.frames_since_detection = 0
+        self.force_detection = True
+        self._ids = itertools.count(1)
+
+    def update(self, gray, detect, recognize=None):
+        """
+        Advance all tracks by one frame
+        Args:
+            gray: Grayscale frame
+            detect: Callable taking gray and returning (x, y, w, h) boxes,
+                or None to skip detection on this frame (e.g. no motion)
+            recognize: Optional callable taking gray and a list of boxes and
+                returning one (name, confidence) tuple per box
+        Returns:
+            List of active Track objects
+        """
+        for track in self.tracks:
+            track.identified = False
+
+        self.frames_since_detection += 1
+        if (self.force_detection or not self.tracks
+                or self.frames_since_detection >= self.detect_interval):
+            self._detect(gray, detect, recognize)
+        else:
+            self._propagate(gray)
+
+        return list(self.tracks)
+
+    def _detect(self, gray, detect, recognize):
+        boxes = detect(gray)
+        if boxes is None:
+            # Nothing can confirm the tracks on this frame (e.g. a static
+            # scene), so lost tracks count misses here and still expire
+            self._propagate(gray, expire=True)
+            return
+
+        self.frames_since_detection = 0
+        self.force_detection = False
+        boxes = [tuple(int(v) for v in box) for box in boxes]
+
+        # Greedy IoU association, best overlaps first
+        pairs = sorted(
+            ((box_iou(track.box, box), ti, bi)
+             for ti, track in enumerate(self.tracks)
+             for bi, box in enumerate(boxes)),
+            reverse=True
+        )
+        matched_tracks = set()
+        matched_boxes = set()
+        for iou, ti, bi in pairs:
+            if iou < self.iou_threshold:
+                break
+            if ti in matched_tracks or bi in matched_boxes:
+                continue
+            matched_tracks.add(ti)
+            matched_boxes.add(bi)
+            track = self.tracks[ti]
+            track.box = boxes[bi]
+            track.score = 1.0
+            track.misses = 0
+
+        survivors = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+                self._match_template(gray, track)
+            survivors.append(track)
+
+        for bi, box in enumerate(boxes):
+            if bi not in matched_boxes:
+                survivors.append(Track(next(self._ids), box))
+        self.tracks = survivors
+
+        # Recognize all new or still unknown faces of this frame in one call
+        pending = [track for track in self.tracks
+                   if track.misses == 0 and not track.is_known]
+        if recognize is not None and pending:
+            results = recognize(gray, [track.box for track in pending])
+            for track, (name, confidence) in zip(pending, results):
+                track.name, track.confidence = name, confidence
+                track.identified = True
+
+        for track in self.tracks:
+            if track.misses == 0:
+                x, y, w, h = track.box
+                track.template = gray[y:y+h, x:x+w].copy()
+
+    def _propagate(self, gray, expire=False):
+        survivors = []
+        for track in self.tracks:
+            self._match_template(gray, track)
+            if track.score < self.min_track_score:
+                self.force_detection = True
+                if expire:
+                    track.misses += 1
+                    if track.misses > self.max_misses:
+                        continue
+            survivors.append(track)
+        self.tracks = survivors
+
+    def _match_template(self, gray, track):
+        if track.template is None:
+            track.score = 0.0
+            return
+
+        x, y, w, h = track.box
+        th, tw = track.template.shape[:2]
+        mx = int(w * self.search_margin)
+        my = int(h * self.search_margin)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1 = min(gray.shape[1], x + w + mx)
+        y1 = min(gray.shape[0], y + h + my)
+        window = gray[y0:y1, x0:x1]
+        if window.shape[0] < th or window.shape[1] < tw:
+            track.score = 0.0
+            return
+
+        result = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (lx, ly) = cv2.minMaxLoc(result)
+        track.score = score
+        track.box = (x0 + lx, y0 + ly, tw, th)
@@ -1,7 +1,15 @@
 import cv2
+import json
 import numpy as np
 import os
 import logging
+import shutil
+from batch_recognizer import FACE_SIZE, BatchRecognizer
+from dataset_loader import FaceCache
+from detection import load_detector
+from enrollment import EnrollmentSession, enroll
+from gallery import GALLERY_PATH, Gallery, load_gallery, load_name_mappings
+from lbph_model import BINARY_MODEL_DIR, MODEL_PATH, LBPHModel, current_version
 
 logging.basicConfig(
     level=logging.INFO,
@@ -9,8 +17,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def collect_face_data(name):
-    """Collect face data for training."""
+# Records which dataset images are already part of the trained model
+MANIFEST_PATH = 'trainer/manifest.json'
+
+def collect_face_data(name, source=0, samples=30, detector=None):
+    """
+    Collect face data for training.
+    Args:
+        source: Camera index, video file or folder of images
+        samples: Number of face samples to keep. Only sharp, frontal and
+            sufficiently different faces are kept (see enrollment.py).
+        detector: Detector backend config (see detection.detector_config)
+    """
     
     # Create directories if they don't exist
     if not os.path.exists("dataset"):
@@ -18,39 +36,18 @@ def collect_face_data(name):
     if not os.path.exists("trainer"):
         os.makedirs("trainer")
 
-    face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
-    cap = cv2.VideoCapture(0)
+    face_detector = load_detector(detector)
     
-    # Get the next available face ID
-    face_id = len(os.listdir("dataset")) + 1
+    # Get the next available face ID; IDs of removed people are not reused
+    # while their images exist, so use the highest ID seen so far
+    face_id = max((entry['id'] for entry in scan_dataset().values()), default=0) + 1
     
-    count = 0
     logger.info(f"Collecting face data for {name}. Press 'q' to quit.")
-
-    while count < 30:  # Collect 30 face samples
-        ret, frame = cap.read()
-        # Convert image to grayscale because opencv requires grayscale image
-        # for face detection algorithms typically work better with greyscale 
-        # since there is only 1 channel to process
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-
-        for (x, y, w, h) in faces:
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
-            count += 1
-            
-            # Save the face image
-            cv2.imwrite(f"dataset/{name}.{face_id}.{count}.jpg",
-                       gray[y:y+h, x:x+w])
-            
-        cv2.imshow('Collecting Faces', frame)
-        cv2.waitKey(100)
-
-        if count >= 30:
-            break
-
-    cap.release()
-    cv2.destroyAllWindows()
+    session = EnrollmentSession(name, face_id, face_detector, samples)
+    stats = enroll(session, source)
+    if not stats['accepted']:
+        logger.warning(f"No usable face samples found for {name}")
+        return None
     
     # Save the name mapping
     with open("faces.txt", "a") as f:
@@ -59,35 +56,185 @@ def collect_face_data(name):
     logger.info(f"Face data collection completed for {name}")
     return face_id
 
-def train_model():
-    """Train the face recognition model."""
-    
-    recognizer = cv2.face.LBPHFaceRecognizer_create()
-    detector = cv2.CascadeClassifier("haarcascade_frontalface_default.xml")
+def scan_dataset(dataset_dir="dataset"):
+    """Return {file name: {'id': face ID, 'mtime': mtime}} for the dataset"""
+    entries = {}
+    if not os.path.exists(dataset_dir):
+        return entries
+    for image_file in os.listdir(dataset_dir):
+        if image_file.endswith(".jpg"):
+            entries[image_file] = {
+                'id': int(image_file.split('.')[1]),
+                'mtime': os.path.getmtime(os.path.join(dataset_dir, image_file)),
+            }
+    return entries
+
+def load_manifest(path=MANIFEST_PATH):
+    """Load the manifest of trained dataset images"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Save the manifest of trained dataset images"""
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+def load_model():
+    """
+    Read the trained LBPH model into memory for updating, or None. Models
+    trained before the binary format are read from MODEL_PATH.
+    """
+    if current_version(BINARY_MODEL_DIR) is not None:
+        return LBPHModel.load(BINARY_MODEL_DIR, mmap=False)
+    if os.path.exists(MODEL_PATH) and os.path.getsize(MODEL_PATH) > 0:
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        recognizer.read(MODEL_PATH)
+        return LBPHModel.from_recognizer(recognizer)
+    return None
+
+def save_model(model, write_yaml=False):
+    """Publish the binary model, and the YAML model when asked for"""
+    if write_yaml:
+        # Written first so the binary model is the newer of the two
+        model.write_yaml(MODEL_PATH)
+    model.save(BINARY_MODEL_DIR)
+
+def train_model(incremental=True, write_yaml=False):
+    """
+    Train the face recognition model.
+    Args:
+        incremental: Only read the dataset images that are not in the model
+            yet and append their histograms to it. People whose images were
+            removed or replaced are dropped from the model and re-added from
+            their current images. Falls back to a full retrain when there
+            is no model or manifest yet.
+        write_yaml: Also write the model in OpenCV's YAML format to
+            MODEL_PATH. Only the binary model is written otherwise.
+
+    Images are decoded in a thread pool, resized to FACE_SIZE and kept in a
+    memory-mapped cache (trainer/cache), so even a full retrain only
+    decodes images that are new or modified since the last run.
+    """
+    dataset = scan_dataset()
+    manifest = load_manifest() if incremental else {}
+    model = load_model() if manifest else None
+    cache = FaceCache(size=FACE_SIZE)
+
+    if model is None or not len(model.labels):
+        train_full(dataset, cache, write_yaml)
+        return
+
+    # People with missing or modified images are retrained from scratch
+    changed_ids = {
+        entry['id'] for image_file, entry in manifest.items()
+        if image_file not in dataset or dataset[image_file]['mtime'] != entry['mtime']
+    }
+    new_files = sorted(
+        image_file for image_file, entry in dataset.items()
+        if image_file not in manifest or entry['id'] in changed_ids
+    )
+
+    if not new_files and not changed_ids:
+        logger.info("Model is up to date. Nothing to train.")
+        return
+
+    logger.info(f"Updating model with {len(new_files)} images. Please wait...")
+    rebuild_gallery = not os.path.exists(GALLERY_PATH)
+    gallery = Gallery() if rebuild_gallery else load_gallery()
+
+    if changed_ids:
+        logger.info(f"Removing face IDs {sorted(changed_ids)} from the model")
+        model = model.without_labels(changed_ids)
+        for face_id in changed_ids:
+            gallery.remove(face_id)
+
+    model, added = add_faces(model, gallery, new_files, sorted(dataset), cache)
+
+    if not len(model.labels):
+        # Nothing left to model; start over on the next run
+        for path in (MODEL_PATH, MANIFEST_PATH, GALLERY_PATH):
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(BINARY_MODEL_DIR, ignore_errors=True)
+        logger.info("No faces left in the model.")
+        return
+
+    save_model(model, write_yaml)
+    if rebuild_gallery:
+        load_gallery(rebuild=True, cache=cache)
+    else:
+        gallery.save(GALLERY_PATH)
+    save_manifest(dataset)
+    logger.info(f"Training completed. {added} images added, "
+                f"{len(np.unique(model.labels))} faces trained.")
+
+def train_full(dataset, cache, write_yaml=False):
+    """Train the face recognition model from every dataset image"""
+    model = LBPHModel(np.empty((0, 0), np.float32), np.empty(0, np.int32))
+    names = load_name_mappings() if os.path.exists("faces.txt") else {}
+    gallery = Gallery(names=names)
     
     logger.info("Training faces. Please wait...")
     
-    faces = []
-    ids = []
-    
     # Get all images from dataset
-    for image_file in os.listdir("dataset"):
-        if image_file.endswith(".jpg"):
-            img_path = os.path.join("dataset", image_file)
-            img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-            face_id = int(image_file.split('.')[1])
-            faces.append(img)
-            ids.append(face_id)
+    model, _ = add_faces(model, gallery, sorted(dataset), sorted(dataset), cache)
+    if not len(model.labels):
+        logger.info("No faces in the dataset. Nothing to train.")
+        return
     
-    recognizer.train(faces, np.array(ids))
-    recognizer.write('trainer/trainer.yml')
-    logger.info(f"Training completed. {len(np.unique(ids))} faces trained.")
+    save_model(model, write_yaml)
+    gallery.save(GALLERY_PATH)
+    save_manifest(dataset)
+    logger.info(f"Training completed. {len(gallery.identities)} faces trained.")
+
+def add_faces(model, gallery, image_files, all_files, cache):
+    """
+    Stream dataset images into the gallery chunk by chunk, so the whole
+    dataset is never held in memory at once, and append their LBPH
+    histograms to the model in one step
+    Returns:
+        The updated model and the number of images added
+    """
+    enroller = BatchRecognizer(gallery)
+    histograms, labels = [], []
+    for faces, ids in cache.iter_faces(image_files, all_files=all_files):
+        faces = list(faces)
+        histograms.append(model.histograms_of(faces))
+        labels.append(np.asarray(ids, np.int32))
+        enroller.enroll(faces, ids)
+    if not labels:
+        return model, 0
+    model = model.with_samples(np.vstack(histograms), np.concatenate(labels))
+    return model, sum(len(chunk) for chunk in labels)
+
+def remove_identity(face_id):
+    """Delete one person's images and name mapping and drop them from the model"""
+    for image_file, entry in scan_dataset().items():
+        if entry['id'] == face_id:
+            os.remove(os.path.join("dataset", image_file))
+
+    if os.path.exists("faces.txt"):
+        with open("faces.txt", "r") as f:
+            lines = [line for line in f if line.strip() and int(line.split(":")[0]) != face_id]
+        with open("faces.txt", "w") as f:
+            f.writelines(lines)
+
+    train_model()
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Collect face data and train the model')
+    parser.add_argument('--yaml', action='store_true',
+                        help=f'Also write the model in OpenCV YAML format to {MODEL_PATH}')
+    args = parser.parse_args()
+
     while True:
         name = input("Enter name of person (or 'q' to finish collecting data): ")
         if name.lower() == 'q':
             break
         collect_face_data(name)
     
-    train_model()
+    train_model(write_yaml=args.yaml)
@@ -0,0 +1,33 @@
+import cv2
+import os
+
+def list_clips(paths):
+    """Expand directories into the video files they contain"""
+    clips = []
+    for path in paths:
+        if os.path.isdir(path):
+            clips.extend(sorted(
+                os.path.join(path, f) for f in os.listdir(path)
+                if f.lower().endswith(('.mp4', '.avi', '.mkv', '.mov'))
+            ))
+        else:
+            clips.append(path)
+    return clips
+
+def read_gray_frames(path, stride, max_frames):
+    """Yield every `stride`-th frame of a video file as grayscale"""
+    cap = cv2.VideoCapture(path)
+    index = 0
+    read = 0
+    while read < max_frames:
+        ret = cap.grab()
+        if not ret:
+            break
+        if index % stride == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            read += 1
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        index += 1
+    cap.release()
@@ -0,0 +1,105 @@
+import logging
+import os
+import threading
+from collections import deque
+from detection import Detectors
+from lbph_model import MODEL_PATH, load_recognizer
+
+logger = logging.getLogger(__name__)
+
+def load_models(model_path=MODEL_PATH, detector=None):
+    """
+    Load private face detectors and an LBPH recognizer for one worker. The
+    binary LBPH model is memory-mapped, so workers share its pages.
+    Args:
+        detector: Default detector config (see detection.detector_config)
+    """
+    return Detectors(detector), load_recognizer(model_path)
+
+class InferenceWorkerPool:
+    """
+    Bounded pool of inference threads shared by many StreamProcessors.
+
+    Streams with pending frames are kept in a ready queue and served
+    round-robin, one frame per turn, so a busy camera cannot starve the
+    others. A stream is never handed to two workers at once, which keeps
+    its frames (and any per-stream state) in order. Each worker loads its
+    own detectors and recognizer so OpenCV objects are never shared between
+    threads.
+    """
+
+    def __init__(self, num_workers=None, model_loader=load_models):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.model_loader = model_loader
+        self.running = False
+        self._ready = deque()
+        self._scheduled = set()
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def start(self):
+        """Start the worker threads"""
+        self.running = True
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._run_worker,
+                                      name=f'inference-{i}')
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Started inference pool with {self.num_workers} workers")
+
+    def stop(self):
+        """Stop the worker threads and wait for them to finish"""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._workers = []
+
+    def notify(self, processor):
+        """Tell the pool that a processor has frames waiting"""
+        with self._cond:
+            # Disconnected streams get no worker time until they recover
+            if processor in self._scheduled or not processor.is_live:
+                return
+            self._scheduled.add(processor)
+            self._ready.append(processor)
+            self._cond.notify()
+
+    def _next_processor(self):
+        with self._cond:
+            while self.running and not self._ready:
+                self._cond.wait()
+            if not self.running:
+                return None
+            return self._ready.popleft()
+
+    def _reschedule(self, processor):
+        # The pending check must happen under the lock so a frame queued
+        # between the check and the discard is never stranded.
+        with self._cond:
+            if (processor.running and processor.is_live
+                    and processor.has_pending_frames()):
+                self._ready.append(processor)
+                self._cond.notify()
+            else:
+                self._scheduled.discard(processor)
+
+    def _run_worker(self):
+        try:
+            detectors, recognizer = self.model_loader()
+        except Exception as e:
+            logger.error(f"Inference worker failed to load models: {str(e)}")
+            return
+
+        while True:
+            processor = self._next_processor()
+            if processor is None:
+                break
+            try:
+                processor.process_next_frame(detectors, recognizer)
+            except Exception as e:
+                logger.error(f"Processing error in {processor.stream_name}: {str(e)}")
+            finally:
+                self._reschedule(processor)